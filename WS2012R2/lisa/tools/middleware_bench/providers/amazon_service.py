@@ -28,7 +28,7 @@ from utils import constants
 from boto import ec2
 from boto import vpc
 from boto.ec2.blockdevicemapping import BlockDeviceMapping, BlockDeviceType
-from utils.cmdshell import SSHClient
+from utils.cmdshell import SSHClient, wait_for_ssh
 from dateutil import parser
 
 logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
@@ -201,14 +201,15 @@ class AWSConnector:
                                                   security_group_ids=[self.security_group.id],
                                                   subnet_id=self.subnet.id, user_data=user_data)
         instance = reservation.instances[0]
+        # tracked right away, for teardown to cover VMs failing to start
+        self.instances.append(instance)
         time.sleep(5)
         self.wait_for_state(instance, 'state', 'running')
 
         elastic_ip = self.vpc_conn.allocate_address(domain='vpc')
+        self.elastic_ips.append(elastic_ip)
         self.vpc_conn.associate_address(instance_id=instance.id,
                                         allocation_id=elastic_ip.allocation_id)
-        self.elastic_ips.append(elastic_ip)
-        self.instances.append(instance)
 
         # artificial wait for ip
         time.sleep(5)
@@ -274,6 +275,29 @@ class AWSConnector:
         self.ebs_vols.append(ebs_vol)
         return ebs_vol
 
+    def attach_disks(self, vm_instance, disk_size=10, volume_type=None, iops=None,
+                     devices=None):
+        """
+        Create and attach several EBS volumes to a given instance, e.g. for a RAID. The
+        volumes are created together and attached once all are available.
+        :param vm_instance: Instance object to attach the volumes to
+        :param disk_size: size in GB of each volume
+        :param volume_type: volume type: gp2 - SSD, st1 - HDD, sc1 - cold HDD;
+                            defaults to magnetic disk
+        :param iops: IOPS to associate with each volume.
+        :param devices: device mount locations, one per volume
+        :return: EBSVolume objects
+        """
+        conn = self.conn or self.vpc_conn
+        ebs_vols = [conn.create_volume(disk_size, self.zone, volume_type=volume_type, iops=iops)
+                    for _ in devices]
+        self.ebs_vols.extend(ebs_vols)
+        for ebs_vol in ebs_vols:
+            self.wait_for_state(ebs_vol, 'status', 'available')
+        for ebs_vol, device in zip(ebs_vols, devices):
+            conn.attach_volume(ebs_vol.id, vm_instance.id, device=device)
+        return ebs_vols
+
     def enable_sr_iov(self, instance, ssh_client):
         """
         Enable SR-IOV for a given instance.
@@ -285,10 +309,8 @@ class AWSConnector:
         log.info('Enabling SR-IOV on {}'.format(instance.id))
         if ssh_client:
             util_path = os.path.dirname(os.path.realpath(__file__))
-            ssh_client.put_file(os.path.join(util_path, 'tests', 'enable_sr_iov.sh'),
-                                '/tmp/enable_sr_iov.sh')
-            ssh_client.run('chmod +x /tmp/enable_sr_iov.sh')
-            ssh_client.run("sed -i 's/\r//' /tmp/enable_sr_iov.sh")
+            ssh_client.stage([(os.path.join(util_path, 'tests', 'enable_sr_iov.sh'),
+                               '/tmp/enable_sr_iov.sh', 0755)])
             ssh_client.run('/tmp/enable_sr_iov.sh {}'.format(self.instancetype))
             conn.stop_instances(instance_ids=[instance.id])
             self.wait_for_state(instance, 'state', 'stopped')
@@ -342,20 +364,11 @@ class AWSConnector:
         :param user: SSH user to use with the created key
         :return: SSHClient or None on error
         """
-        ping_arg = '-n'
-        if os.name == 'posix':
-            ping_arg = '-c'
         if not instance.public_dns_name:
             log.error("Spawned instance was not allocated a public IP. Please try again.")
             raise Exception("Spawned instance was not allocated a public IP. Please try again.")
-        ping_cmd = 'ping {} 1 {}'.format(ping_arg, instance.ip_address)
         try:
-            timeout = 0
-            while os.system(ping_cmd) != 0 and timeout < 60:
-                time.sleep(10)
-                timeout += 10
-            # artificial wait for ssh service up status
-            time.sleep(60)
+            wait_for_ssh(instance.ip_address)
             client = SSHClient(server=instance.ip_address, host_key_file=self.host_key_file,
                                user=user or self.user,
                                ssh_key_file=os.path.join(self.localpath, self.key_name + '.pem'))
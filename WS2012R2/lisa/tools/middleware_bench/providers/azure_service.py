@@ -28,6 +28,7 @@ import random
 import string
 
 from utils import constants
+from utils.cmdshell import wait_for_ssh
 from azure.common.credentials import ServicePrincipalCredentials
 from azure.mgmt.resource import ResourceManagementClient
 from azure.mgmt.storage import StorageManagementClient
@@ -182,7 +183,8 @@ class AzureConnector:
                 'network_profile': {'network_interfaces': [{'id': nic.id}]}
             }
         else:
-            vm_name = self.imageid['offer'].lower() + str(time.time()).replace('.', '')
+            # time based names are not unique across concurrent create_vm calls
+            vm_name = self.imageid['offer'].lower() + uuid.uuid4().hex[:12]
             nic = self.create_nic(vm_name)
             with open(os.path.join(self.localpath, self.key_name + '.pub'), 'r') as f:
                 key_data = f.read()
@@ -205,7 +207,7 @@ class AzureConnector:
                         'caching': 'None',
                         'create_option': 'fromImage',
                         'vhd': {'uri': 'https://{}.blob.core.windows.net/vhds/{}.vhd'.format(
-                                self.storage_account, self.vmnet_name + str(time.time()))}}},
+                                self.storage_account, self.vmnet_name + vm_name)}}},
                 'network_profile': {'network_interfaces': [{'id': nic.id}]}
             }
         vm_creation = self.compute_client.virtual_machines.create_or_update(
@@ -287,7 +289,7 @@ class AzureConnector:
                      'priority': 1001})
             log.info('Adding custom security group to NIC')
             nic_parameters['network_security_group'] = create_nsg.result()
-        nic_name = self.nic_name + str(time.time())
+        nic_name = self.nic_name + vm_name
         nic_op = self.network_client.network_interfaces.create_or_update(
                 self.group_name, nic_name, nic_parameters)
         log.info('Created NIC: {}'.format(nic_name))
@@ -322,6 +324,37 @@ class AzureConnector:
             log.info(de)
         return disk_name
 
+    def attach_disks(self, vm_instance, disk_size=0, devices=None):
+        """
+        Creates and attaches several disks to VM with a single VM update, e.g. for a RAID.
+        :param vm_instance: VirtualMachine obj to attach the disks to
+        :param disk_size: size in GB of each disk
+        :param devices: disk lun devices, one per disk
+        :return disk_names: given disk names
+        """
+        disk_names = []
+        for device in devices:
+            disk_name = '{}_disk_{}_{}'.format(vm_instance.name, device, time.time())
+            vm_instance.storage_profile.data_disks.append(
+                    {'name': disk_name,
+                     'disk_size_gb': disk_size,
+                     'caching': 'None',
+                     'lun': device,
+                     'vhd': {'uri': "http://{}.blob.core.windows.net/vhds/{}.vhd".format(
+                             self.storage_account, disk_name)},
+                     'create_option': 'Empty'})
+            disk_names.append(disk_name)
+        vm_update = self.compute_client.virtual_machines.create_or_update(self.group_name,
+                                                                          vm_instance.name,
+                                                                          vm_instance)
+        vm_update.wait()
+        try:
+            vm_update.result()
+            log.info('Created disks: {}'.format(', '.join(disk_names)))
+        except Exception as de:
+            log.info(de)
+        return disk_names
+
     def restart_vm(self, vm_name):
         """
         Restart instances VM.
@@ -331,7 +364,7 @@ class AzureConnector:
         log.info('Restarting VM: {}'.format(vm_name))
         vm_restart = self.compute_client.virtual_machines.restart(self.group_name, vm_name)
         vm_restart.wait()
-        time.sleep(120)
+        wait_for_ssh(vm_name + self.dns_suffix)
 
         return vm_instance
 
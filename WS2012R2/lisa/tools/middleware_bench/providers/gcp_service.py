@@ -22,12 +22,15 @@ permissions and limitations under the License.
 import os
 import re
 import time
+import uuid
 import logging
+import httplib2
+import threading
 
 from googleapiclient import discovery
 from oauth2client.client import GoogleCredentials
 from oauth2client import GOOGLE_TOKEN_URI
-from utils.cmdshell import SSHClient
+from utils.cmdshell import SSHClient, wait_for_ssh
 
 logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
                     datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
@@ -81,6 +84,18 @@ class GCPConnector:
         self.subnet_name = 'middleware-bench-subnet' + str(time.time()).replace('.', '')
 
         self.vms = []
+        self.local = threading.local()
+
+    @property
+    def http(self):
+        """
+        httplib2 connections are not thread safe, the VMs being created concurrently, each
+        thread uses its own authorized connection.
+        :return: httplib2.Http
+        """
+        if not hasattr(self.local, 'http'):
+            self.local.http = self.credentials.authorize(httplib2.Http())
+        return self.local.http
 
     def connect(self):
         """
@@ -132,9 +147,10 @@ class GCPConnector:
         Create an GCE VM instance.
         :return: VirtualMachine object
         """
-        vm_name = self.imageid.lower() + '-' + str(time.time()).replace('.', '')
+        # time based names are not unique across concurrent create_vm calls
+        vm_name = self.imageid.lower() + '-' + uuid.uuid4().hex[:12]
         image = self.compute.images().getFromFamily(project='ubuntu-os-cloud',
-                                                    family=self.imageid).execute()
+                                                    family=self.imageid).execute(http=self.http)
         machine_type = 'zones/{}/machineTypes/{}'.format(self.zone, self.instancetype)
         with open(os.path.join(self.localpath, self.key_name + '.pub'), 'r') as f:
             key_data = f.read()
@@ -159,17 +175,19 @@ class GCPConnector:
                           'value': '{user}:{key} {user}'.format(user=self.user, key=key_data)},
                      ]}}
         create_vm = self.compute.instances().insert(project=self.projectid, zone=self.zone,
-                                                    body=vm_config).execute()
+                                                    body=vm_config).execute(http=self.http)
+        # tracked right away, for teardown to cover VMs failing to start
+        self.vms.append(vm_config)
         self.wait_for_operation(create_vm['name'], zone=self.zone)
 
         start_vm = self.compute.instances().start(instance=vm_name, project=self.projectid,
-                                                  zone=self.zone).execute()
+                                                  zone=self.zone).execute(http=self.http)
         self.wait_for_operation(start_vm['name'], zone=self.zone)
 
         vm_details = self.compute.instances().get(instance=vm_name, project=self.projectid,
-                                                  zone=self.zone).execute()
+                                                  zone=self.zone).execute(http=self.http)
         log.info('Created VM: {}'.format(vm_name))
-        self.vms.append(vm_details)
+        self.vms[self.vms.index(vm_config)] = vm_details
 
         return vm_details
 
@@ -181,7 +199,7 @@ class GCPConnector:
         :param device: provide disk name
         :return disk_name: given disk name
         """
-        disk_name = 'disk-' + str(time.time()).replace('.', '')
+        disk_name = 'disk-' + uuid.uuid4().hex[:12]
         disk_config = {'name': disk_name,
                        'sizeGb': disk_size,
                        'zone': 'projects/{}/zones/{}'.format(self.projectid, self.zone),
@@ -189,7 +207,7 @@ class GCPConnector:
                                                                               self.zone)}
 
         create_disk = self.compute.disks().insert(project=self.projectid, zone=self.zone,
-                                                  body=disk_config).execute()
+                                                  body=disk_config).execute(http=self.http)
         self.wait_for_operation(create_disk['name'], zone=self.zone)
 
         log.info('Attaching disk {} to VM {}'.format(disk_name, vm_instance['name']))
@@ -198,13 +216,52 @@ class GCPConnector:
                                                                          self.zone, disk_name),
             'autoDelete': True
         }
-        attach_disk = self.compute.instances().attachDisk(instance=vm_instance['name'],
-                                                          project=self.projectid, zone=self.zone,
-                                                          body=source_config).execute()
+        attach_disk = self.compute.instances().attachDisk(
+                instance=vm_instance['name'], project=self.projectid, zone=self.zone,
+                body=source_config).execute(http=self.http)
         self.wait_for_operation(attach_disk['name'], zone=self.zone)
 
         return disk_name
 
+    def attach_disks(self, vm_instance, disk_size=0, devices=None):
+        """
+        Creates and attaches several disks to VM, e.g. for a RAID. The disks are created
+        together and attached once all are ready.
+        :param vm_instance: VM instance to attach the disks to
+        :param disk_size: size in GB of each disk
+        :param devices: one entry per disk, unused as GCE names the devices by attach order
+        :return disk_names: given disk names
+        """
+        disk_names = ['disk-' + uuid.uuid4().hex[:12] for _ in devices]
+        operations = []
+        for disk_name in disk_names:
+            disk_config = {'name': disk_name,
+                           'sizeGb': disk_size,
+                           'zone': 'projects/{}/zones/{}'.format(self.projectid, self.zone),
+                           'type': 'projects/{}/zones/{}/diskTypes/pd-ssd'.format(
+                                   self.projectid, self.zone)}
+            operations.append(self.compute.disks().insert(
+                    project=self.projectid, zone=self.zone,
+                    body=disk_config).execute(http=self.http))
+        for operation in operations:
+            self.wait_for_operation(operation['name'], zone=self.zone)
+
+        log.info('Attaching disks {} to VM {}'.format(', '.join(disk_names), vm_instance['name']))
+        # the disks are identical, the order they get their devices in does not matter
+        operations = []
+        for disk_name in disk_names:
+            source_config = {
+                'source': '/compute/v1/projects/{}/zones/{}/disks/{}'.format(
+                        self.projectid, self.zone, disk_name),
+                'autoDelete': True
+            }
+            operations.append(self.compute.instances().attachDisk(
+                    instance=vm_instance['name'], project=self.projectid, zone=self.zone,
+                    body=source_config).execute(http=self.http))
+        for operation in operations:
+            self.wait_for_operation(operation['name'], zone=self.zone)
+        return disk_names
+
     def wait_for_operation(self, operation, zone=None, region=None):
         """
        Check when an GCE operation is finished.
@@ -216,14 +273,16 @@ class GCPConnector:
         while True:
             time.sleep(10)
             if zone:
-                result = self.compute.zoneOperations().get(project=self.projectid, zone=zone,
-                                                           operation=operation).execute()
+                result = self.compute.zoneOperations().get(
+                        project=self.projectid, zone=zone,
+                        operation=operation).execute(http=self.http)
             elif region:
-                result = self.compute.regionOperations().get(project=self.projectid, region=region,
-                                                             operation=operation).execute()
+                result = self.compute.regionOperations().get(
+                        project=self.projectid, region=region,
+                        operation=operation).execute(http=self.http)
             else:
-                result = self.compute.globalOperations().get(project=self.projectid,
-                                                             operation=operation).execute()
+                result = self.compute.globalOperations().get(
+                        project=self.projectid, operation=operation).execute(http=self.http)
 
             if result.get('status', None) == 'DONE':
                 if 'error' in result:
@@ -237,21 +296,12 @@ class GCPConnector:
         :param instance: instance to wait for sshd start
         :return: SSHClient or None on error
         """
-        ping_arg = '-n'
-        if os.name == 'posix':
-            ping_arg = '-c'
         nat_ip = instance['networkInterfaces'][0]['accessConfigs'][0].get('natIP', None)
         if not nat_ip:
             log.error("Spawned instance was not allocated a NAT IP. Please try again.")
             raise Exception("Spawned instance was not allocated a public IP. Please try again.")
-        ping_cmd = 'ping {} 1 {}'.format(ping_arg, nat_ip)
         try:
-            timeout = 0
-            while os.system(ping_cmd) != 0 and timeout < 60:
-                time.sleep(10)
-                timeout += 10
-            # artificial wait for ssh service up status
-            time.sleep(60)
+            wait_for_ssh(nat_ip)
             client = SSHClient(server=nat_ip, host_key_file=self.host_key_file, user=self.user,
                                ssh_key_file=os.path.join(self.localpath, self.key_name + '.pem'))
         except Exception as e:
@@ -265,8 +315,9 @@ class GCPConnector:
         :param instance instance obj to restart
         :return SSHClient
         """
-        reset_vm = self.compute.instances().reset(instance=instance['name'],
-                                                  project=self.projectid, zone=self.zone).execute()
+        reset_vm = self.compute.instances().reset(
+                instance=instance['name'], project=self.projectid,
+                zone=self.zone).execute(http=self.http)
         self.wait_for_operation(reset_vm['name'], zone=self.zone)
 
         log.info('Rebooting VM: {}'.format(instance['name']))
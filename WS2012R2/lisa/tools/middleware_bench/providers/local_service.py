@@ -0,0 +1,155 @@
+"""
+Linux on Hyper-V and GCE Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+
+import os
+import time
+import socket
+import logging
+import threading
+
+from utils.cmdshell import SSHClient, wait_for_ssh
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+class LocalConnector:
+    """
+    Local connector using already running hosts, by default localhost, as VMs and loop files
+    as disks. Used to exercise and profile the test orchestration without a cloud account.
+    The hosts must accept SSH key authentication for user with <localpath>/test_ssh_key.pem.
+    Test scripts run on the hosts as they would on VMs, so use disposable hosts or containers.
+    """
+    # sparse loop files are capped, formatting them writes metadata on the local disk
+    MAX_DISK_SIZE = 10
+
+    def __init__(self, hosts=None, user=None, localpath=None):
+        """
+        Init local connector.
+        :param hosts: comma separated hostnames used as VMs, in round robin, e.g. 'localhost'
+        :param user: remote ssh user for the hosts
+        :param localpath: path where the ssh key is provided
+        """
+        self.hosts = [host.strip() for host in (hosts or 'localhost').split(',') if host.strip()]
+        self.user = user
+        self.localpath = localpath
+        self.host_key_file = os.path.join(self.localpath, 'known_hosts')
+        self.key_name = 'test_ssh_key'
+        self.disk_dir = '/var/tmp/middleware_bench_{}'.format(str(time.time()).replace('.', ''))
+        self.vms = []
+        self.disks = []
+        self.clients = {}
+        # VMs are created concurrently
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Check the ssh key is available.
+        """
+        key_file = os.path.join(self.localpath, self.key_name + '.pem')
+        if not os.path.isfile(key_file):
+            raise Exception('SSH key {} not found.'.format(key_file))
+
+    def create_vm(self):
+        """
+        Use the next host as a new VM.
+        :return: <dict> VM description
+        """
+        with self.lock:
+            host = self.hosts[len(self.vms) % len(self.hosts)]
+            vm = {'name': 'local{}'.format(len(self.vms) + 1), 'host': host}
+            self.vms.append(vm)
+        vm['ip'] = socket.gethostbyname(host)
+        log.info('Created local VM {} on {}'.format(vm['name'], host))
+        return vm
+
+    def _client(self, vm_instance):
+        if vm_instance['name'] not in self.clients:
+            self.clients[vm_instance['name']] = self.wait_for_ping(vm_instance)
+        return self.clients[vm_instance['name']]
+
+    def attach_disk(self, vm_instance, disk_size=0, device=None):
+        """
+        Attach a sparse loop file as a disk.
+        :param vm_instance: VM description
+        :param disk_size: disk size in GB, capped to MAX_DISK_SIZE
+        :param device: unused, loop devices are allocated by losetup
+        :return: loop device path e.g. /dev/loop3
+        """
+        client = self._client(vm_instance)
+        disk_file = '{}/{}_disk{}.img'.format(self.disk_dir, vm_instance['name'],
+                                              len(self.disks))
+        size = min(disk_size or 1, self.MAX_DISK_SIZE)
+        client.run('mkdir -p {} && truncate -s {}G {}'.format(self.disk_dir, size, disk_file))
+        _, loop_device, stderr = client.run('sudo losetup --find --show {}'.format(disk_file))
+        loop_device = loop_device.strip()
+        if not loop_device:
+            raise Exception('Failed to attach loop file {}: {}'.format(disk_file, stderr))
+        self.disks.append((vm_instance, disk_file, loop_device))
+        log.info('Attached {} as {} on {}'.format(disk_file, loop_device, vm_instance['host']))
+        return loop_device
+
+    def attach_disks(self, vm_instance, disk_size=0, devices=None):
+        """
+        Attach several sparse loop files as disks, e.g. for a RAID.
+        :param vm_instance: VM description
+        :param disk_size: size in GB of each disk, capped to MAX_DISK_SIZE
+        :param devices: one entry per disk, unused as loop devices are allocated by losetup
+        :return: loop device paths
+        """
+        return [self.attach_disk(vm_instance, disk_size=disk_size) for _ in devices]
+
+    def wait_for_ping(self, instance):
+        """
+        Wait for the host sshd and connect to it.
+        :param instance: VM description
+        :return: SSHClient
+        """
+        wait_for_ssh(instance['host'], timeout=60)
+        return SSHClient(server=instance['host'], host_key_file=self.host_key_file, user=self.user,
+                         ssh_key_file=os.path.join(self.localpath, self.key_name + '.pem'))
+
+    def restart_vm(self, instance):
+        """
+        Hosts are not rebooted, only reconnected to.
+        :param instance: VM description
+        :return: SSHClient
+        """
+        log.info('Reconnecting to local VM {} instead of restarting it'.format(instance['name']))
+        return self.wait_for_ping(instance)
+
+    def teardown(self):
+        """
+        Detach and remove the loop files.
+        """
+        log.info('Running teardown.')
+        for vm_instance, disk_file, loop_device in self.disks:
+            try:
+                client = self._client(vm_instance)
+                client.run('sudo losetup -d {}; rm -f {}'.format(loop_device, disk_file))
+            except Exception as e:
+                log.info(e)
+        for vm_instance in self.vms:
+            if self.disks:
+                self._client(vm_instance).run('rm -rf {}'.format(self.disk_dir))
+        self.disks = []
+        self.clients = {}
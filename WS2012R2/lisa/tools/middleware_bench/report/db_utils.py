@@ -20,13 +20,21 @@ permissions and limitations under the License.
 """
 import os
 import sys
+import json
+import atexit
+import threading
 import pprint
 import logging
 import ConfigParser
 
-from sqlalchemy import Table, Column, Date, DECIMAL, INT, BIGINT, NVARCHAR, MetaData, create_engine
-from sqlalchemy.pool import NullPool
-from sqlalchemy.orm import create_session, mapper
+from sqlalchemy import Table, Column, Date, DECIMAL, INT, BIGINT, NVARCHAR, MetaData, create_engine,\
+    inspect
+
+from report.spool import ResultsSpool, SpoolFlusher
+from report.warehouse import ResultsWarehouse
+from report.regression import RegressionDetector, format_report
+from utils import journal
+from utils.tracing import span
 
 
 logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
@@ -204,14 +212,176 @@ COLUMNS = [{'name': 'TestCaseName', 'type': NVARCHAR(50)},
            {'name': 'Latency95Percentile_ms', 'type': DECIMAL(10, 2)},
            {'name': 'Latency99Percentile_ms', 'type': DECIMAL(10, 2)},
            {'name': 'Latency999Percentile_ms', 'type': DECIMAL(10, 2)},
+           {'name': 'LatencyHistogram_us', 'type': NVARCHAR()},
            ]
+# columns added after the tables were created, only uploaded if present in the DB table
+OPTIONAL_COLUMNS = ['LatencyHistogram_us']
+
+
+# rows inserted per executemany call, all chunks being committed in one transaction
+UPLOAD_CHUNK_SIZE = 1000
+
+# local results spool, drained in the background by one flusher per spool file
+SPOOL_FILE = 'results_spool.db'
+SPOOL_FLUSH_TIMEOUT = 10 * 60
+_flushers = {}
+# tests may upload concurrently, see utils.scheduler
+_lock = threading.Lock()
+
+# local results mirror for historical queries, see report.warehouse
+WAREHOUSE_FILE = 'results_warehouse.db'
+_warehouses = {}
+
+# engines and table definitions reused across uploads, keyed by connection url
+_engines = {}
+_tables = {}
+
+
+def get_engine(config, driver):
+    """
+    Get the cached engine for the DB described in the credentials config.
+    Statements are logged when the optional Credentials/Echo option is enabled.
+    :param config: <ConfigParser> credentials config
+    :param driver: ODBC driver name
+    :return: <sqlalchemy.engine.Engine>
+    """
+    url = 'mssql+pyodbc://{}:{}@{}/{}?driver={}'.format(
+            config.get('Credentials', 'User'), config.get('Credentials', 'Password'),
+            config.get('Credentials', 'Server'), config.get('Credentials', 'Database'), driver)
+    echo = config.has_option('Credentials', 'Echo') and config.getboolean('Credentials', 'Echo')
+    engine = _engines.get(url, None)
+    if engine is None:
+        # tests run for hours between uploads, recycle the idle connections meanwhile
+        engine = create_engine(url, pool_recycle=3600, convert_unicode=True, echo=echo)
+        _engines[url] = engine
+    return engine
+
+
+def get_table(engine, table_name, column_names):
+    """
+    Get the cached table definition for the uploaded columns, skipping the OPTIONAL_COLUMNS
+    not present in the DB table.
+    :param engine: <sqlalchemy.engine.Engine>
+    :param table_name: DB table name
+    :param column_names: column names present in the results
+    :return: <sqlalchemy.Table>
+    """
+    key = (str(engine.url), table_name, tuple(sorted(column_names)))
+    table = _tables.get(key, None)
+    if table is not None:
+        return table
+    table_columns = [column for column in COLUMNS if column['name'] in column_names]
+    if any(column['name'] in OPTIONAL_COLUMNS for column in table_columns):
+        db_columns = [column['name'] for column in inspect(engine).get_columns(table_name)]
+        missing = [column['name'] for column in table_columns
+                   if column['name'] in OPTIONAL_COLUMNS and column['name'] not in db_columns]
+        if missing:
+            log.warning('Columns {} not present in table {}, skipping them.'.format(
+                    missing, table_name))
+            table_columns = [column for column in table_columns
+                             if column['name'] not in missing]
+    table = Table(table_name, MetaData(),
+                  Column('TestId', BIGINT, primary_key=True, nullable=False, index=True),
+                  *(Column(column['name'], column['type']) for column in table_columns))
+    # When creating db is also necessary
+    # table.create(bind=engine, checkfirst=True)
+    _tables[key] = table
+    return table
+
+
+def insert_results(table_name, config_path, test_results):
+    """
+    Insert the results rows in the DB table, in a single transaction.
+    :param table_name: DB table name
+    :param config_path: credentials config file
+    :param test_results: list of row dicts
+    """
+    config = ConfigParser.ConfigParser()
+    config.read(config_path)
+    if 'linux' in sys.platform:
+        driver = config.get('Credentials', 'Driver_linux')
+    else:
+        driver = config.get('Credentials', 'Driver_windows')
+
+    e = get_engine(config, driver)
+    t = get_table(e, table_name, test_results[0].keys())
+    column_names = [column.name for column in t.columns if column.name != 'TestId']
+    rows = [dict((name, row.get(name, None)) for name in column_names) for row in test_results]
+
+    try:
+        with span('db.insert', table=table_name, rows=len(rows)), e.begin() as connection:
+            for i in xrange(0, len(rows), UPLOAD_CHUNK_SIZE):
+                connection.execute(t.insert(), rows[i:i + UPLOAD_CHUNK_SIZE])
+    except Exception as ex:
+        log.exception(ex)
+        print("Failed to commit {} rows in {}. Rolled back.".format(len(rows), table_name))
+        raise
+    log.info('Uploaded {} rows in {}.'.format(len(rows), table_name))
+
+
+def get_flusher(localpath):
+    """
+    Get the background flusher draining the results spool from localpath, started on first use.
+    At exit, the pending results are given one more upload attempt, the ones left are kept in
+    the spool for the next run or for "python -m report.spool <spool> flush".
+    :param localpath: local path where the spool file is kept
+    :return: <SpoolFlusher>
+    """
+    spool_path = os.path.join(localpath, SPOOL_FILE)
+    with _lock:
+        flusher = _flushers.get(spool_path, None)
+        if flusher is None:
+            flusher = SpoolFlusher(ResultsSpool(spool_path), insert_results)
+            flusher.start()
+            atexit.register(flusher.flush, SPOOL_FLUSH_TIMEOUT)
+            _flushers[spool_path] = flusher
+    return flusher
+
+
+def get_warehouse(localpath, config):
+    """
+    Get the local results warehouse, kept in localpath unless the optional Warehouse/Path
+    config option points to a shared one.
+    :param localpath: local path provided to runner
+    :param config: <ConfigParser> credentials config
+    :return: <ResultsWarehouse>
+    """
+    if config.has_option('Warehouse', 'Path'):
+        warehouse_path = config.get('Warehouse', 'Path')
+    else:
+        warehouse_path = os.path.join(localpath, WAREHOUSE_FILE)
+    with _lock:
+        warehouse = _warehouses.get(warehouse_path, None)
+        if warehouse is None:
+            warehouse = ResultsWarehouse(warehouse_path, COLUMNS)
+            _warehouses[warehouse_path] = warehouse
+    return warehouse
+
+
+def report_regressions(localpath, warehouse, table_name, test_results):
+    """
+    Compare the results to their history in the warehouse, logging the regressions found and
+    saving them in localpath as regressions_<table_name>.json.
+    :return: list of regression dicts, ranked by relative degradation
+    """
+    regressions = RegressionDetector(warehouse).detect(table_name, test_results)
+    if regressions:
+        log.warning(format_report(regressions))
+        with open(os.path.join(localpath, 'regressions_{}.json'.format(table_name)), 'w') as f:
+            json.dump(regressions, f, indent=2, sort_keys=True)
+    return regressions
 
 
 def upload_results(localpath=None, table_name=None, results_path=None, parser=None,
                    other_table=False, **kwargs):
     """
-    Connect to DB and upload results
+    Parse results and spool them for upload to DB. The spool is drained in the background,
+    so the tests do not wait on the DB and no results are lost while it is unreachable.
     """
+    # checkpoint the upload arguments, to upload the results again when resuming the run
+    upload = dict(kwargs, localpath=localpath, table_name=table_name, results_path=results_path,
+                  parser=parser.__name__, other_table=other_table)
+    journal.record(upload=upload)
     if localpath:
         log.info('Looking up DB details in {}\*.config.' .format(localpath))
         db_creds_file = [os.path.join(localpath, c) for c in os.listdir(localpath)
@@ -221,54 +391,35 @@ def upload_results(localpath=None, table_name=None, results_path=None, parser=No
         config.read(db_creds_file)
     else:
         log.error('No credentials file path provided. Skipping results upload.')
+        journal.record(journal.UPLOADED)
         return None
 
-    test_results = parser(log_path=results_path, **kwargs).process_logs()
+    with span('upload.parse', parser=parser.__name__):
+        test_results = parser(log_path=results_path, **kwargs).process_logs()
 
     pprint.pprint(test_results)
-    if 'linux' in sys.platform:
-        driver = config.get('Credentials', 'Driver_linux')
-    else:
-        driver = config.get('Credentials', 'Driver_windows')
+    if not test_results:
+        log.warning('No results parsed from {}. Skipping results upload.'.format(results_path))
+        journal.record(journal.UPLOADED)
+        return None
 
     if other_table:
         temp = table_name.split('_')
         temp.insert(2, config.get('Credentials', 'Other_table'))
         table_name = '_'.join(temp)
 
-    e = create_engine('mssql+pyodbc://{}:{}@{}/{}?driver={}'.format(
-            config.get('Credentials', 'User'), config.get('Credentials', 'Password'),
-            config.get('Credentials', 'Server'), config.get('Credentials', 'Database'), driver,
-            poolclass=NullPool, convert_unicode=True, echo=True))
-    metadata = MetaData(bind=e)
-
-    table_columns = [column for column in COLUMNS if column['name'] in test_results[0]]
-    t = Table(table_name, metadata,
-              Column('TestId', BIGINT, primary_key=True, nullable=False, index=True),
-              *(Column(column['name'], column['type']) for column in table_columns))
-
-    # When creating db is also necessary
-    # metadata.create_all(checkfirst=True)
-
-    class TestResults(object):
-        def __getitem__(self, item):
-            return getattr(self, item)
-
-        def __setitem__(self, item, value):
-            return setattr(self, item, value)
-
-    mapper(TestResults, t)
-    session = create_session(bind=e, autocommit=False, autoflush=True)
-
-    for row in test_results:
-        test_data = TestResults()
-        for k, v in row.items():
-            test_data[k] = v
-        session.add(test_data)
-        try:
-            session.commit()
-        except Exception as ex:
-            log.exception(ex)
-            print("Failed to commit {} data. Rolling back.".format(row))
-            session.rollback()
-            raise
+    with span('upload.spool', table=table_name):
+        flusher = get_flusher(localpath)
+        key = flusher.spool.add(table_name, db_creds_file, test_results)
+        flusher.notify()
+    try:
+        with span('upload.warehouse', table=table_name):
+            warehouse = get_warehouse(localpath, config)
+            if not warehouse.imported(key):
+                report_regressions(localpath, warehouse, table_name, test_results)
+            warehouse.store(table_name, test_results, key=key)
+    except Exception as ex:
+        log.warning('Failed to store results in the local warehouse: {}'.format(ex))
+    log.info('Spooled {} rows for {} as {}.'.format(len(test_results), table_name, key))
+    journal.record(journal.UPLOADED, spool_key=key)
+    return key
@@ -0,0 +1,148 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import logging
+import re
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def unit_converter(units, unit_to):
+    """
+    Build a Field converter for a (value, unit) group pair e.g. '1.5', 'ms'.
+    :param units: <dict> unit multipliers e.g. BaseLogsReader.UNIT
+    :param unit_to: unit to convert the value into
+    :return: converter function
+    """
+    def convert(value, unit):
+        return float(value.strip()) * units[unit.strip()] / units[unit_to]
+    return convert
+
+
+class Field(object):
+    """
+    Declarative extraction rule for a single log_dict field.
+    :param name: log_dict key to fill
+    :param pattern: regex matched (re.match) against the log lines
+    :param group: group index, or tuple of indexes passed together to convert
+    :param convert: optional converter applied on the group value(s)
+    :param anchor: optional regex; the field is only looked up after a line matching it
+    :param offset: used with anchor, look only at the line <offset> lines after the anchor
+    :param reduce: optional function(current, new) folding every match into the field,
+                   instead of keeping only the first match
+    """
+    def __init__(self, name, pattern, group=1, convert=None, anchor=None, offset=None,
+                 reduce=None):
+        self.name = name
+        self.pattern = pattern
+        self.group = group
+        self.convert = convert
+        self.anchor = anchor
+        self.offset = offset
+        self.reduce = reduce
+
+    def value(self, match):
+        if isinstance(self.group, tuple):
+            values = match.group(*self.group)
+        else:
+            values = (match.group(self.group),)
+        if self.convert:
+            return self.convert(*values)
+        return values[0]
+
+
+class _Rule(object):
+    """
+    Fields sharing the same pattern, anchor and offset, matched once per line.
+    """
+    def __init__(self, pattern, anchor, offset):
+        self.pattern = re.compile(pattern)
+        self.anchor = re.compile(anchor) if anchor else None
+        self.offset = offset
+        self.fields = []
+
+
+class LogExtractor(object):
+    """
+    Compiled set of Field specs extracting a log_dict in a single pass over the log lines.
+    Fields sharing a pattern are matched with one regex call, and each field stops being
+    looked up once found, so the parsing ends as soon as all fields are collected.
+    """
+    def __init__(self, fields):
+        """
+        Compile the extractor.
+        :param fields: list of <Field> specs
+        """
+        self.fields = fields
+        self.rules = []
+        rules = {}
+        for field in fields:
+            key = (field.pattern, field.anchor, field.offset)
+            if key not in rules:
+                rules[key] = _Rule(*key)
+                self.rules.append(rules[key])
+            rules[key].fields.append(field)
+
+    def extract(self, lines, log_dict):
+        """
+        Extract the spec fields from the log lines into log_dict. Fields with a reduce
+        function are folded into the log_dict value already set by the reader.
+        :param lines: iterable of log lines e.g. an open file
+        :param log_dict: dict constructed from the defined headers
+        :return: <dict> {'head1': 'val1', ...}
+        """
+        pending = dict((rule, list(rule.fields)) for rule in self.rules)
+        armed = [rule for rule in self.rules if not rule.anchor]
+        waiting = [rule for rule in self.rules if rule.anchor]
+        scheduled = {}
+        for x, line in enumerate(lines):
+            for rule in list(waiting):
+                if rule.anchor.match(line):
+                    if rule.offset is None:
+                        waiting.remove(rule)
+                        armed.append(rule)
+                    else:
+                        scheduled.setdefault(x + rule.offset, []).append(rule)
+            candidates = armed
+            if x in scheduled:
+                candidates = armed + scheduled.pop(x)
+            done = []
+            for rule in candidates:
+                match = rule.pattern.match(line)
+                if not match:
+                    continue
+                fields = pending[rule]
+                for field in list(fields):
+                    value = field.value(match)
+                    if field.reduce:
+                        log_dict[field.name] = field.reduce(log_dict[field.name], value)
+                    else:
+                        log_dict[field.name] = value
+                        fields.remove(field)
+                if not fields:
+                    done.append(rule)
+            if done:
+                armed = [rule for rule in armed if rule not in done]
+                waiting = [rule for rule in waiting if rule not in done]
+                if not armed and not waiting and not scheduled:
+                    break
+        return log_dict
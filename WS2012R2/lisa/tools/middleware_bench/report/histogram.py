@@ -0,0 +1,200 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import base64
+import logging
+import math
+import zlib
+
+import numpy as np
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+class LatencyHistogram(object):
+    """
+    Compact, mergeable latency histogram using log scaled buckets, similar to HdrHistogram.
+    Values are recorded in microseconds, bucket i holds values in (BASE^(i-1), BASE^i], so the
+    reported percentiles are within PRECISION relative error. Values below 1us fall in bucket 0.
+    The histogram is stored as sparse sorted bucket indexes and their counts.
+    """
+    PRECISION = 0.01
+    BASE = 1 + PRECISION
+    ENCODING = 'v1'
+
+    def __init__(self, indexes=None, counts=None):
+        """
+        Init histogram.
+        :param indexes: sorted bucket indexes
+        :param counts: counts for each bucket index
+        """
+        self.indexes = np.asarray(indexes if indexes is not None else [], dtype=np.int64)
+        self.counts = np.asarray(counts if counts is not None else [], dtype=np.int64)
+
+    @classmethod
+    def bucket(cls, values):
+        """
+        Compute the bucket indexes of the values.
+        :param values: <array like> latency values in microseconds
+        :return: <numpy array> bucket indexes
+        """
+        values = np.maximum(np.asarray(values, dtype=np.float64), 1)
+        return np.ceil(np.log(values) / math.log(cls.BASE) - 1e-9).astype(np.int64)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def record(self, values, counts=None, scale=1):
+        """
+        Record latency values into the histogram.
+        :param values: <array like> latency values
+        :param counts: <array like> optional number of occurrences for each value
+        :param scale: multiplier converting the values to microseconds e.g. 1000 for ms
+        :return: self
+        """
+        values = np.asarray(values, dtype=np.float64) * scale
+        if counts is None:
+            counts = np.ones(values.shape, dtype=np.int64)
+        return self._add(self.bucket(values), counts)
+
+    def _add(self, indexes, counts):
+        indexes = np.concatenate([self.indexes, np.asarray(indexes, dtype=np.int64)])
+        counts = np.concatenate([self.counts, np.asarray(counts, dtype=np.int64)])
+        indexes, inverse = np.unique(indexes, return_inverse=True)
+        counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        self.indexes = indexes[counts > 0]
+        self.counts = counts[counts > 0]
+        return self
+
+    def merge(self, *others):
+        """
+        Merge other histograms e.g. from repeated runs into a new histogram.
+        :param others: <LatencyHistogram> histograms to merge with
+        :return: <LatencyHistogram> merged histogram
+        """
+        merged = LatencyHistogram(self.indexes, self.counts)
+        for other in others:
+            merged._add(other.indexes, other.counts)
+        return merged
+
+    def percentiles(self, percentiles):
+        """
+        Vectorized percentile query.
+        :param percentiles: <array like> percentiles in [0, 100] e.g. [50, 99, 99.99]
+        :return: <numpy array> latency values in microseconds, NaN for an empty histogram
+        """
+        percentiles = np.asarray(percentiles, dtype=np.float64)
+        if not self.total:
+            return np.full(percentiles.shape, np.nan)
+        cumulative = np.cumsum(self.counts)
+        ranks = np.maximum(np.ceil(percentiles / 100.0 * self.total), 1)
+        positions = np.minimum(np.searchsorted(cumulative, ranks, side='left'),
+                               len(cumulative) - 1)
+        return self.BASE ** self.indexes[positions].astype(np.float64)
+
+    def encode(self):
+        """
+        Encode the histogram as a compact string, suitable for a DB column.
+        :return: <str> e.g. 'v1:eJxjYGBgYAQ...'
+        """
+        deltas = np.ediff1d(self.indexes, to_begin=self.indexes[:1])
+        data = np.concatenate([deltas, self.counts]).astype('<i8')
+        return '{}:{}'.format(self.ENCODING,
+                              base64.b64encode(zlib.compress(data.tobytes(), 9)).decode('ascii'))
+
+    @classmethod
+    def decode(cls, encoded):
+        """
+        Decode a histogram string produced by encode().
+        :param encoded: <str> encoded histogram
+        :return: <LatencyHistogram>
+        """
+        encoding, payload = encoded.split(':', 1)
+        if encoding != cls.ENCODING:
+            raise Exception('Unsupported histogram encoding: {}'.format(encoding))
+        data = np.frombuffer(zlib.decompress(base64.b64decode(payload)), dtype='<i8')
+        size = len(data) // 2
+        return cls(np.cumsum(data[:size]), data[size:])
+
+    @classmethod
+    def from_percentiles(cls, points, total, scale=1):
+        """
+        Build a histogram from a percentile distribution e.g. [(50, 2.1), (99, 9.5), ...]. The
+        samples between two percentiles are recorded at the upper percentile value.
+        :param points: list of (percentile, value) pairs
+        :param total: total number of samples the distribution was computed on
+        :param scale: multiplier converting the values to microseconds
+        :return: <LatencyHistogram>
+        """
+        points = sorted((float(p), float(v)) for p, v in points if v is not None)
+        if not points or not total:
+            return cls()
+        percentiles = np.array([p for p, _ in points])
+        values = np.array([v for _, v in points])
+        ranks = np.ceil(percentiles / 100.0 * total)
+        counts = np.diff(np.concatenate([[0], ranks]))
+        if percentiles[-1] < 100:
+            # the samples above the last known percentile are capped to its value
+            counts[-1] += total - ranks[-1]
+        return cls().record(values[counts > 0], counts[counts > 0], scale=scale)
+
+    @classmethod
+    def from_hgrm(cls, hgrm_path, scale=1000):
+        """
+        Build a histogram from a HdrHistogram percentile distribution file (.hgrm) e.g. the ones
+        produced by memtier_benchmark --hdr-file-prefix, which reports values in milliseconds.
+        :param hgrm_path: full path of the .hgrm file
+        :param scale: multiplier converting the reported values to microseconds
+        :return: <LatencyHistogram>
+        """
+        values = []
+        totals = []
+        with open(hgrm_path, 'r') as fl:
+            for line in fl:
+                columns = line.split()
+                if len(columns) < 3 or line.lstrip().startswith('#'):
+                    continue
+                try:
+                    value, total = float(columns[0]), int(columns[2])
+                except ValueError:
+                    continue
+                values.append(value)
+                totals.append(total)
+        if not values:
+            return cls()
+        counts = np.diff(np.concatenate([[0], totals]))
+        values = np.array(values)
+        return cls().record(values[counts > 0], counts[counts > 0], scale=scale)
+
+
+def merged_percentiles(encoded_histograms, percentiles):
+    """
+    Query percentiles across repeated runs e.g. histograms read back from the results DB.
+    :param encoded_histograms: list of encoded histograms, empty values are skipped
+    :param percentiles: <array like> percentiles in [0, 100]
+    :return: <numpy array> latency values in microseconds
+    """
+    histograms = [LatencyHistogram.decode(h) for h in encoded_histograms if h]
+    if not histograms:
+        return LatencyHistogram().percentiles(percentiles)
+    return histograms[0].merge(*histograms[1:]).percentiles(percentiles)
@@ -0,0 +1,221 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import re
+import math
+import json
+import logging
+
+import numpy as np
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+# columns identifying a test point, besides the test case and the instance size. Baselines are
+# matched on their exact values, so only the test configuration and log file name parameters
+# belong here, not measured values e.g. the ntttcp average packet size or the records counts
+PARAMETER_COLUMNS = ['DataPath', 'DiskSetup', 'TestMode', 'FileTestMode', 'IPVersion',
+                     'ProtocolType', 'ClusterSetup', 'Threads', 'BufferSize_Bytes',
+                     'TestConnections', 'NumberOfConnections', 'TestPipelines', 'TestConcurrency',
+                     'NodeSize_bytes', 'ConcurrencyPerAbInstance', 'Document_bytes',
+                     'ParallelClients', 'Payload_bytes', 'ConnectionsPerThread',
+                     'RequestsPerThread', 'NumOutstandingSmall_IO', 'NumOutstandingLarge_IO',
+                     'BlockSize_Kb', 'BlockSize_KB', 'QDepth', 'SendBufSize_KBytes',
+                     'ScaleFactor', 'TransactionType', 'TestClients', 'ScalingFactor',
+                     'DataSize_bytes', 'Loops', 'Groups', 'WorkerThreads', 'MessageThreads',
+                     'Device', 'BatchSize', 'WorkloadName', 'Model', 'NumGpus', 'DataFormat',
+                     'Distortions', 'TaskName', 'TrackName', 'ReplicationFactor', 'PartitionNum',
+                     'BufferMem', 'RecordSize']
+# metrics where a higher value is a regression, checked before HIGHER_IS_BETTER
+LOWER_IS_BETTER = re.compile('Latency(?!Histogram)|ResponseTime|ServiceTime|_lat_|Duration_sec|'
+                             'ConnectionTimes|Deadlocks|Retransmitted|DatagramLoss|ErrorRate|'
+                             'GC_s$|RuntimeSec')
+HIGHER_IS_BETTER = re.compile('PerSec|Throughput|IOPS|_iops|Ops$|TransferRate|TotalQueries')
+
+
+def metric_direction(name):
+    """
+    :param name: column name
+    :return: 1 if higher values are better, -1 if lower values are better, 0 if not a metric
+    """
+    if LOWER_IS_BETTER.search(name):
+        return -1
+    if HIGHER_IS_BETTER.search(name):
+        return 1
+    return 0
+
+
+def rankdata(values):
+    """
+    Ranks starting from 1, ties getting the average of their ranks.
+    :param values: 1-D numpy array
+    :return: <numpy array> ranks
+    """
+    unique, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    ends = np.cumsum(counts)
+    return ((ends - counts + 1 + ends) / 2.0)[inverse]
+
+
+def mann_whitney(sample, baseline, direction):
+    """
+    One sided Mann-Whitney U test, normal approximation with tie and continuity corrections.
+    :param sample: <numpy array> new values
+    :param baseline: <numpy array> baseline values
+    :param direction: 1 to test if sample is lower than baseline, -1 if higher
+    :return: <float> p value
+    """
+    n, m = len(sample), len(baseline)
+    total = n + m
+    ranks = rankdata(np.concatenate([sample, baseline]))
+    u = ranks[:n].sum() - n * (n + 1) / 2.0
+    _, ties = np.unique(ranks, return_counts=True)
+    tie_term = (ties ** 3 - ties).sum() / float(total * (total - 1))
+    sigma = math.sqrt(n * m / 12.0 * ((total + 1) - tie_term))
+    if not sigma:
+        return 1.0
+    z = direction * (u - n * m / 2.0) + 0.5
+    return 0.5 * math.erfc(-z / sigma / math.sqrt(2))
+
+
+def bootstrap_change(sample, baseline, samples, alpha, random_state):
+    """
+    Bootstrap confidence interval of the relative change of the sample median vs the baseline
+    median, all resamples being drawn at once.
+    :return: <tuple> (point estimate, low bound, high bound)
+    """
+    baseline_median = np.median(baseline)
+    sample_medians = np.median(sample[random_state.randint(0, len(sample),
+                                                           (samples, len(sample)))], axis=1)
+    baseline_medians = np.median(baseline[random_state.randint(0, len(baseline),
+                                                               (samples, len(baseline)))], axis=1)
+    changes = (sample_medians - baseline_medians) / np.abs(baseline_medians)
+    low, high = np.percentile(changes, [alpha / 2 * 100, (1 - alpha / 2) * 100])
+    return (np.median(sample) - baseline_median) / abs(baseline_median), low, high
+
+
+class RegressionDetector(object):
+    """
+    Compare new results rows, as produced by the *LogsReader.process_logs, to their history
+    in the local results warehouse. Baselines are matched by test case, instance size and
+    parameter columns, a metric being flagged when both the Mann-Whitney test and the
+    bootstrap confidence interval of the median change point to a degradation over threshold.
+    """
+    def __init__(self, warehouse, alpha=0.05, threshold=0.05, min_baseline=5, max_baseline=100,
+                 samples=2000, seed=0):
+        """
+        :param warehouse: <ResultsWarehouse> results history
+        :param alpha: significance level
+        :param threshold: minimum relative degradation to report e.g. 0.05 for 5%
+        :param min_baseline: minimum number of baseline runs to compare to
+        :param max_baseline: number of most recent baseline runs compared to, a single new run
+                             needs about 60 baseline runs to be significant at alpha 0.05
+        :param samples: number of bootstrap resamples
+        :param seed: random seed, so that reports are reproducible
+        """
+        self.warehouse = warehouse
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_baseline = min_baseline
+        self.max_baseline = max_baseline
+        self.samples = samples
+        self.seed = seed
+
+    @staticmethod
+    def group_rows(rows):
+        """
+        Group the rows by test point.
+        :return: <dict> {(TestCaseName, InstanceSize, ((param, value), ...)): [rows]}
+        """
+        groups = {}
+        for row in rows:
+            params = tuple((name, row[name]) for name in PARAMETER_COLUMNS
+                           if row.get(name, None) is not None)
+            key = (row.get('TestCaseName', None), row.get('InstanceSize', None), params)
+            groups.setdefault(key, []).append(row)
+        return groups
+
+    def detect(self, table_name, rows):
+        """
+        Look for regressions of the rows metrics vs their history.
+        :param table_name: DB table name the rows are uploaded to
+        :param rows: list of row dicts
+        :return: list of regression dicts, ranked by relative degradation
+        """
+        regressions = []
+        if table_name not in self.warehouse.tables:
+            return regressions
+        random_state = np.random.RandomState(self.seed)
+        for (test_case, instance_size, params), group in sorted(self.group_rows(rows).items()):
+            metrics = sorted(set(name for row in group for name in row
+                                 if name in self.warehouse.affinity and
+                                 self.warehouse.affinity[name] != 'TEXT' and
+                                 name not in PARAMETER_COLUMNS and metric_direction(name)))
+            if not metrics:
+                continue
+            history = self.warehouse.columns_of(table_name, columns=['TestDate'] + metrics,
+                                                TestCaseName=test_case,
+                                                InstanceSize=instance_size, **dict(params))
+            for metric in metrics:
+                sample = np.array([row[metric] for row in group if row.get(metric) is not None],
+                                  dtype=np.float64)
+                baseline = history.get(metric, np.array([]))
+                baseline = baseline[~np.isnan(baseline)][-self.max_baseline:]
+                if not len(sample) or len(baseline) < self.min_baseline or \
+                        not np.median(baseline):
+                    continue
+                direction = metric_direction(metric)
+                p_value = mann_whitney(sample, baseline, direction)
+                change, low, high = bootstrap_change(sample, baseline, self.samples, self.alpha,
+                                                     random_state)
+                # degradation is positive when the metric got worse
+                degradation = -direction * change
+                worst, best = sorted([-direction * low, -direction * high])[::-1]
+                if p_value < self.alpha and best > 0 and degradation >= self.threshold:
+                    regressions.append({'Table': table_name, 'TestCaseName': test_case,
+                                        'InstanceSize': instance_size,
+                                        'KernelVersion': group[0].get('KernelVersion', None),
+                                        'Parameters': dict(params), 'Metric': metric,
+                                        'Value': float(np.median(sample)),
+                                        'Baseline': float(np.median(baseline)),
+                                        'BaselineRuns': len(baseline),
+                                        'Degradation_percent': round(degradation * 100, 2),
+                                        'CI_percent': [round(best * 100, 2),
+                                                       round(worst * 100, 2)],
+                                        'PValue': round(p_value, 5)})
+        return sorted(regressions, key=lambda r: r['Degradation_percent'], reverse=True)
+
+
+def format_report(regressions):
+    """
+    :param regressions: list of regression dicts from RegressionDetector.detect
+    :return: <str> ranked regression report
+    """
+    lines = ['{} regressions found.'.format(len(regressions))]
+    for i, regression in enumerate(regressions):
+        lines.append('{}. {} {} {} {}: {} {:.2f} -> {:.2f} ({}% worse, CI {}%, p={}, '
+                     '{} baseline runs) {}'.format(
+                        i + 1, regression['Table'], regression['TestCaseName'],
+                        regression['InstanceSize'], regression['KernelVersion'],
+                        regression['Metric'], regression['Baseline'], regression['Value'],
+                        regression['Degradation_percent'], regression['CI_percent'],
+                        regression['PValue'], regression['BaselineRuns'],
+                        json.dumps(regression['Parameters'], sort_keys=True)))
+    return '\n'.join(lines)
@@ -25,16 +25,99 @@ import os
 import time
 import zipfile
 import shutil
+import tempfile
 import csv
 import decimal
+import glob
+import json
 
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+from report.extractor import Field, LogExtractor, unit_converter
+from report.histogram import LatencyHistogram
 
 logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
                     datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
 log = logging.getLogger(__name__)
 
 
+def _summary_date(match):
+    """
+    Format the summary.log date as YYYY-MM-DD.
+    """
+    month = time.strptime(match.group(1), '%b').tm_mon
+    return '{}-{:02d}-{}'.format(match.group(3), month, match.group(2).zfill(2))
+
+
+class SummaryLog(object):
+    """
+    Lazy summary.log metadata reader. The file is parsed on the first key lookup, in a
+    single pass that stops as soon as all the known fields are found.
+    """
+    FIELDS = [('date', re.compile('[A-Za-z]{3}\s*([A-Za-z]{3})\s*([0-9]{2})\s*'
+                                  '[0-9]{2}:[0-9]{2}:[0-9]{2}\s*([0-9]{4})'), _summary_date),
+              ('kernel', re.compile('.+:\s*Kernel\s*Version\s*:\s*([a-z0-9-.]+)'), None),
+              ('guest_os', re.compile('.+:\s*Guest\s*OS\s*:\s*([a-zA-Z0-9. ]+)'), None),
+              ('hadoop_version', re.compile('.+:\s*Hadoop\s*Version\s*:\s*hadoop-([0-9. ]+)'),
+               None),
+              ('udp_buffer', re.compile('.+:\s*UDP\s*Buffer\s*:\s*([0-9. ]+)'), None),
+              ('sql_server_version', re.compile('.+:\s*SQLServer\s*Version\s*:\s*.+\s*-'
+                                                '\s*([0-9.]+)\s*'), None),
+              ('postgresql_version', re.compile('.+:\s*PostgreSQL\s*Version\s*:\s*.+\s*'
+                                                'PostgreSQL\s*([0-9.]+)\s*'), None),
+              ('php_version', re.compile('PHP Version:\s+PHP\s+(\d+\.\d+\.\d+).*'), None),
+              ('mysql_version', re.compile('MySQL Version:.*(\d\.\d\.\d+),.*'), None),
+              ('NodejsVersion', re.compile('.*Nodejs Version: (.*)'), None),
+              ('BenchmarkCommitHash', re.compile('.*Benchmark Commit Hash: (.*)'), None),
+              ('gpucount', re.compile('.+:\s*Gpu Count :\s*(.*)\s*'), None)]
+    DEFAULTS = {'gpucount': 0}
+
+    def __init__(self, summary_path):
+        """
+        Init summary log.
+        :param summary_path: full path of the summary.log file
+        """
+        self.summary_path = summary_path
+        self._fields = None
+
+    def _parse(self):
+        fields = dict(self.DEFAULTS)
+        pending = list(self.FIELDS)
+        with open(self.summary_path, 'r') as f:
+            for line in f:
+                found = []
+                for field in pending:
+                    key, pattern, formatter = field
+                    match = pattern.match(line)
+                    if match:
+                        if formatter:
+                            fields[key] = formatter(match)
+                        else:
+                            fields[key] = match.group(1).strip()
+                        found.append(field)
+                if found:
+                    pending = [field for field in pending if field not in found]
+                    if not pending:
+                        break
+        return fields
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            self._fields = self._parse()
+        return self._fields
+
+    def __getitem__(self, key):
+        return self.fields[key]
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+
 class BaseLogsReader(object):
     """
     Base class for collecting data from multiple log files
@@ -47,17 +130,25 @@ class BaseLogsReader(object):
                'M': 2 ** 20,
                'G': 2 ** 30}
 
+    # archives are extracted concurrently and their files parsed by a shared pool as soon as
+    # each archive is available, overlapping the disk I/O with the parsing
+    EXTRACT_WORKERS = 4
+    PARSE_WORKERS = 4
+
     def __init__(self, log_path):
         """
         Init Base logger.
         :param log_path: Path containing zipped logs.
         """
         self.cleanup = False
-        self.log_path = self.process_log_path(log_path)
+        self._extract_dirs = []
+        self.archives = self.get_archives(log_path)
+        self.log_path = [] if self.archives else self.process_log_path(log_path)
         self.headers = None
         self.log_matcher = None
         self.log_base_path = log_path
         self.sorter = []
+        self._summary_logs = {}
 
     @staticmethod
     def _convert(value, unit_from, unit_to):
@@ -67,126 +158,88 @@ class BaseLogsReader(object):
         """
         return value * unit_from / unit_to
 
+    @staticmethod
+    def _unzip(zip_path, dir_path):
+        """
+        Extract a zip to dir_path.
+        :return: the folder containing the logs inside the zip, '' if they are not in a folder
+        """
+        # it is required that all logs are zipped in a folder
+        with zipfile.ZipFile(zip_path, 'r') as z:
+            zip_content = z.namelist()
+            if any('/' in fis for fis in zip_content):
+                unzip_folder = next(fol for fol in zip_content if '/' in fol).split('/')[0]
+            else:
+                unzip_folder = ''
+            z.extractall(dir_path)
+        return unzip_folder
+
     def process_log_path(self, log_path):
         """
         Detect if log_path is a zip, then unzip it and return log's location.
         :param log_path:
         :return: log location - if the log_path is not a zip
                  unzipped location - if log_path is a zip
-                 list of zipped logs - if log_path contains the zipped logs
         """
         if zipfile.is_zipfile(log_path):
             dir_path = os.path.dirname(os.path.abspath(log_path))
             # extracting zip to current path
-            # it is required that all logs are zipped in a folder
-            with zipfile.ZipFile(log_path, 'r') as z:
-                zip_content = z.namelist()
-                if any('/' in fis for fis in zip_content):
-                    unzip_folder = next(fol for fol in zip_content if '/' in fol).split('/')[0]
-                else:
-                    unzip_folder = ''
-                z.extractall(dir_path)
+            unzip_folder = self._unzip(log_path, dir_path)
             if unzip_folder:
                 print(unzip_folder)
                 self.cleanup = True
             return os.path.join(dir_path, unzip_folder)
-        elif any(zipfile.is_zipfile(os.path.join(log_path, z))
-                 for z in os.listdir(log_path)):
-            zip_list = []
-            for z in os.listdir(log_path):
-                zip_file_path = os.path.join(log_path, z)
-                if zipfile.is_zipfile(zip_file_path):
-                    zip_list.append(self.process_log_path(zip_file_path))
-            return zip_list
         else:
             return log_path
 
+    @staticmethod
+    def get_archives(log_path):
+        """
+        List the zipped logs from a directory.
+        :param log_path: path to check
+        :return: <list> sorted zip paths, empty if log_path is not a directory of zips
+        """
+        if not os.path.isdir(log_path):
+            return []
+        return sorted(os.path.join(log_path, z) for z in os.listdir(log_path)
+                      if zipfile.is_zipfile(os.path.join(log_path, z)))
+
+    def extract_archive(self, zip_path):
+        """
+        Extract a zip in its own temporary folder next to it, so archives sharing the same
+        content layout can be extracted concurrently.
+        :param zip_path: full path of the zip
+        :return: extracted logs location
+        """
+        dir_path = tempfile.mkdtemp(prefix='{}_'.format(os.path.basename(zip_path)),
+                                    dir=os.path.dirname(os.path.abspath(zip_path)))
+        self._extract_dirs.append(dir_path)
+        return os.path.join(dir_path, self._unzip(zip_path, dir_path))
+
     def get_summary_log(self):
-        summary_log = [log_file for log_file in os.listdir(os.path.dirname(self.log_base_path))
-                       if 'summary.log' in log_file][0]
-        summary_path = os.path.join(os.path.dirname(self.log_base_path), summary_log)
-        log_dict = {}
-        with open(summary_path, 'r') as f:
-            for line in f:
-                if not log_dict.get('date', None):
-                    date = re.match('[A-Za-z]{3}\s*([A-Za-z]{3})\s*([0-9]{2})\s*'
-                                    '[0-9]{2}:[0-9]{2}:[0-9]{2}\s*([0-9]{4})', line)
-                    if date:
-                        month = time.strptime(date.group(1), '%b').tm_mon
-                        str_mon = str(month)
-                        str_day = date.group(2)
-                        if len(str_mon) < 2:
-                            str_mon = '0' + str_mon
-                        if len(str_day) < 2:
-                            str_day = '0' + str_day
-                        log_dict['date'] = date.group(3) + '-' + str_mon + '-' + str_day
-                if not log_dict.get('kernel', None):
-                    kernel = re.match('.+:\s*Kernel\s*Version\s*:\s*([a-z0-9-.]+)', line)
-                    if kernel:
-                        log_dict['kernel'] = kernel.group(1).strip()
-                if not log_dict.get('guest_os', None):
-                    guest_os = re.match('.+:\s*Guest\s*OS\s*:\s*([a-zA-Z0-9. ]+)', line)
-                    if guest_os:
-                        log_dict['guest_os'] = guest_os.group(1).strip()
-                if not log_dict.get('hadoop_version', None):
-                    hadoop_version = re.match('.+:\s*Hadoop\s*Version\s*:\s*hadoop-([0-9. ]+)',
-                                              line)
-                    if hadoop_version:
-                        log_dict['hadoop_version'] = hadoop_version.group(1).strip()
-                if not log_dict.get('udp_buffer', None):
-                    udp_buffer = re.match('.+:\s*UDP\s*Buffer\s*:\s*([0-9. ]+)', line)
-                    if udp_buffer:
-                        log_dict['udp_buffer'] = udp_buffer.group(1).strip()
-                if not log_dict.get('sql_server_version', None):
-                    sql_server_version = re.match('.+:\s*SQLServer\s*Version\s*:\s*.+\s*-'
-                                                  '\s*([0-9.]+)\s*', line)
-                    if sql_server_version:
-                        log_dict['sql_server_version'] = sql_server_version.group(1).strip()
-                if not log_dict.get('postgresql_version', None):
-                    postgresql_version = re.match('.+:\s*PostgreSQL\s*Version\s*:\s*.+\s*'
-                                                  'PostgreSQL\s*([0-9.]+)\s*', line)
-                    if postgresql_version:
-                        log_dict['postgresql_version'] = postgresql_version.group(1).strip()
-                if not log_dict.get('php_version', None):
-                    php_version = re.match('PHP Version:\s+PHP\s+(\d+\.\d+\.\d+).*',line)
-
-                    if php_version:
-                        log_dict['php_version'] = php_version.group(1).strip()
-                if not log_dict.get('mysql_version', None):
-                    mysql_version = re.match('MySQL Version:.*(\d\.\d\.\d+),.*',line)
-
-                    if mysql_version:
-                        log_dict['mysql_version'] = mysql_version.group(1).strip()
-                if not log_dict.get('NodejsVersion', None):
-                    NodejsVersion = re.match('.*Nodejs Version: (.*)',line)
-
-                    if NodejsVersion:
-                        log_dict['NodejsVersion'] = NodejsVersion.group(1).strip()
-                if not log_dict.get('BenchmarkCommitHash', None):
-                    BenchmarkCommitHash = re.match('.*Benchmark Commit Hash: (.*)',line)
-
-                    if BenchmarkCommitHash:
-                        log_dict['BenchmarkCommitHash'] = BenchmarkCommitHash.group(1).strip()
-                if not log_dict.get('gpucount', None):
-                    gpu_count = re.match('.+:\s*Gpu Count :\s*(.*)\s*', line)
-
-                    if gpu_count:
-                        log_dict['gpucount'] = gpu_count.group(1).strip()
-                    else:
-                        log_dict['gpucount'] = 0
-        return log_dict
+        """
+        Get the summary.log metadata of the run, parsed once and memoized per run directory.
+        :return: <SummaryLog> dict like object e.g. {'kernel': ..., 'date': ..., ...}
+        """
+        summary_dir = os.path.dirname(self.log_base_path)
+        summary = self._summary_logs.get(summary_dir, None)
+        if summary is None:
+            summary_log = [log_file for log_file in os.listdir(summary_dir)
+                           if 'summary.log' in log_file][0]
+            summary = SummaryLog(os.path.join(summary_dir, summary_log))
+            self._summary_logs[summary_dir] = summary
+        return summary
 
     def teardown(self):
         """
         Cleanup files/folders created for setting up the parser.
         :return: None
         """
-        if self.cleanup:
-            if isinstance(self.log_path, list):
-                for path in self.log_path:
-                    shutil.rmtree(path)
-            else:
-                shutil.rmtree(self.log_path)
+        if self.archives:
+            for path in self._extract_dirs:
+                shutil.rmtree(path)
+        elif self.cleanup:
+            shutil.rmtree(self.log_path)
 
     @staticmethod
     def get_log_files(log_path):
@@ -211,6 +264,18 @@ class BaseLogsReader(object):
         """
         return log_dict
 
+    def parse_log_file(self, log_file):
+        """
+        Parse a log file matching the regex filter with self.collect_data().
+        :param log_file: full path log file name
+        :return: collected data or None if the file is not matched
+        """
+        f_match = re.match(self.log_matcher, os.path.basename(log_file))
+        if not f_match:
+            return None
+        log_dict = dict.fromkeys(self.headers, '')
+        return self.collect_data(f_match, log_file, log_dict)
+
     def process_logs(self):
         """
         General data collector method parsing through each log file matching the
@@ -223,24 +288,33 @@ class BaseLogsReader(object):
              [] - on failed parsing
         """
         list_log_dict = []
-        log_files = []
-        if isinstance(self.log_path, list):
-            for path in self.log_path:
-                log_files.extend(self.get_log_files(path))
-        else:
-            log_files.extend(self.get_log_files(self.log_path))
-        for log_file in log_files:
-            f_match = re.match(self.log_matcher, os.path.basename(log_file))
-            if not f_match:
-                continue
-            log_dict = dict.fromkeys(self.headers, '')
-            collected_data = self.collect_data(f_match, log_file, log_dict)
-            if collected_data == None:
-                continue
-            elif type(collected_data) is list:
-                list_log_dict += collected_data
+        parsed = []
+        parse_pool = ThreadPool(self.PARSE_WORKERS)
+        try:
+            if self.archives:
+                extract_pool = ThreadPool(self.EXTRACT_WORKERS)
+                try:
+                    for path in extract_pool.imap(self.extract_archive, self.archives):
+                        self.log_path.append(path)
+                        parsed.extend(parse_pool.apply_async(self.parse_log_file, (log_file,))
+                                      for log_file in self.get_log_files(path))
+                finally:
+                    extract_pool.close()
+                    extract_pool.join()
             else:
-                list_log_dict.append(collected_data)
+                parsed.extend(parse_pool.apply_async(self.parse_log_file, (log_file,))
+                              for log_file in self.get_log_files(self.log_path))
+            for result in parsed:
+                collected_data = result.get()
+                if collected_data is None:
+                    continue
+                elif type(collected_data) is list:
+                    list_log_dict += collected_data
+                else:
+                    list_log_dict.append(collected_data)
+        finally:
+            parse_pool.close()
+            parse_pool.join()
 
         self.teardown()
         if self.sorter:
@@ -359,6 +433,12 @@ class SysbenchLogsReader(BaseLogsReader):
     Subclass for parsing Sysbench log files e.g.
     rndrd_4K_1_sysbench.log
     """
+    EXTRACTOR = LogExtractor([
+        Field('Latency95Percentile_ms', '\s*approx.\s*95\s*percentile:\s*([0-9.]+)([a-z]+)',
+              group=(1, 2), convert=unit_converter(BaseLogsReader.UNIT, 'ms')),
+        Field('RequestsExecutedPerSec', '\s*([0-9.]+)\s*Requests/sec\s*executed',
+              convert=str.strip)])
+
     def __init__(self, log_path=None, test_case_name=None, host_type=None, instance_size=None,
                  disk_setup=None):
         super(SysbenchLogsReader, self).__init__(log_path)
@@ -397,22 +477,7 @@ class SysbenchLogsReader(BaseLogsReader):
         log_dict['GuestOS'] = summary['guest_os']
 
         with open(log_file, 'rU') as fl:
-            f_lines = fl.readlines()
-            for key in log_dict:
-                if not log_dict[key]:
-                    for x in range(0, len(f_lines)):
-                        if 'Latency' in key:
-                            lat = re.match('\s*approx.\s*95\s*percentile:\s*([0-9.]+)([a-z]+)',
-                                           f_lines[x])
-                            if lat:
-                                unit = lat.group(2).strip()
-                                log_dict[key] = self._convert(float(lat.group(1).strip()),
-                                                              self.UNIT[unit], self.UNIT['ms'])
-                        elif 'Requests' in key:
-                            req = re.match('\s*([0-9.]+)\s*Requests/sec\s*executed', f_lines[x])
-                            if req:
-                                log_dict[key] = req.group(1).strip()
-        return log_dict
+            return self.EXTRACTOR.extract(fl, log_dict)
 
 
 class MemcachedLogsReader(BaseLogsReader):
@@ -420,6 +485,22 @@ class MemcachedLogsReader(BaseLogsReader):
     Subclass for parsing Memcached log files e.g.
     1.memtier_benchmark.run.log
     """
+    TOTALS = '\s*Totals\s*([0-9.]+)\s*([0-9.]+)\s*([0-9.]+)\s*([0-9.]+)\s*([0-9.]+)'
+    BEST = '\s*BEST\s*RUN\s*RESULTS\s*'
+    WORST = '\s*WORST\s*RUN\s*RESULTS\s*'
+    AVERAGE = '\s*AGGREGATED\s*AVERAGE\s*RESULTS\s*'
+    EXTRACTOR = LogExtractor([
+        Field('Threads', '\s*([0-9]+)\s*Threads'),
+        Field('ConnectionsPerThread', '\s*([0-9]+)\s*Connections\s*per\s*thread'),
+        Field('RequestsPerThread', '\s*([0-9]+)\s*Requests\s*per\s*thread'),
+        # the Totals row is the 7th line after each results table title
+        Field('BestOpsPerSec', TOTALS, group=1, anchor=BEST, offset=7),
+        Field('BestLatency_ms', TOTALS, group=4, anchor=BEST, offset=7),
+        Field('WorstOpsPerSec', TOTALS, group=1, anchor=WORST, offset=7),
+        Field('WorstLatency_ms', TOTALS, group=4, anchor=WORST, offset=7),
+        Field('AverageOpsPerSec', TOTALS, group=1, anchor=AVERAGE, offset=7),
+        Field('AverageLatency_ms', TOTALS, group=4, anchor=AVERAGE, offset=7)])
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, host_type=None,
                  instance_size=None):
         super(MemcachedLogsReader, self).__init__(log_path)
@@ -462,44 +543,14 @@ class MemcachedLogsReader(BaseLogsReader):
         log_dict['GuestOS'] = summary['guest_os']
 
         with open(log_file, 'r') as fl:
-            f_lines = fl.readlines()
-            for x in range(0, len(f_lines)):
-                for key in log_dict:
-                    if not log_dict[key]:
-                        threads = re.match('\s*([0-9]+)\s*Threads', f_lines[x])
-                        if threads:
-                            log_dict['Threads'] = threads.group(1)
-                        conn_per_thread = re.match('\s*([0-9]+)\s*Connections\s*per\s*thread',
-                                                   f_lines[x])
-                        if conn_per_thread:
-                            log_dict['ConnectionsPerThread'] = conn_per_thread.group(1)
-                        req_per_thread = re.match('\s*([0-9]+)\s*Requests\s*per\s*thread',
-                                                  f_lines[x])
-                        if req_per_thread:
-                            log_dict['RequestsPerThread'] = req_per_thread.group(1)
-                        best_table = re.match('\s*BEST\s*RUN\s*RESULTS\s*', f_lines[x])
-                        if best_table:
-                            best_totals = re.match('\s*Totals\s*([0-9.]+)\s*'
-                                                   '([0-9.]+)\s*([0-9.]+)\s*'
-                                                   '([0-9.]+)\s*([0-9.]+)',
-                                                   f_lines[x + 7])
-                            log_dict['BestOpsPerSec'] = best_totals.group(1)
-                            log_dict['BestLatency_ms'] = best_totals.group(4)
-                        worst_table = re.match('\s*WORST\s*RUN\s*RESULTS\s*', f_lines[x])
-                        if worst_table:
-                            worst_totals = re.match('\s*Totals\s*([0-9.]+)\s*'
-                                                    '([0-9.]+)\s*([0-9.]+)\s*'
-                                                    '([0-9.]+)\s*([0-9.]+)', f_lines[x + 7])
-                            log_dict['WorstOpsPerSec'] = worst_totals.group(1)
-                            log_dict['WorstLatency_ms'] = worst_totals.group(4)
-                        average_table = re.match('\s*AGGREGATED\s*AVERAGE\s*RESULTS\s*',
-                                                 f_lines[x])
-                        if average_table:
-                            average_totals = re.match('\s*Totals\s*([0-9.]+)\s*'
-                                                      '([0-9.]+)\s*([0-9.]+)\s*'
-                                                      '([0-9.]+)\s*([0-9.]+)', f_lines[x + 7])
-                            log_dict['AverageOpsPerSec'] = average_totals.group(1)
-                            log_dict['AverageLatency_ms'] = average_totals.group(4)
+            self.EXTRACTOR.extract(fl, log_dict)
+
+        # memtier --hdr-file-prefix writes one latency distribution per run (-x)
+        hgrm_files = glob.glob(os.path.join(os.path.dirname(log_file), '{}.memtier_FULL_RUN_*.hgrm'
+                                            .format(log_dict['TestConnections'])))
+        histograms = [LatencyHistogram.from_hgrm(hgrm) for hgrm in sorted(hgrm_files)]
+        if histograms:
+            log_dict['LatencyHistogram_us'] = histograms[0].merge(*histograms[1:]).encode()
         return log_dict
 
 
@@ -508,6 +559,18 @@ class RedisLogsReader(BaseLogsReader):
     Subclass for parsing Redis log files e.g.
     1.redis.set.get.log
     """
+    REQUESTS = '\s*([0-9.]+)\s*requests\s*per\s*second'
+    EXTRACTOR = LogExtractor([
+        Field('TotalRequests', '\s*([0-9]+)\s*requests\s*completed\s*in'),
+        Field('ParallelClients', '\s*([0-9]+)\s*parallel\s*clients'),
+        Field('Payload_bytes', '\s*([0-9]+)\s*bytes\s*payload'),
+        Field('SETRequestsPerSec', REQUESTS, anchor='.+\s*SET\s*.+'),
+        Field('GETRequestsPerSec', REQUESTS, anchor='.+\s*GET\s*.+')])
+    # redis-benchmark cumulative latency distribution of each test e.g. 99.12% <= 3 milliseconds
+    SECTION = re.compile('\s*======\s*(.+?)\s*======')
+    COMPLETED = re.compile('\s*([0-9]+)\s*requests\s*completed\s*in')
+    DISTRIBUTION = re.compile('\s*([0-9.]+)%\s*<=\s*([0-9.]+)\s*milliseconds')
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, host_type=None,
                  instance_size=None):
         super(RedisLogsReader, self).__init__(log_path)
@@ -545,37 +608,63 @@ class RedisLogsReader(BaseLogsReader):
         log_dict['GuestOS'] = summary['guest_os']
 
         with open(log_file, 'r') as fl:
-            f_lines = fl.readlines()
-            for x in range(0, len(f_lines)):
-                op_header = re.match('.+\s*([A-Z]{3})\s*.+', f_lines[x])
-                if op_header:
-                    op_type = op_header.group(1)
-                    for j in range(x, len(f_lines)):
-                        total_requests = re.match('\s*([0-9]+)\s*requests\s*completed\s*in',
-                                                  f_lines[j])
-                        if total_requests:
-                            if not log_dict.get('TotalRequests', None):
-                                log_dict['TotalRequests'] = total_requests.group(1)
-                        parallel_clients = re.match('\s*([0-9]+)\s*parallel\s*clients', f_lines[j])
-                        if parallel_clients:
-                            if not log_dict.get('ParallelClients', None):
-                                log_dict['ParallelClients'] = parallel_clients.group(1)
-                        payload = re.match('\s*([0-9]+)\s*bytes\s*payload', f_lines[j])
-                        if payload:
-                            if not log_dict.get('Payload_bytes', None):
-                                log_dict['Payload_bytes'] = payload.group(1)
-                        requests = re.match('\s*([0-9.]+)\s*requests\s*per\s*second', f_lines[j])
-                        if requests:
-                            if not log_dict.get(op_type + 'RequestsPerSec', None):
-                                log_dict[op_type + 'RequestsPerSec'] = requests.group(1)
+            self.EXTRACTOR.extract(fl, log_dict)
+        log_dict['LatencyHistogram_us'] = self.get_latency_histogram(log_file)
         return log_dict
 
+    def get_latency_histogram(self, log_file):
+        """
+        Build the latency histogram of a redis-benchmark run, merging the SET and GET tests.
+        redis-benchmark only reports the cumulative percentage of requests under each
+        millisecond, so the histogram has a 1ms resolution.
+        :param log_file: full path log file name
+        :return: <str> encoded histogram, None if the log has no latency distribution
+        """
+        sections = []
+        with open(log_file, 'r') as fl:
+            for line in fl:
+                if self.SECTION.match(line):
+                    sections.append({'total': 0, 'points': []})
+                elif sections:
+                    completed = self.COMPLETED.match(line)
+                    distribution = self.DISTRIBUTION.match(line)
+                    if completed:
+                        sections[-1]['total'] = int(completed.group(1))
+                    elif distribution:
+                        sections[-1]['points'].append((distribution.group(1),
+                                                       distribution.group(2)))
+        histograms = [LatencyHistogram.from_percentiles(section['points'], section['total'],
+                                                        scale=1000)
+                      for section in sections if section['points']]
+        if not histograms:
+            return None
+        return histograms[0].merge(*histograms[1:]).encode()
+
 
 class ApacheLogsReader(BaseLogsReader):
     """
     Subclass for parsing Apache bench log files e.g.
     1.apache.bench.log
     """
+    COMPLETE_REQUESTS = '\s*Complete\s*requests:\s*([0-9]+)'
+    # results of the concurrent ab instances are summed up, connection times averaged
+    AB_FIELDS = [
+        Field('WebServerVersion', '\s*Server\s*Software:\s*([a-zA-Z0-9./]+)'),
+        Field('Document_bytes', '\s*Document\s*Length:\s*([0-9]+)\s*bytes\s*'),
+        Field('ConcurrencyPerAbInstance', '\s*Concurrency\s*Level:\s*([0-9]+)'),
+        Field('CompleteRequests', COMPLETE_REQUESTS, convert=int,
+              reduce=lambda total, value: total + value),
+        Field('NumberOfAbInstances', COMPLETE_REQUESTS, convert=lambda value: 1,
+              reduce=lambda total, value: total + value),
+        Field('RequestsPerSec', '\s*Requests\s*per\s*second:\s*([0-9.]+)\s*', convert=float,
+              reduce=lambda total, value: round(total + value, 3)),
+        Field('TransferRate_KBps', '\s*Transfer\s*rate:\s*([0-9.]+)\s*', convert=float,
+              reduce=lambda total, value: round(total + value, 3)),
+        Field('MeanConnectionTimes_ms', '\s*Total:\s*([0-9.]+)\s*([0-9.]+)\s*([0-9.]+)'
+              '\s*([0-9.]+)\s*([0-9.]+)*', group=2, convert=float,
+              reduce=lambda mean, value: value if mean == 0 else round((mean + value) / 2, 3))]
+    EXTRACTOR = LogExtractor(AB_FIELDS)
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, host_type=None,
                  instance_size=None):
         super(ApacheLogsReader, self).__init__(log_path)
@@ -615,42 +704,7 @@ class ApacheLogsReader(BaseLogsReader):
         log_dict['GuestOS'] = summary['guest_os']
 
         with open(log_file, 'r') as fl:
-            for line in fl:
-                web_server_version = re.match('\s*Server\s*Software:\s*([a-zA-Z0-9./]+)', line)
-                if web_server_version:
-                    if not log_dict.get('WebServerVersion', None):
-                        log_dict['WebServerVersion'] = web_server_version.group(1)
-                doc_len = re.match('\s*Document\s*Length:\s*([0-9]+)\s*bytes\s*', line)
-                if doc_len:
-                    if not log_dict.get('Document_bytes', None):
-                        log_dict['Document_bytes'] = doc_len.group(1)
-                concurrency = re.match('\s*Concurrency\s*Level:\s*([0-9]+)', line)
-                if concurrency:
-                    if not log_dict.get('ConcurrencyPerAbInstance', None):
-                        log_dict['ConcurrencyPerAbInstance'] = concurrency.group(1)
-
-                requests = re.match('\s*Complete\s*requests:\s*([0-9]+)', line)
-                if requests:
-                    log_dict['CompleteRequests'] += int(requests.group(1))
-                    log_dict['NumberOfAbInstances'] += 1
-                req_sec = re.match('\s*Requests\s*per\s*second:\s*([0-9.]+)\s*', line)
-                if req_sec:
-                    r = round(log_dict['RequestsPerSec'] + float(req_sec.group(1)), 3)
-                    log_dict['RequestsPerSec'] = r
-                transfer = re.match('\s*Transfer\s*rate:\s*([0-9.]+)\s*', line)
-                if transfer:
-                    t = round(log_dict['TransferRate_KBps'] + float(transfer.group(1)), 3)
-                    log_dict['TransferRate_KBps'] = t
-                lat = re.match('\s*Total:\s*([0-9.]+)\s*([0-9.]+)\s*([0-9.]+)'
-                               '\s*([0-9.]+)\s*([0-9.]+)*', line)
-                if lat:
-                    if log_dict.get('MeanConnectionTimes_ms', None) == 0:
-                        log_dict['MeanConnectionTimes_ms'] = float(lat.group(2))
-                    else:
-                        mean = round((log_dict['MeanConnectionTimes_ms'] + float(
-                                lat.group(2))) / 2, 3)
-                        log_dict['MeanConnectionTimes_ms'] = mean
-        return log_dict
+            return self.EXTRACTOR.extract(fl, log_dict)
 
 
 class MariadbLogsReader(BaseLogsReader):
@@ -658,6 +712,18 @@ class MariadbLogsReader(BaseLogsReader):
     Subclass for parsing MariaDB log files e.g.
     1.sysbench.mariadb.run.log
     """
+    EXTRACTOR = LogExtractor([
+        Field('TestMode', '\s*Doing\s*([A-Z]+)\s*test\.'),
+        Field('Driver', '\s*No\s*DB\s*drivers\s*specified,\s*using\s*([a-z]+)'),
+        Field('TotalQueries', '\s*total:\s*([0-9]+)\s*'),
+        Field('TransactionsPerSec', '\s*transactions:\s*([0-9]+)\s*\(([0-9.]+)\s*per\s*sec\.\)',
+              group=2),
+        Field('DeadlocksPerSec', '\s*deadlocks:\s*([0-9]+)\s*\(([0-9.]+)\s*per\s*sec\.\)',
+              group=2),
+        Field('RWRequestsPerSec', '\s*read/write\s*requests:\s*([0-9]+)\s*\(([0-9.]+)\s*per'
+              '\s*sec\.\)', group=2),
+        Field('Latency95Percentile_ms', '\s*approx\.\s*95\s*percentile:\s*([0-9.]+)\s*ms')])
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, host_type=None,
                  instance_size=None, disk_setup=None):
         super(MariadbLogsReader, self).__init__(log_path)
@@ -698,31 +764,7 @@ class MariadbLogsReader(BaseLogsReader):
         log_dict['GuestOS'] = summary['guest_os']
 
         with open(log_file, 'r') as fl:
-            for line in fl:
-                test_mode = re.match('\s*Doing\s*([A-Z]+)\s*test\.', line)
-                if test_mode and not log_dict.get('TestMode', None):
-                    log_dict['TestMode'] = test_mode.group(1)
-                driver = re.match('\s*No\s*DB\s*drivers\s*specified,\s*using\s*([a-z]+)', line)
-                if driver and not log_dict.get('Driver', None):
-                    log_dict['Driver'] = driver.group(1)
-                total_q = re.match('\s*total:\s*([0-9]+)\s*', line)
-                if total_q and not log_dict.get('Total_queries', None):
-                    log_dict['TotalQueries'] = total_q.group(1)
-                trans = re.match('\s*transactions:\s*([0-9]+)\s*\(([0-9.]+)\s*per\s*sec\.\)', line)
-                if trans and not log_dict.get('Transactions_per_sec', None):
-                    log_dict['TransactionsPerSec'] = trans.group(2)
-                dead = re.match('\s*deadlocks:\s*([0-9]+)\s*\(([0-9.]+)\s*per\s*sec\.\)',
-                                line)
-                if dead and not log_dict.get('Deadlocks_per_sec', None):
-                    log_dict['DeadlocksPerSec'] = dead.group(2)
-                rw = re.match('\s*read/write\s*requests:\s*([0-9]+)\s*\(([0-9.]+)\s*per\s*sec\.\)',
-                              line)
-                if rw and not log_dict.get('RW_requests_per_sec', None):
-                    log_dict['RWRequestsPerSec'] = rw.group(2)
-                lat = re.match('\s*approx\.\s*95\s*percentile:\s*([0-9.]+)\s*ms', line)
-                if lat and not log_dict.get('Latency_95_percentile_ms', None):
-                    log_dict['Latency95Percentile_ms'] = lat.group(1)
-        return log_dict
+            return self.EXTRACTOR.extract(fl, log_dict)
 
 
 class MongodbLogsReader(BaseLogsReader):
@@ -730,6 +772,22 @@ class MongodbLogsReader(BaseLogsReader):
     Subclass for parsing MongoDB log files e.g.
     1.ycsb.run.log
     """
+    EXTRACTOR = LogExtractor([
+        Field('TotalOpsPerSec', '\s*\[OVERALL\],\s*Throughput\(ops/sec\),\s*([0-9.]+)',
+              convert=lambda value: round(float(value), 3)),
+        Field('ReadOps', '\s*\[READ\],\s*Operations,\s*([0-9.]+)'),
+        Field('ReadLatency95Percentile_us',
+              '\s*\[READ\],\s*95thPercentileLatency\(us\),\s*([0-9.]+)'),
+        Field('CleanupOps', '\s*\[CLEANUP\],\s*Operations,\s*([0-9.]+)'),
+        Field('CleanupLatency95Percentile_us',
+              '\s*\[CLEANUP\],\s*95thPercentileLatency\(us\),\s*([0-9.]+)'),
+        Field('UpdateOps', '\s*\[UPDATE\],\s*Operations,\s*([0-9.]+)'),
+        Field('UpdateLatency95Percentile_us',
+              '\s*\[UPDATE\],\s*95thPercentileLatency\(us\),\s*([0-9.]+)'),
+        Field('ReadFailedOps', '\s*\[READ-FAILED\],\s*Operations,\s*([0-9.]+)'),
+        Field('ReadFailedLatency95Percentile_us',
+              '\s*\[READ-FAILED\],\s*95thPercentileLatency\(us\),\s*([0-9.]+)')])
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, host_type=None,
                  instance_size=None, disk_setup=None):
         super(MongodbLogsReader, self).__init__(log_path)
@@ -775,40 +833,7 @@ class MongodbLogsReader(BaseLogsReader):
         log_dict['GuestOS'] = summary['guest_os']
 
         with open(log_file, 'r') as fl:
-            for line in fl:
-                throughput = re.match('\s*\[OVERALL\],\s*Throughput\(ops/sec\),\s*([0-9.]+)', line)
-                if throughput and not log_dict.get('TotalOpsPerSec', None):
-                    log_dict['TotalOpsPerSec'] = round(float(throughput.group(1)), 3)
-                read_ops = re.match('\s*\[READ\],\s*Operations,\s*([0-9.]+)', line)
-                if read_ops and not log_dict.get('ReadOps', None):
-                    log_dict['ReadOps'] = read_ops.group(1)
-                read_lat = re.match('\s*\[READ\],\s*95thPercentileLatency\(us\),\s*([0-9.]+)',
-                                    line)
-                if read_lat and not log_dict.get('ReadLatency95Percentile_us', None):
-                    log_dict['ReadLatency95Percentile_us'] = read_lat.group(1)
-                clean_ops = re.match('\s*\[CLEANUP\],\s*Operations,\s*([0-9.]+)', line)
-                if clean_ops and not log_dict.get('CleanupOps', None):
-                    log_dict['CleanupOps'] = clean_ops.group(1)
-                clean_lat = re.match('\s*\[CLEANUP\],\s*95thPercentileLatency\(us\),\s*([0-9.]+)',
-                                     line)
-                if clean_lat and not log_dict.get('CleanupLatency95Percentile_us', None):
-                    log_dict['CleanupLatency95Percentile_us'] = clean_lat.group(1)
-                update_ops = re.match('\s*\[UPDATE\],\s*Operations,\s*([0-9.]+)', line)
-                if update_ops and not log_dict.get('UpdateOps', None):
-                    log_dict['UpdateOps'] = update_ops.group(1)
-                update_lat = re.match('\s*\[UPDATE\],\s*95thPercentileLatency\(us\),\s*([0-9.]+)',
-                                      line)
-                if update_lat and not log_dict.get('UpdateLatency95Percentile_us', None):
-                    log_dict['UpdateLatency95Percentile_us'] = update_lat.group(1)
-                read_fail_ops = re.match('\s*\[READ-FAILED\],\s*Operations,\s*([0-9.]+)',
-                                         line)
-                if read_fail_ops and not log_dict.get('ReadFailedOps', None):
-                    log_dict['ReadFailedOps'] = read_fail_ops.group(1)
-                read_fail_lat = re.match('\s*\[READ-FAILED\],\s*95thPercentile'
-                                         'Latency\(us\),\s*([0-9.]+)', line)
-                if read_fail_lat and not log_dict.get('ReadFailedLatency95Percentile_us', None):
-                    log_dict['ReadFailedLatency95Percentile_us'] = read_fail_lat.group(1)
-        return log_dict
+            return self.EXTRACTOR.extract(fl, log_dict)
 
 
 class ZookeeperLogsReader(BaseLogsReader):
@@ -816,6 +841,24 @@ class ZookeeperLogsReader(BaseLogsReader):
     Subclass for parsing Zookeeper log files e.g.
     1.zookeeper.latency.log
     """
+    # calls per second of all the zookeeper clients are summed up
+    EXTRACTOR = LogExtractor([
+        Field('TotalCreatedCallsPerSec', '\s*created\s*([0-9]+)\s*permanent\s*znodes\s*in'
+              '\s*([0-9]+)\s*ms\s*\(([0-9.]+)\s*ms/op\s*([0-9.]+)/sec\)', group=4,
+              convert=float, reduce=lambda total, value: round(total + value, 3)),
+        Field('TotalSetCallsPerSec', '\s*set\s*([0-9]+)\s*znodes\s*in\s*([0-9]+)\s*ms\s*'
+              '\(([0-9.]+)\s*ms/op\s*([0-9.]+)/sec\)', group=4,
+              convert=float, reduce=lambda total, value: round(total + value, 3)),
+        Field('TotalGetCallsPerSec', '\s*get\s*([0-9]+)\s*znodes\s*in\s*([0-9]+)\s*ms\s*'
+              '\(([0-9.]+)\s*ms/op\s*([0-9.]+)/sec\)', group=4,
+              convert=float, reduce=lambda total, value: round(total + value, 3)),
+        Field('TotalDeletedCallsPerSec', '\s*deleted\s*([0-9]+)\s*permanent\s*znodes\s*in'
+              '\s*([0-9]+)\s*ms\s*\(([0-9.]+)\s*ms/op\s*([0-9.]+)/sec\)', group=4,
+              convert=float, reduce=lambda total, value: round(total + value, 3)),
+        Field('TotalWatchedCallsPerSec', '\s*watched\s*([0-9]+)\s*znodes\s*in\s*([0-9]+)'
+              '\s*ms\s*\(([0-9.]+)\s*ms/op\s*([0-9.]+)/sec\)', group=4,
+              convert=float, reduce=lambda total, value: round(total + value, 3))])
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, host_type=None,
                  instance_size=None, cluster_setup=None):
         super(ZookeeperLogsReader, self).__init__(log_path)
@@ -857,33 +900,7 @@ class ZookeeperLogsReader(BaseLogsReader):
         log_dict['GuestOS'] = summary['guest_os']
 
         with open(log_file, 'r') as fl:
-            for line in fl:
-                created = re.match('\s*created\s*([0-9]+)\s*permanent\s*znodes\s*in\s*([0-9]+)'
-                                   '\s*ms\s*\(([0-9.]+)\s*ms/op\s*([0-9.]+)/sec\)', line)
-                if created:
-                    r = round(log_dict['TotalCreatedCallsPerSec'] + float(created.group(4)), 3)
-                    log_dict['TotalCreatedCallsPerSec'] = r
-                set_ops = re.match('\s*set\s*([0-9]+)\s*znodes\s*in\s*([0-9]+)\s*ms\s*\(([0-9.]+)'
-                                   '\s*ms/op\s*([0-9.]+)/sec\)', line)
-                if set_ops:
-                    r = round(log_dict['TotalSetCallsPerSec'] + float(set_ops.group(4)), 3)
-                    log_dict['TotalSetCallsPerSec'] = r
-                get_ops = re.match('\s*get\s*([0-9]+)\s*znodes\s*in\s*([0-9]+)\s*ms\s*\(([0-9.]+)'
-                                   '\s*ms/op\s*([0-9.]+)/sec\)', line)
-                if get_ops:
-                    r = round(log_dict['TotalGetCallsPerSec'] + float(get_ops.group(4)), 3)
-                    log_dict['TotalGetCallsPerSec'] = r
-                deleted = re.match('\s*deleted\s*([0-9]+)\s*permanent\s*znodes\s*in\s*([0-9]+)'
-                                   '\s*ms\s*\(([0-9.]+)\s*ms/op\s*([0-9.]+)/sec\)', line)
-                if deleted:
-                    r = round(log_dict['TotalDeletedCallsPerSec'] + float(deleted.group(4)), 3)
-                    log_dict['TotalDeletedCallsPerSec'] = r
-                watched = re.match('\s*watched\s*([0-9]+)\s*znodes\s*in\s*([0-9]+)\s*ms'
-                                   '\s*\(([0-9.]+)\s*ms/op\s*([0-9.]+)/sec\)', line)
-                if watched:
-                    r = round(log_dict['TotalWatchedCallsPerSec'] + float(watched.group(4)), 3)
-                    log_dict['TotalWatchedCallsPerSec'] = r
-        return log_dict
+            return self.EXTRACTOR.extract(fl, log_dict)
 
 
 class TerasortLogsReader(BaseLogsReader):
@@ -946,6 +963,15 @@ class TCPLogsReader(BaseLogsReader):
     Subclass for parsing TCP log files e.g.
     XXX_ntttcp-sender.log
     """
+    EXTRACTOR = LogExtractor([
+        Field('Throughput_Gbps', '.+throughput.+:([0-9.]+)', convert=str.strip),
+        Field('PacketSize_KBytes', '\s*Average\s*Package\s*Size:\s*([0-9.]+)', convert=str.strip)])
+    LAT_EXTRACTOR = LogExtractor([
+        Field('IPVersion', 'domain:.+(IPv[4,6])', convert=str.strip),
+        Field('ProtocolType', 'protocol:.+([A-Z]{3})', convert=str.strip),
+        Field('Latency_ms', '.+Average\s*=\s*([0-9.]+)\s*([a-z]+)', group=(1, 2),
+              convert=unit_converter(BaseLogsReader.UNIT, 'ms'))])
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, provider=None,
                  region=None, host_type=None, instance_size=None):
         super(TCPLogsReader, self).__init__(log_path)
@@ -986,33 +1012,11 @@ class TCPLogsReader(BaseLogsReader):
         log_dict['GuestOSType'] = 'Linux'
 
         with open(log_file, 'r') as fl:
-            for x in fl:
-                if not log_dict.get('Throughput_Gbps', None):
-                    throughput = re.match('.+throughput.+:([0-9.]+)', x)
-                    if throughput:
-                        log_dict['Throughput_Gbps'] = throughput.group(1).strip()
-                if not log_dict.get('PacketSize_KBytes', None):
-                    pkg_size = re.match('\s*Average\s*Package\s*Size:\s*([0-9.]+)', x)
-                    if pkg_size:
-                        log_dict['PacketSize_KBytes'] = pkg_size.group(1).strip()
+            self.EXTRACTOR.extract(fl, log_dict)
         lat_file = os.path.join(os.path.dirname(os.path.abspath(log_file)),
                                 '{}_lagscope.log'.format(log_dict['NumberOfConnections']))
         with open(lat_file, 'r') as fl:
-            for x in fl:
-                if not log_dict.get('IPVersion', None):
-                    ip_version = re.match('domain:.+(IPv[4,6])', x)
-                    if ip_version:
-                        log_dict['IPVersion'] = ip_version.group(1).strip()
-                if not log_dict.get('ProtocolType', None):
-                    ip_proto = re.match('protocol:.+([A-Z]{3})', x)
-                    if ip_proto:
-                        log_dict['ProtocolType'] = ip_proto.group(1).strip()
-                latency = re.match('.+Average\s*=\s*([0-9.]+)\s*([a-z]+)', x)
-                if latency:
-                    unit = latency.group(2).strip()
-                    log_dict['Latency_ms'] = self._convert(float(latency.group(1).strip()),
-                                                           self.UNIT[unit], self.UNIT['ms'])
-        return log_dict
+            return self.LAT_EXTRACTOR.extract(fl, log_dict)
 
 
 class LatencyLogsReader(BaseLogsReader):
@@ -1020,6 +1024,16 @@ class LatencyLogsReader(BaseLogsReader):
     Subclass for parsing lagscope log files e.g.
     lagscope.log
     """
+    EXTRACTOR = LogExtractor([
+        Field('IPVersion', 'domain:.+(IPv[4,6])', convert=str.strip),
+        Field('ProtocolType', 'protocol:.+([A-Z]{3})', convert=str.strip),
+        Field('MinLatency_us', '.+Minimum\s*=\s*([0-9.]+)\s*([a-z]+)', group=(1, 2),
+              convert=unit_converter(BaseLogsReader.UNIT, 'us')),
+        Field('AverageLatency_us', '.+Average\s*=\s*([0-9.]+)\s*([a-z]+)', group=(1, 2),
+              convert=unit_converter(BaseLogsReader.UNIT, 'us')),
+        Field('MaxLatency_us', '.+Maximum\s*=\s*([0-9.]+)\s*([a-z]+)', group=(1, 2),
+              convert=unit_converter(BaseLogsReader.UNIT, 'us'))])
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, provider=None,
                  region=None, host_type=None, instance_size=None):
         super(LatencyLogsReader, self).__init__(log_path)
@@ -1061,31 +1075,7 @@ class LatencyLogsReader(BaseLogsReader):
         log_dict['GuestOSType'] = 'Linux'
 
         with open(log_file, 'r') as fl:
-            for x in fl:
-                if not log_dict.get('IPVersion', None):
-                    ip_version = re.match('domain:.+(IPv[4,6])', x)
-                    if ip_version:
-                        log_dict['IPVersion'] = ip_version.group(1).strip()
-                if not log_dict.get('ProtocolType', None):
-                    ip_proto = re.match('protocol:.+([A-Z]{3})', x)
-                    if ip_proto:
-                        log_dict['ProtocolType'] = ip_proto.group(1).strip()
-                min_latency = re.match('.+Minimum\s*=\s*([0-9.]+)\s*([a-z]+)', x)
-                if min_latency:
-                    unit = min_latency.group(2).strip()
-                    log_dict['MinLatency_us'] = self._convert(float(min_latency.group(1).strip()),
-                                                              self.UNIT[unit], self.UNIT['us'])
-                avg_latency = re.match('.+Average\s*=\s*([0-9.]+)\s*([a-z]+)', x)
-                if avg_latency:
-                    unit = avg_latency.group(2).strip()
-                    log_dict['AverageLatency_us'] = self._convert(
-                            float(avg_latency.group(1).strip()), self.UNIT[unit], self.UNIT['us'])
-                max_latency = re.match('.+Maximum\s*=\s*([0-9.]+)\s*([a-z]+)', x)
-                if max_latency:
-                    unit = max_latency.group(2).strip()
-                    log_dict['MaxLatency_us'] = self._convert(float(max_latency.group(1).strip()),
-                                                              self.UNIT[unit], self.UNIT['us'])
-        return log_dict
+            return self.EXTRACTOR.extract(fl, log_dict)
 
 
 class UDPLogsReader(BaseLogsReader):
@@ -1414,6 +1404,19 @@ class PostgreSQLLogsReader(BaseLogsReader):
     Subclass for parsing postgresql log files e.g.
     ***_***.log
     """
+    EXTRACTOR = LogExtractor([
+        Field('TransactionType', '\s*transaction\s*type:\s*<builtin:\s*(\S+\s*\S+|\S+)'
+              '(\s*\(.*|\s*)>', convert=str.strip),
+        Field('ScalingFactor', '\s*scaling\s*factor:\s*([0-9.]+)', convert=int),
+        Field('TestClients', '\s*number\s*of\s*clients:\s*([0-9]+)', convert=int),
+        Field('Threads', '\s*number\s*of\s*threads:\s*([0-9]+)', convert=int),
+        Field('TestDuration_s', '\s*duration:\s*([0-9]+)\s*s', convert=int),
+        Field('AverageLatency_ms', '\s*latency\s*average\s*=\s*([0-9.]+)\s*ms', convert=float),
+        Field('TransactionsPerSecIncEstablishing', '\s*tps\s*=\s*([0-9.]+)\s*'
+              '\(including connections establishing\)', convert=float),
+        Field('TransactionsPerSecExcEstablishing', '\s*tps\s*=\s*([0-9.]+)\s*'
+              '\(excluding connections establishing\)', convert=float)])
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, provider=None,
                  region=None, host_type=None, instance_size=None, disk_setup=None):
         super(PostgreSQLLogsReader, self).__init__(log_path)
@@ -1453,42 +1456,7 @@ class PostgreSQLLogsReader(BaseLogsReader):
         log_dict['PostgreSQLVersion'] = summary['postgresql_version']
 
         with open(log_file, 'r') as fl:
-            for f_line in fl:
-                if not log_dict.get('TransactionType', None):
-                    transaction = re.match('\s*transaction\s*type:\s*<builtin:\s*(\S+\s*\S+|\S+)(\s*\(.*|\s*)>', f_line)
-                    if transaction:
-                        log_dict['TransactionType'] = transaction.group(1).strip()
-                if not log_dict.get('ScalingFactor', None):
-                    scale = re.match('\s*scaling\s*factor:\s*([0-9.]+)', f_line)
-                    if scale:
-                        log_dict['ScalingFactor'] = int(scale.group(1).strip())
-                if not log_dict.get('TestClients', None):
-                    test_clients = re.match('\s*number\s*of\s*clients:\s*([0-9]+)', f_line)
-                    if test_clients:
-                        log_dict['TestClients'] = int(test_clients.group(1).strip())
-                if not log_dict.get('Threads', None):
-                    threads = re.match('\s*number\s*of\s*threads:\s*([0-9]+)', f_line)
-                    if threads:
-                        log_dict['Threads'] = int(threads.group(1).strip())
-                if not log_dict.get('TestDuration_s', None):
-                    duration = re.match('\s*duration:\s*([0-9]+)\s*s', f_line)
-                    if duration:
-                        log_dict['TestDuration_s'] = int(duration.group(1).strip())
-                if not log_dict.get('AverageLatency_ms', None):
-                    lat = re.match('\s*latency\s*average\s*=\s*([0-9.]+)\s*ms', f_line)
-                    if lat:
-                        log_dict['AverageLatency_ms'] = float(lat.group(1).strip())
-                if not log_dict.get('TransactionsPerSecIncEstablishing', None):
-                    tps = re.match('\s*tps\s*=\s*([0-9.]+)\s*'
-                                   '\(including connections establishing\)', f_line)
-                    if tps:
-                        log_dict['TransactionsPerSecIncEstablishing'] = float(tps.group(1).strip())
-                if not log_dict.get('TransactionsPerSecExcEstablishing', None):
-                    tps = re.match('\s*tps\s*=\s*([0-9.]+)\s*'
-                                   '\(excluding connections establishing\)', f_line)
-                    if tps:
-                        log_dict['TransactionsPerSecExcEstablishing'] = float(tps.group(1).strip())
-        return log_dict
+            return self.EXTRACTOR.extract(fl, log_dict)
 
 
 class SchedulerLogsReader(BaseLogsReader):
@@ -1496,6 +1464,17 @@ class SchedulerLogsReader(BaseLogsReader):
     Subclass for parsing scheduler logs e.g.
     ***.***.log
     """
+    EXTRACTORS = {
+        'hackbench': LogExtractor([
+            Field('Loops', '\s*Each\s*sender\s*will\s*pass\s*([0-9.]+)\s*messages\s*of'
+                  '\s*([0-9.]+)\s*bytes', group=1, convert=int),
+            Field('DataSize_bytes', '\s*Each\s*sender\s*will\s*pass\s*([0-9.]+)\s*messages\s*of'
+                  '\s*([0-9.]+)\s*bytes', group=2, convert=int),
+            Field('Latency_sec', '\s*Time:\s*([0-9.]+)', convert=float)]),
+        'schbench': LogExtractor([
+            Field('Latency95thPercentile_us', '\s*95.0000th:\s*([0-9.]+)', convert=float),
+            Field('Latency99thPercentile_us', '\s*\*99.0000th:\s*([0-9.]+)', convert=float)])}
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, provider=None,
                  region=None, host_type=None, instance_size=None, disk_setup=None):
         super(SchedulerLogsReader, self).__init__(log_path)
@@ -1544,28 +1523,10 @@ class SchedulerLogsReader(BaseLogsReader):
             log_dict['MessageThreads'] = int(f_match.group(2).strip())
             log_dict['WorkerThreads'] = 16
 
-        with open(log_file, 'r') as fl:
-            for f_line in fl:
-                if log_dict['TestMode'] == 'hackbench':
-                    sizes = re.match('\s*Each\s*sender\s*will\s*pass\s*([0-9.]+)'
-                                     '\s*messages\s*of\s*([0-9.]+)\s*bytes', f_line)
-                    if sizes:
-                        log_dict['Loops'] = int(sizes.group(1).strip())
-                        log_dict['DataSize_bytes'] = int(sizes.group(2).strip())
-                    if not log_dict.get('Latency_sec', None):
-                        lat_sec = re.match('\s*Time:\s*([0-9.]+)', f_line)
-                        if lat_sec:
-                            log_dict['Latency_sec'] = float(lat_sec.group(1).strip())
-                elif log_dict['TestMode'] == 'schbench':
-                    if not log_dict.get('Latency95thPercentile_us', None):
-                        lat_95 = re.match('\s*95.0000th:\s*([0-9.]+)', f_line)
-                        if lat_95:
-                            log_dict['Latency95thPercentile_us'] = float(lat_95.group(1).strip())
-                    if not log_dict.get('Latency99thPercentile_us', None):
-                        lat_99 = re.match('\s*\*99.0000th:\s*([0-9.]+)', f_line)
-                        if lat_99:
-                            log_dict['Latency99thPercentile_us'] = float(lat_99.group(1).strip())
-
+        extractor = self.EXTRACTORS.get(log_dict['TestMode'], None)
+        if extractor:
+            with open(log_file, 'r') as fl:
+                extractor.extract(fl, log_dict)
         return log_dict
 
 class LAMPWordpressLogsReader(BaseLogsReader):
@@ -1573,6 +1534,9 @@ class LAMPWordpressLogsReader(BaseLogsReader):
     Subclass for parsing Apache bench log files e.g.
     1.apache.bench.log
     """
+    EXTRACTOR = LogExtractor([field for field in ApacheLogsReader.AB_FIELDS
+                              if field.name != 'Document_bytes'])
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, host_type=None,
                  instance_size=None):
         super(LAMPWordpressLogsReader, self).__init__(log_path)
@@ -1614,39 +1578,7 @@ class LAMPWordpressLogsReader(BaseLogsReader):
         log_dict['PhpVersion'] = summary['php_version']
 
         with open(log_file, 'r') as fl:
-            for line in fl:
-                web_server_version = re.match('\s*Server\s*Software:\s*([a-zA-Z0-9./]+)', line)
-                if web_server_version:
-                    if not log_dict.get('WebServerVersion', None):
-                        log_dict['WebServerVersion'] = web_server_version.group(1)
-
-                concurrency = re.match('\s*Concurrency\s*Level:\s*([0-9]+)', line)
-                if concurrency:
-                    if not log_dict.get('ConcurrencyPerAbInstance', None):
-                        log_dict['ConcurrencyPerAbInstance'] = concurrency.group(1)
-
-                requests = re.match('\s*Complete\s*requests:\s*([0-9]+)', line)
-                if requests:
-                    log_dict['CompleteRequests'] += int(requests.group(1))
-                    log_dict['NumberOfAbInstances'] += 1
-                req_sec = re.match('\s*Requests\s*per\s*second:\s*([0-9.]+)\s*', line)
-                if req_sec:
-                    r = round(log_dict['RequestsPerSec'] + float(req_sec.group(1)), 3)
-                    log_dict['RequestsPerSec'] = r
-                transfer = re.match('\s*Transfer\s*rate:\s*([0-9.]+)\s*', line)
-                if transfer:
-                    t = round(log_dict['TransferRate_KBps'] + float(transfer.group(1)), 3)
-                    log_dict['TransferRate_KBps'] = t
-                lat = re.match('\s*Total:\s*([0-9.]+)\s*([0-9.]+)\s*([0-9.]+)'
-                               '\s*([0-9.]+)\s*([0-9.]+)*', line)
-                if lat:
-                    if log_dict.get('MeanConnectionTimes_ms', None) == 0:
-                        log_dict['MeanConnectionTimes_ms'] = float(lat.group(2))
-                    else:
-                        mean = round((log_dict['MeanConnectionTimes_ms'] + float(
-                                lat.group(2))) / 2, 3)
-                        log_dict['MeanConnectionTimes_ms'] = mean
-        return log_dict
+            return self.EXTRACTOR.extract(fl, log_dict)
 
 
 class NodejsLogsReader(BaseLogsReader):
@@ -1701,6 +1633,9 @@ class ElasticsearchLogsReader(BaseLogsReader):
     Subclass for Elasticsearch log files e.g.
     rally_out_*.log
     """
+    RACE_SAMPLES = 100000
+    PERCENTILE_KEY = re.compile('^[0-9]+(_[0-9]+)?$')
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, host_type=None,
                  instance_size=None, cluster_setup=None):
         super(ElasticsearchLogsReader, self).__init__(log_path)
@@ -1717,6 +1652,35 @@ class ElasticsearchLogsReader(BaseLogsReader):
         self.cluster_setup = cluster_setup
         self.log_matcher = 'rally_out_\S+.log'
 
+    def get_race_histograms(self, log_dir, track):
+        """
+        Build the per task latency histograms from the rally race.json reports of a track.
+        Rally only keeps the latency percentiles in the report, so each race is weighted with
+        RACE_SAMPLES samples when the histograms are merged.
+        :param log_dir: directory containing the race_*.json reports
+        :param track: rally track name
+        :return: <dict> {'task name': 'encoded histogram', ...}
+        """
+        histograms = {}
+        races = []
+        for race_file in sorted(glob.glob(os.path.join(log_dir, 'race_*.json'))):
+            with open(race_file, 'r') as fl:
+                race = json.load(fl)
+            if race.get('track', None) == track:
+                races.append(race)
+        if not races:
+            return histograms
+        # the latest race of the track is reported
+        for op_metrics in races[-1].get('results', {}).get('op_metrics', []):
+            latency = op_metrics.get('latency', {})
+            # percentile keys e.g. 99_9, other keys such as unit or mean are skipped
+            points = [(float(key.replace('_', '.')), value) for key, value in latency.items()
+                      if self.PERCENTILE_KEY.match(key)]
+            histograms[op_metrics.get('task', op_metrics.get('operation'))] = \
+                LatencyHistogram.from_percentiles(points, self.RACE_SAMPLES,
+                                                  scale=1000).encode()
+        return histograms
+
     def collect_data(self, f_match, log_file, log_dict):
         """
         Customized data collect for Elasticsearch test case.
@@ -1799,7 +1763,11 @@ class ElasticsearchLogsReader(BaseLogsReader):
                     else:
                         createVar[dict_name][table_field_name[match.group(1)]] = float(match.group(3))
 
+        race_histograms = self.get_race_histograms(os.path.dirname(log_file),
+                                                   log_dict.get('TrackName', None))
         for dict_var in dict_vars_list:
+            createVar[dict_var]['LatencyHistogram_us'] = race_histograms.get(
+                    createVar[dict_var]['TaskName'], None)
             log_dict_list.append(createVar[dict_var])
 
         return log_dict_list
@@ -1809,6 +1777,21 @@ class KafkaLogsReader(BaseLogsReader):
     Subclass for parsing kafka log files e.g.
     1.apache.bench.log
     """
+    RECORDS = '([0-9]+)\s*records\s*sent,\s*([0-9.]+)\s*records/sec\s*\(([0-9.]+)\s*MB/sec\),' \
+              '\s*([0-9.]+)\s*ms\s*avg\s*latency,\s*([0-9.]+)\s+ms\s*max\s*latency,' \
+              '\s*([0-9.]+)\s*ms\s*50th,\s*([0-9.]+)\s*ms\s*95th,\s*([0-9.]+)\s*ms\s*99th,' \
+              '\s*([0-9.]+)\s*ms\s*99.9th.*'
+    EXTRACTOR = LogExtractor([
+        Field('RecordNum', RECORDS, group=1, convert=int),
+        Field('RecordsPerSec', RECORDS, group=2, convert=float),
+        Field('Throughput_MBps', RECORDS, group=3, convert=float),
+        Field('AverageLatency_ms', RECORDS, group=4, convert=float),
+        Field('MaxLatency_ms', RECORDS, group=5, convert=float),
+        Field('Latency50Percentile_ms', RECORDS, group=6, convert=float),
+        Field('Latency95Percentile_ms', RECORDS, group=7, convert=float),
+        Field('Latency99Percentile_ms', RECORDS, group=8, convert=float),
+        Field('Latency999Percentile_ms', RECORDS, group=9, convert=float)])
+
     def __init__(self, log_path=None, test_case_name=None, data_path=None, host_type=None,
                  instance_size=None, cluster_setup=None):
         super(KafkaLogsReader, self).__init__(log_path)
@@ -1860,36 +1843,34 @@ class KafkaLogsReader(BaseLogsReader):
         log_dict['GuestOS'] = summary['guest_os']
 
         with open(log_file, 'r') as fl:
-            for line in fl:
-                match=re.match('([0-9]+)\s*records\s*sent,\s*([0-9.]+)\s*records/sec\s*\(([0-9.]+)\s*MB/sec\),'
-                               '\s*([0-9.]+)\s*ms\s*avg\s*latency,\s*([0-9.]+)\s+ms\s*max\s*latency,'
-                               '\s*([0-9.]+)\s*ms\s*50th,\s*([0-9.]+)\s*ms\s*95th,\s*([0-9.]+)\s*ms\s*99th,'
-                               '\s*([0-9.]+)\s*ms\s*99.9th.*',line)
-                if match:
-                    if not log_dict.get('RecordNum', None):
-                        log_dict['RecordNum'] = int(match.group(1))
-                    if not log_dict.get('RecordsPerSec', None):
-                        log_dict['RecordsPerSec'] = float(match.group(2))
-                    if not log_dict.get('Throughput_MBps', None):
-                        log_dict['Throughput_MBps'] = float(match.group(3))
-                    if not log_dict.get('AverageLatency_ms', None):
-                        log_dict['AverageLatency_ms'] = float(match.group(4))
-                    if not log_dict.get('MaxLatency_ms', None):
-                        log_dict['MaxLatency_ms'] = float(match.group(5))
-                    if not log_dict.get('Latency50Percentile_ms', None):
-                        log_dict['Latency50Percentile_ms'] = float(match.group(6))
-                    if not log_dict.get('Latency95Percentile_ms', None):
-                        log_dict['Latency95Percentile_ms'] = float(match.group(7))
-                    if not log_dict.get('Latency99Percentile_ms', None):
-                        log_dict['Latency99Percentile_ms'] = float(match.group(8))
-                    if not log_dict.get('Latency999Percentile_ms', None):
-                        log_dict['Latency999Percentile_ms'] = float(match.group(9))
+            self.EXTRACTOR.extract(fl, log_dict)
+
+        # ProducerPerformance only reports a percentile summary of the per-record latencies
+        log_dict['LatencyHistogram_us'] = None
+        if log_dict['RecordNum']:
+            log_dict['LatencyHistogram_us'] = LatencyHistogram.from_percentiles(
+                    [(50, log_dict['Latency50Percentile_ms']),
+                     (95, log_dict['Latency95Percentile_ms']),
+                     (99, log_dict['Latency99Percentile_ms']),
+                     (99.9, log_dict['Latency999Percentile_ms']),
+                     (100, log_dict['MaxLatency_ms'])],
+                    log_dict['RecordNum'], scale=1000).encode()
         return log_dict
 
+
 class TensorflowLogsReader(BaseLogsReader):
     """
     Subclass for parsing Tensorflow bench log files
     """
+    EXTRACTOR = LogExtractor([
+        Field('TensorflowVersion', '\s*TensorFlow:\s*(.*)\s*'),
+        Field('BatchSize', '\s*Batch size:\s*(\d+)\s*', convert=int),
+        Field('Model', '\s*Model:\s*(.*)\s*'),
+        Field('Device', r'\s*Devices:.*/(.*):\s*'),
+        Field('DataFormat', '\s*Data format:\s*(.*)\s*'),
+        Field('ImagesPerSec', '\s*total images/sec:\s*(.*)\s*'),
+        Field('RuntimeSec', '\s*RuntimeSec:\s*(.*)\s*')])
+
     def __init__(self, log_path=None, test_case_name=None, host_type=None,
                  instance_size=None):
         super(TensorflowLogsReader, self).__init__(log_path)
@@ -1931,35 +1912,7 @@ class TensorflowLogsReader(BaseLogsReader):
         log_dict['NumGpus'] = summary['gpucount']
 
         with open(log_file, 'r') as fl:
-            for line in fl:
-                tensorflow_version = re.match('\s*TensorFlow:\s*(.*)\s*', line)
-                if tensorflow_version:
-                    if not log_dict.get('TensorflowVersion', None):
-                        log_dict['TensorflowVersion'] = tensorflow_version.group(1)
-                batchsize = re.match('\s*Batch size:\s*(\d+)\s*', line)
-                if batchsize:
-                    if not log_dict.get('BatchSize', None):
-                        log_dict['BatchSize'] = int(batchsize.group(1))
-                model = re.match('\s*Model:\s*(.*)\s*', line)
-                if model:
-                    if not log_dict.get('Model', None):
-                        log_dict['Model'] = model.group(1)
-                device = re.match(r'\s*Devices:.*/(.*):\s*', line)
-                if device:
-                    if not log_dict.get('Device', None):
-                        log_dict['Device'] = device.group(1)
-                dataformat = re.match('\s*Data format:\s*(.*)\s*', line)
-                if dataformat:
-                    if not log_dict.get('DataFormat', None):
-                        log_dict['DataFormat'] = dataformat.group(1)
-                image_per_sec = re.match('\s*total images/sec:\s*(.*)\s*', line)
-                if image_per_sec:
-                    if not log_dict.get('ImagesPerSec', None):
-                        log_dict['ImagesPerSec'] = image_per_sec.group(1)
-                runtime_sec = re.match('\s*RuntimeSec:\s*(.*)\s*', line)
-                if runtime_sec:
-                    if not log_dict.get('RuntimeSec', None):
-                        log_dict['RuntimeSec'] = runtime_sec.group(1)
+            self.EXTRACTOR.extract(fl, log_dict)
         if log_dict['ImagesPerSec'] == None:
             return None
         else:
@@ -0,0 +1,293 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+PENDING = 'pending'
+UPLOADED = 'uploaded'
+
+
+class ResultsSpool(object):
+    """
+    Durable local spool for parsed results, backed by a SQLite file. Each entry holds the rows
+    of one upload_results call and is keyed by the hash of its table and rows, so spooling the
+    same results twice (e.g. re-parsing a results folder) only uploads them once.
+    """
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS spool ('
+              'key TEXT PRIMARY KEY, table_name TEXT NOT NULL, config_path TEXT NOT NULL, '
+              'rows TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, '
+              'next_attempt REAL NOT NULL DEFAULT 0, last_error TEXT, created REAL NOT NULL, '
+              'uploaded REAL)')
+    BACKOFF_BASE = 5
+    BACKOFF_MAX = 30 * 60
+
+    def __init__(self, path):
+        """
+        Open or create the spool.
+        :param path: SQLite spool file path
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(self.SCHEMA)
+
+    @staticmethod
+    def get_key(table_name, rows):
+        """
+        Idempotency key of the spooled rows.
+        :param table_name: DB table name
+        :param rows: list of row dicts
+        :return: <str> sha1 hex digest
+        """
+        data = json.dumps([table_name, rows], sort_keys=True, default=str)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def add(self, table_name, config_path, rows):
+        """
+        Durably spool the rows to be uploaded in table_name.
+        :param table_name: DB table name
+        :param config_path: credentials config file used for the upload
+        :param rows: list of row dicts
+        :return: <str> entry key
+        """
+        key = self.get_key(table_name, rows)
+        with self.lock:
+            cursor = self.db.execute(
+                    'INSERT OR IGNORE INTO spool (key, table_name, config_path, rows, status, '
+                    'created) VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, table_name, config_path, json.dumps(rows, default=str), PENDING,
+                     time.time()))
+        if not cursor.rowcount:
+            log.info('Results {} already spooled for {}, skipping.'.format(key, table_name))
+        return key
+
+    def entries(self, status=None, due=False):
+        """
+        List the spool entries, oldest first.
+        :param status: optional status filter e.g. PENDING
+        :param due: only return the entries whose retry delay expired
+        :return: list of entry dicts, with the rows decoded
+        """
+        query = 'SELECT key, table_name, config_path, rows, status, attempts, next_attempt, ' \
+                'last_error, created, uploaded FROM spool WHERE 1 = 1'
+        params = []
+        if status:
+            query += ' AND status = ?'
+            params.append(status)
+        if due:
+            query += ' AND next_attempt <= ?'
+            params.append(time.time())
+        with self.lock:
+            records = self.db.execute(query + ' ORDER BY created', params).fetchall()
+        columns = ['key', 'table_name', 'config_path', 'rows', 'status', 'attempts',
+                   'next_attempt', 'last_error', 'created', 'uploaded']
+        entries = [dict(zip(columns, record)) for record in records]
+        for entry in entries:
+            entry['rows'] = json.loads(entry['rows'])
+        return entries
+
+    def next_attempt(self):
+        """
+        :return: time of the next pending upload attempt, None if nothing is pending
+        """
+        with self.lock:
+            return self.db.execute('SELECT MIN(next_attempt) FROM spool WHERE status = ?',
+                                   (PENDING,)).fetchone()[0]
+
+    def mark_uploaded(self, key):
+        with self.lock:
+            self.db.execute('UPDATE spool SET status = ?, uploaded = ?, last_error = NULL '
+                            'WHERE key = ?', (UPLOADED, time.time(), key))
+
+    def mark_failed(self, key, error):
+        """
+        Record a failed upload attempt and schedule the retry with jittered exponential backoff.
+        :param key: entry key
+        :param error: failure reason
+        """
+        with self.lock:
+            attempts = self.db.execute('SELECT attempts FROM spool WHERE key = ?',
+                                       (key,)).fetchone()[0] + 1
+            delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** (attempts - 1))
+            delay *= random.uniform(0.5, 1)
+            self.db.execute('UPDATE spool SET attempts = ?, next_attempt = ?, last_error = ? '
+                            'WHERE key = ?', (attempts, time.time() + delay, str(error), key))
+
+    def replay(self, key=None, status=None):
+        """
+        Mark entries as pending again and due immediately, e.g. to upload them once more after
+        the DB tables were restored.
+        :param key: optional entry key, all entries are replayed by default
+        :param status: optional status filter e.g. PENDING to only retry the failed uploads now
+        :return: <int> number of replayed entries
+        """
+        query = 'UPDATE spool SET status = ?, next_attempt = 0, attempts = 0, ' \
+                'uploaded = NULL WHERE 1 = 1'
+        params = [PENDING]
+        if key:
+            query += ' AND key = ?'
+            params.append(key)
+        if status:
+            query += ' AND status = ?'
+            params.append(status)
+        with self.lock:
+            return self.db.execute(query, params).rowcount
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class SpoolFlusher(threading.Thread):
+    """
+    Background thread draining the spool entries as soon as they are due.
+    Failed uploads stay in the spool and are retried with backoff; an upload committed right
+    before the process died may be retried once more since the spool is marked afterwards.
+    """
+    def __init__(self, spool, upload):
+        """
+        :param spool: <ResultsSpool>
+        :param upload: function(table_name, config_path, rows) uploading the rows
+        """
+        super(SpoolFlusher, self).__init__(name='SpoolFlusher')
+        self.daemon = True
+        self.spool = spool
+        self.upload = upload
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        # flush() requests, and the last one served by a drain started after it
+        self.requested = 0
+        self.served = 0
+        self.condition = threading.Condition()
+
+    def drain(self):
+        """
+        Upload all the due entries.
+        :return: <int> number of entries still pending
+        """
+        for entry in self.spool.entries(status=PENDING, due=True):
+            try:
+                self.upload(entry['table_name'], entry['config_path'], entry['rows'])
+            except Exception as ex:
+                log.error('Failed to upload spooled results {} in {}: {}'.format(
+                        entry['key'], entry['table_name'], ex))
+                self.spool.mark_failed(entry['key'], ex)
+            else:
+                self.spool.mark_uploaded(entry['key'])
+        return len(self.spool.entries(status=PENDING))
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeup.clear()
+            with self.condition:
+                requested = self.requested
+            try:
+                self.drain()
+            except Exception as ex:
+                log.exception(ex)
+            with self.condition:
+                self.served = requested
+                self.condition.notify_all()
+            next_attempt = self.spool.next_attempt()
+            timeout = None
+            if next_attempt is not None:
+                timeout = max(0.1, next_attempt - time.time())
+            self.wakeup.wait(timeout)
+
+    def notify(self):
+        self.wakeup.set()
+
+    def flush(self, timeout=None):
+        """
+        Wait for an upload attempt of all the due entries, e.g. before exiting. A drain already
+        running may have missed the latest entries, so only a drain started afterwards counts.
+        :param timeout: max seconds to wait for
+        :return: <bool> True if nothing is left pending
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.condition:
+            self.requested += 1
+            request = self.requested
+            self.notify()
+            while self.served < request:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+        return not self.spool.entries(status=PENDING)
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Inspect or replay the results upload spool.')
+    parser.add_argument('spool', type=str, help='Spool file e.g. <localpath>/results_spool.db')
+    parser.add_argument('action', choices=['list', 'show', 'replay', 'flush'],
+                        help='list entries, show an entry rows, mark entries pending again or '
+                             'upload the pending entries now.')
+    parser.add_argument('-k', '--key', type=str, default=None, help='Spool entry key.')
+    parser.add_argument('-s', '--status', type=str, default=None,
+                        help='Only the entries with this status e.g. pending.')
+    options = parser.parse_args(args)
+    if options.action == 'replay' and not (options.key or options.status):
+        # replaying the uploaded entries would insert their rows once more
+        parser.error('replay requires --key or --status.')
+    if not os.path.isfile(options.spool):
+        raise Exception('Spool file {} not found.'.format(options.spool))
+    spool = ResultsSpool(options.spool)
+    if options.action == 'list':
+        for entry in spool.entries(status=options.status):
+            print('{} {:<8} {:<45} rows={:<4} attempts={} {}'.format(
+                    entry['key'], entry['status'], entry['table_name'], len(entry['rows']),
+                    entry['attempts'], entry['last_error'] or ''))
+    elif options.action == 'show':
+        for entry in spool.entries(status=options.status):
+            if not options.key or entry['key'] == options.key:
+                print(json.dumps(entry, indent=2, sort_keys=True))
+    elif options.action == 'replay':
+        replayed = spool.replay(options.key, status=options.status)
+        log.info('Replayed {} spool entries.'.format(replayed))
+    else:
+        from report.db_utils import insert_results
+        flusher = SpoolFlusher(spool, insert_results)
+        spool.replay(options.key, status=None if options.key else PENDING)
+        pending = flusher.drain()
+        log.info('{} spool entries left pending.'.format(pending))
+    spool.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,272 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import os
+import sys
+import time
+import decimal
+import sqlite3
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+class ResultsWarehouse(object):
+    """
+    Local SQLite mirror of the results uploaded to the Perf_{provider}_* DB tables, for fast
+    historical queries. Each DB table is mirrored with the typed columns schema from db_utils
+    and indexed on (TestCaseName, InstanceSize, KernelVersion, TestDate); the metric series
+    queries add a covering index including the queried metric on first use.
+    """
+    KEY_COLUMNS = ['TestCaseName', 'InstanceSize', 'KernelVersion', 'TestDate']
+
+    def __init__(self, path, columns):
+        """
+        Open or create the warehouse.
+        :param path: SQLite warehouse file path
+        :param columns: typed columns schema e.g. db_utils.COLUMNS
+        """
+        self.path = path
+        self.columns = []
+        self.affinity = {}
+        for column in columns:
+            # some columns are shared by several tables and listed more than once in the schema
+            if column['name'] not in self.affinity:
+                self.columns.append(column['name'])
+                self.affinity[column['name']] = self.get_affinity(column['type'])
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS imports (key TEXT PRIMARY KEY, '
+                        'table_name TEXT NOT NULL, rows INTEGER NOT NULL, created REAL NOT NULL)')
+        self.db.commit()
+        self.tables = set(self.list_tables())
+
+    @staticmethod
+    def get_affinity(column_type):
+        """
+        Map a sqlalchemy column type to the SQLite column affinity.
+        :param column_type: sqlalchemy type class or instance
+        :return: <str> INTEGER, REAL or TEXT
+        """
+        if isinstance(column_type, type):
+            column_type = column_type()
+        python_type = column_type.python_type
+        if python_type in (int, long):
+            return 'INTEGER'
+        if python_type in (float, decimal.Decimal):
+            return 'REAL'
+        # dates are stored as ISO strings, sorting chronologically
+        return 'TEXT'
+
+    def list_tables(self):
+        return [name for name, in self.db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name != 'imports'")]
+
+    def create_table(self, table_name):
+        if table_name in self.tables:
+            return
+        self.db.execute('CREATE TABLE IF NOT EXISTS "{}" (TestId INTEGER PRIMARY KEY, {})'.format(
+                table_name, ', '.join('"{}" {}'.format(name, self.affinity[name])
+                                      for name in self.columns)))
+        self.db.execute('CREATE INDEX IF NOT EXISTS "ix_{0}" ON "{0}" ({1})'.format(
+                table_name, ', '.join(self.KEY_COLUMNS)))
+        self.tables.add(table_name)
+
+    def store(self, table_name, rows, key=None):
+        """
+        Mirror the results rows of a DB table.
+        :param table_name: DB table name e.g. Perf_Azure_Network_TCP
+        :param rows: list of row dicts
+        :param key: optional idempotency key e.g. the spool entry key, rows already stored
+                    under the same key are skipped
+        :return: <int> number of stored rows
+        """
+        names = [name for name in self.columns if any(name in row for row in rows)]
+        if not names:
+            return 0
+        query = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+                table_name, ', '.join('"{}"'.format(name) for name in names),
+                ', '.join('?' for _ in names))
+        values = [[self.to_db(row.get(name, None)) for name in names] for row in rows]
+        with self.lock:
+            with self.db:
+                if key:
+                    cursor = self.db.execute(
+                            'INSERT OR IGNORE INTO imports (key, table_name, rows, created) '
+                            'VALUES (?, ?, ?, ?)', (key, table_name, len(rows), time.time()))
+                    if not cursor.rowcount:
+                        return 0
+                self.create_table(table_name)
+                self.db.executemany(query, values)
+        return len(values)
+
+    def imported(self, key):
+        """
+        :param key: idempotency key passed to store
+        :return: <bool> True if rows were already stored under the key
+        """
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM imports WHERE key = ?',
+                                   (key,)).fetchone() is not None
+
+    @staticmethod
+    def to_db(value):
+        if isinstance(value, decimal.Decimal):
+            return float(value)
+        if value is not None and not isinstance(value, (int, long, float, basestring)):
+            return str(value)
+        return value
+
+    def _where(self, filters):
+        clauses = []
+        params = []
+        for name, value in sorted(filters.items()):
+            if value is None:
+                continue
+            if name not in self.affinity:
+                raise Exception('Unknown column: {}'.format(name))
+            clauses.append('"{}" = ?'.format(name))
+            params.append(value)
+        return ' AND '.join(clauses) or '1 = 1', params
+
+    def series(self, table_name, metric, since=None, until=None, **filters):
+        """
+        Query a metric series ordered by test date, e.g.
+        series('Perf_Azure_Network_TCP', 'Throughput_Gbps', TestCaseName='network_tcp',
+               InstanceSize='Standard_D4s_v3', KernelVersion='4.15.0-1023-azure')
+        :param table_name: DB table name
+        :param metric: metric column name
+        :param since: optional first test date, as 'YYYY-MM-DD'
+        :param until: optional last test date, as 'YYYY-MM-DD'
+        :param filters: column equality filters, None values are ignored
+        :return: <tuple> (numpy datetime64[D] test dates, numpy float64 metric values)
+        """
+        if metric not in self.affinity:
+            raise Exception('Unknown metric: {}'.format(metric))
+        if table_name not in self.tables:
+            return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64)
+        where, params = self._where(filters)
+        if since:
+            where += ' AND TestDate >= ?'
+            params.append(since)
+        if until:
+            where += ' AND TestDate <= ?'
+            params.append(until)
+        with self.lock:
+            with self.db:
+                self.db.execute('CREATE INDEX IF NOT EXISTS "ix_{0}_{1}" ON "{0}" ({2}, "{1}")'
+                                .format(table_name, metric, ', '.join(self.KEY_COLUMNS)))
+            records = self.db.execute(
+                    'SELECT TestDate, "{}" FROM "{}" WHERE {} AND "{}" IS NOT NULL '
+                    'ORDER BY TestDate'.format(metric, table_name, where, metric),
+                    params).fetchall()
+        dates = np.array([record[0] for record in records], dtype='datetime64[D]')
+        values = np.array([record[1] for record in records], dtype=np.float64)
+        return dates, values
+
+    def columns_of(self, table_name, columns=None, **filters):
+        """
+        Columnar read of a mirrored table, skipping the columns never filled.
+        :param table_name: DB table name
+        :param columns: optional list of column names, all by default
+        :param filters: column equality filters, None values are ignored
+        :return: <dict> {column name: numpy array}, numeric columns as float64 with NaN for
+                 missing values, the other ones as unicode arrays
+        """
+        if table_name not in self.tables:
+            raise Exception('Table {} not found in {}.'.format(table_name, self.path))
+        where, params = self._where(filters)
+        columns = columns or self.columns
+        with self.lock:
+            records = self.db.execute('SELECT {} FROM "{}" WHERE {} ORDER BY TestDate'.format(
+                    ', '.join('"{}"'.format(name) for name in columns), table_name, where),
+                    params).fetchall()
+        data = {}
+        for i, name in enumerate(columns):
+            values = [record[i] for record in records]
+            if all(value is None for value in values):
+                continue
+            if self.affinity[name] == 'TEXT':
+                data[name] = np.array([value or u'' for value in values], dtype=np.unicode_)
+            else:
+                data[name] = np.array([np.nan if value is None else value for value in values],
+                                      dtype=np.float64)
+        return data
+
+    def export(self, table_name, export_path, columns=None, **filters):
+        """
+        Export a mirrored table as a compressed columnar .npz archive, one array per column.
+        :param table_name: DB table name
+        :param export_path: .npz file path
+        :param columns: optional list of column names, all by default
+        :param filters: column equality filters
+        :return: <int> number of exported rows
+        """
+        data = self.columns_of(table_name, columns=columns, **filters)
+        np.savez_compressed(export_path, **data)
+        return len(data['TestDate']) if 'TestDate' in data else 0
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def main(args):
+    from report.db_utils import COLUMNS
+    from report.spool import ResultsSpool
+    parser = argparse.ArgumentParser(description='Local results warehouse.')
+    parser.add_argument('warehouse', type=str,
+                        help='Warehouse file e.g. <localpath>/results_warehouse.db')
+    subparsers = parser.add_subparsers(dest='action')
+    subparsers.add_parser('tables', help='List the mirrored tables.')
+    import_parser = subparsers.add_parser('import', help='Import the spool entries.')
+    import_parser.add_argument('spool', type=str, help='Spool file to import.')
+    export_parser = subparsers.add_parser('export', help='Export a table as columnar .npz.')
+    export_parser.add_argument('table', type=str, help='Table name e.g. Perf_Azure_Storage.')
+    export_parser.add_argument('path', type=str, help='Exported .npz file path.')
+    options = parser.parse_args(args)
+    warehouse = ResultsWarehouse(options.warehouse, COLUMNS)
+    if options.action == 'tables':
+        for table_name in sorted(warehouse.tables):
+            print('{:<45} rows={}'.format(table_name, warehouse.db.execute(
+                    'SELECT COUNT(*) FROM "{}"'.format(table_name)).fetchone()[0]))
+    elif options.action == 'import':
+        if not os.path.isfile(options.spool):
+            raise Exception('Spool file {} not found.'.format(options.spool))
+        spool = ResultsSpool(options.spool)
+        stored = sum(warehouse.store(entry['table_name'], entry['rows'], key=entry['key'])
+                     for entry in spool.entries())
+        spool.close()
+        log.info('Imported {} rows from {}.'.format(stored, options.spool))
+    else:
+        log.info('Exported {} rows to {}.'.format(
+                warehouse.export(options.table, options.path), options.path))
+    warehouse.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -24,13 +24,15 @@ import sys
 import copy
 import argparse
 import logging
-import pkgutil
 import importlib
 
 from junit_xml import TestSuite, TestCase
 
-import suites
 from utils import constants
+from utils import journal
+from utils.manifest import discover_tests
+from utils.scheduler import TestScheduler
+from utils.tracing import tracer
 
 logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
                     datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
@@ -42,13 +44,9 @@ def run(options):
     Main point of entry for running benchmark tests.
     """
     sys.stdout.flush()
-    # lookup suites and tests
-    suite_names = [suite for _, suite, _ in pkgutil.iter_modules(suites.__path__)]
-    test_names = {}
-    for suite in suite_names:
-        test_names[suite] = [test
-                             for test in dir(importlib.import_module('suites.{}'.format(suite)))
-                             if 'test_' in test]
+    # lookup suites and tests, suite modules are only imported for the selected tests
+    test_names = discover_tests()
+    suite_names = sorted(test_names.keys())
     # validate options
     parser = argparse.ArgumentParser(description='Run middleware benchmarking tests.')
     mandatory_args = parser.add_argument_group('mandatory arguments')
@@ -67,7 +65,7 @@ def run(options):
                                          for test in test_names[suite]]))
     mandatory_args.add_argument(constants.CLI_PROVIDER_OPT_SH, constants.CLI_PROVIDER_OPT,
                                 type=str, required=True,
-                                help='Service provider to be used e.g. azure/aws/gce.')
+                                help='Service provider to be used e.g. azure/aws/gce/local.')
     mandatory_args.add_argument(constants.CLI_KEYID_OPT_SH, constants.CLI_KEYID_OPT,
                                 type=str, required=True, help='Azure/aws/gce key id.')
     mandatory_args.add_argument(constants.CLI_SECRET_OPT_SH, constants.CLI_SECRET_OPT,
@@ -93,7 +91,9 @@ def run(options):
     parser.add_argument(constants.CLI_PROJECTID_OPT_SH, constants.CLI_PROJECTID_OPT,
                         type=str, default='', help='GCE project id.')
     parser.add_argument(constants.CLI_REGION_OPT_SH, constants.CLI_REGION_OPT,
-                        type=str, default='', help='Azure/aws/gce region to connect to.')
+                        type=str, default='',
+                        help='Azure/aws/gce region to connect to, or comma separated hosts '
+                             'used as VMs by the local provider.')
     parser.add_argument(constants.CLI_ZONE_OPT_SH, constants.CLI_ZONE_OPT,
                         type=str, default='',
                         help='Aws/gce specific zone where to create resources e.g. us-west1-a.')
@@ -102,13 +102,46 @@ def run(options):
     parser.add_argument(constants.CLI_KERNEL_OPT_SH, constants.CLI_KERNEL_OPT,
                         type=str, default='', help='Kernel to install from localpath.')
 
+    parser.add_argument(constants.CLI_CONCURRENCY_OPT_SH, constants.CLI_CONCURRENCY_OPT,
+                        type=int, default=1,
+                        help='Number of tests to run in parallel, each in its own environment.')
+    parser.add_argument(constants.CLI_QUOTA_CORES_OPT_SH, constants.CLI_QUOTA_CORES_OPT,
+                        type=int, default=0,
+                        help='Provider cores quota shared by the parallel tests, requires '
+                             '"--instancecores". Defaults to unlimited.')
+    parser.add_argument(constants.CLI_QUOTA_IPS_OPT_SH, constants.CLI_QUOTA_IPS_OPT,
+                        type=int, default=0,
+                        help='Provider public IPs quota shared by the parallel tests. '
+                             'Defaults to unlimited.')
+    parser.add_argument(constants.CLI_INST_CORES_OPT_SH, constants.CLI_INST_CORES_OPT,
+                        type=int, default=0, help='Number of cores of the instance type.')
+    parser.add_argument(constants.CLI_REUSE_ENV_OPT_SH, constants.CLI_REUSE_ENV_OPT,
+                        type=int, default=0,
+                        help='Reuse the test environments between tests requiring the same '
+                             'VMs, tearing them down after being idle for the given minutes. '
+                             'Defaults to 0, creating new environments for each test.')
+    parser.add_argument(constants.CLI_RESUME_OPT_SH, constants.CLI_RESUME_OPT,
+                        action='store_true',
+                        help='Resume the previous run of the suite from its journal, skipping '
+                             'the tests already uploaded and uploading again the downloaded '
+                             'results.')
+
     args = parser.parse_args(options)
     test_args = copy.deepcopy(vars(args))
     current_suite = test_args['suite']
     test_args.pop('suite', None)
     current_tests = test_args['test']
     test_args.pop('test', None)
-    junit_testcases = []
+    concurrency = test_args.pop('concurrency')
+    instance_cores = test_args.pop('instancecores')
+    reuse_env = test_args.pop('reuseenv')
+    resume = test_args.pop('resume')
+    quota = {}
+    if test_args.pop('quotacores'):
+        quota['cores'] = args.quotacores
+    if test_args.pop('quotaips'):
+        quota['public_ips'] = args.quotaips
+    selected = []
     if current_suite == 'specific':
         selected_tests = current_tests.split(',')
         all_tests = [t for s in test_names.values() for t in s]
@@ -117,16 +150,9 @@ def run(options):
                             'Use "runner.py -h" to list all the currently supported tests.')
         log.info('Tests to run: {}'.format(selected_tests))
         for test in selected_tests:
-            log.info('Running test: {}'.format(test))
-            try:
-                module = [k for k, v in test_names.items() if test in v][0]
-                getattr(importlib.import_module('suites.{}'.format(module)), test)(**test_args)
-            except Exception as e:
-                junit_testcase = TestCase(test)
-                junit_testcase.add_failure_info(e)
-                junit_testcases.append(junit_testcase)
-                continue
-            junit_testcases.append(TestCase(test))
+            module = [k for k, v in test_names.items() if test in v][0]
+            selected.append((test, getattr(importlib.import_module('suites.{}'.format(module)),
+                                           test)))
     else:
         log.info('Suite to run: {}'.format(current_suite))
         if not test_names.get(current_suite, None):
@@ -143,20 +169,62 @@ def run(options):
             elif test_args['provider'] == constants.GCE and test in constants.NOT_GCE_TESTS:
                 log.info('Skipping GCE specific test: {}.'.format(test))
                 continue
-            else:
-                log.info('Running test: {}'.format(test))
+            selected.append((test, getattr(importlib.import_module(
+                    'suites.{}'.format(current_suite)), test)))
+
+    journal_path = os.path.join(test_args['localpath'], 'run_journal_{}.json'.format(current_suite))
+    run_journal = journal.RunJournal(journal_path, resume=resume)
+    journal.activate(run_journal)
+    resumed = {}
+    for test, _ in selected:
+        entry = run_journal.get(test)
+        if resume and entry['state'] == journal.UPLOADED:
+            log.info('Skipping test {}, already completed.'.format(test))
+            resumed[test] = TestCase(test)
+        elif resume and entry['state'] == journal.DOWNLOADED and entry.get('upload', None):
+            log.info('Uploading again the results of test {}.'.format(test))
+            resumed[test] = TestCase(test)
             try:
-                getattr(importlib.import_module('suites.{}'.format(current_suite)),
-                        test)(**test_args)
+                run_journal.reupload(test)
             except Exception as e:
-                junit_testcase = TestCase(test)
-                junit_testcase.add_failure_info(e)
-                junit_testcases.append(junit_testcase)
-                continue
-            junit_testcases.append(TestCase(test))
+                log.exception(e)
+                resumed[test].add_failure_info(e)
+        else:
+            run_journal.update(test, state=journal.PENDING)
+
+    reclaim = None
+    if reuse_env:
+        from utils.setup import SetupTestEnv
+        from utils.env_pool import EnvironmentPool
+        SetupTestEnv.pool = EnvironmentPool(SetupTestEnv.reset_environment,
+                                            SetupTestEnv.teardown_environment,
+                                            idle_timeout=reuse_env * 60)
+        # idle environments hold quota, evicted when the next test does not fit
+        reclaim = SetupTestEnv.pool.evict
+    scheduler = TestScheduler(concurrency=concurrency, quotas={test_args['provider']: quota},
+                              log_dir=os.path.join(test_args['localpath'], 'test_logs'),
+                              reclaim=reclaim)
+    try:
+        junit_testcases = scheduler.run([(test, test_func) for test, test_func in selected
+                                         if test not in resumed],
+                                        test_args, instance_cores=instance_cores)
+    finally:
+        if reuse_env:
+            SetupTestEnv.pool.close()
+
+    junit_testcases = dict((testcase.name, testcase) for testcase in junit_testcases)
+    junit_testcases.update(resumed)
+    junit_testcases = [junit_testcases[test] for test, _ in selected]
+
+    # phase timings of each test, as <test>.<span>_sec properties, and the run timeline
+    properties = {}
+    for testcase in junit_testcases:
+        for name, duration in tracer.summary(testcase.name).items():
+            properties['{}.{}_sec'.format(testcase.name, name)] = '{:.3f}'.format(duration)
+    tracer.export(os.path.join(test_args['localpath'], 'trace_{}.json'.format(current_suite)))
 
     # generate junit xml
-    junit_suite = [TestSuite(current_suite, junit_testcases)]
+    junit_suite = [TestSuite(current_suite, junit_testcases, properties=properties)]
     with open(os.path.join(test_args['localpath'], 'junit_{}.xml'.format(current_suite)),
               mode='w') as f:
         TestSuite.to_file(f, junit_suite, prettyprint=False)
@@ -74,12 +74,12 @@ def test_orion(provider, keyid, secret, token, imageid, subscription, tenant, pr
                             projectid=projectid, imageid=imageid, instancetype=instancetype,
                             user=user, localpath=localpath, region=region, zone=zone, sriov=sriov,
                             kernel=kernel)
-    test_env.ssh_client[1].put_file(os.path.join(localpath, 'orion_linux_x86-64.gz'),
-                                    '/tmp/orion_linux_x86-64.gz')
     test_cmd = '/tmp/run_orion.sh {}'.format(test_env.device)
     results_path = os.path.join(localpath, 'orion{}_{}.zip'.format(str(time.time()), instancetype))
     test_env.run_test(testname='orion', test_cmd=test_cmd, results_path=results_path,
-                      timeout=constants.TIMEOUT * 5)
+                      timeout=constants.TIMEOUT * 5,
+                      artifacts=[(os.path.join(localpath, 'orion_linux_x86-64.gz'),
+                                  '/tmp/orion_linux_x86-64.gz', 0644)])
     upload_results(localpath=localpath, table_name='Perf_{}_Orion'.format(provider),
                    results_path=results_path, parser=OrionLogsReader,
                    other_table=('.deb' in kernel),
@@ -125,13 +125,13 @@ def test_orion_raid(provider, keyid, secret, token, imageid, subscription, tenan
                             projectid=projectid, imageid=imageid, instancetype=instancetype,
                             user=user, localpath=localpath, region=region, zone=zone, sriov=sriov,
                             kernel=kernel)
-    test_env.ssh_client[1].put_file(os.path.join(localpath, 'orion_linux_x86-64.gz'),
-                                    '/tmp/orion_linux_x86-64.gz')
     test_cmd = '/tmp/run_orion.sh {}'.format(' '.join(test_env.device))
     results_path = os.path.join(localpath, 'orion_raid{}_{}.zip'.format(
             str(time.time()), instancetype))
     test_env.run_test(testname='orion', test_cmd=test_cmd, results_path=results_path, raid=raid,
-                      timeout=constants.TIMEOUT * 5)
+                      timeout=constants.TIMEOUT * 5,
+                      artifacts=[(os.path.join(localpath, 'orion_linux_x86-64.gz'),
+                                  '/tmp/orion_linux_x86-64.gz', 0644)])
     upload_results(localpath=localpath, table_name='Perf_{}_Orion'.format(provider),
                    results_path=results_path, parser=OrionLogsReader,
                    other_table=('.deb' in kernel),
@@ -793,11 +793,9 @@ def test_sql_server_inmemdb(provider, keyid, secret, token, imageid, subscriptio
         log.info(win_vm)
         if all(client for client in test_env.ssh_client.values()):
             current_path = os.path.dirname(sys.modules['__main__'].__file__)
-            test_env.ssh_client[1].put_file(os.path.join(current_path, 'tests',
-                                                         'run_sqlserver.sh'),
-                                            '/tmp/run_sqlserver.sh')
-            test_env.ssh_client[1].run('chmod +x /tmp/run_sqlserver.sh')
-            test_env.ssh_client[1].run("sed -i 's/\r//' /tmp/run_sqlserver.sh")
+            test_env.ssh_client[1].stage([(os.path.join(current_path, 'tests',
+                                                        'run_sqlserver.sh'),
+                                           '/tmp/run_sqlserver.sh', 0755)])
             cmd = '/tmp/run_sqlserver.sh {} {}'.format(password, constants.DEVICE_AZURE)
             log.info('Running command {}'.format(cmd))
             test_env.ssh_client[1].run(cmd, timeout=constants.TIMEOUT)
@@ -848,23 +846,22 @@ def test_sql_server_inmemdb(provider, keyid, secret, token, imageid, subscriptio
                                                   db='InMemDb'), ps=True)
 
         # start server collect
-        test_env.ssh_client[1].run('mkdir /tmp/sqlserver_stats', timeout=constants.TIMEOUT)
-        test_env.ssh_client[1].run('nohup sar -n DEV 1 > /tmp/sqlserver_stats/sar.netio.log 2>&1 &',
-                                   timeout=constants.TIMEOUT)
-        test_env.ssh_client[1].run('nohup iostat -x -d 1 > /tmp/sqlserver_stats/iostat.diskio.log 2>&1 &',
-                                   timeout=constants.TIMEOUT)
-        test_env.ssh_client[1].run('nohup vmstat 1 > /tmp/sqlserver_stats/vmstat.memory.cpu.log 2>&1 &',
-                                   timeout=constants.TIMEOUT)
+        test_env.ssh_client[1].run_batch(
+                ['mkdir /tmp/sqlserver_stats',
+                 'nohup sar -n DEV 1 > /tmp/sqlserver_stats/sar.netio.log 2>&1 &',
+                 'nohup iostat -x -d 1 > /tmp/sqlserver_stats/iostat.diskio.log 2>&1 &',
+                 'nohup vmstat 1 > /tmp/sqlserver_stats/vmstat.memory.cpu.log 2>&1 &'],
+                timeout=constants.TIMEOUT)
 
         cmd = '{bc_path}start.ps1'.format(bc_path=constants.BC_PATH)
         log.info(cmd)
         winrm_client.run(cmd=cmd, ps=True)
 
         # collect server stats
-        test_env.ssh_client[1].run('pkill -f sar; pkill -f vmstat; pkill -f iostat',
-                                   timeout=constants.TIMEOUT)
-        test_env.ssh_client[1].run('cd /tmp; zip -r sqlserver_stats.zip . -i sqlserver_stats/*',
-                                   timeout=constants.TIMEOUT)
+        test_env.ssh_client[1].run_batch(
+                ['pkill -f sar; pkill -f vmstat; pkill -f iostat',
+                 'cd /tmp; zip -r sqlserver_stats.zip . -i sqlserver_stats/*'],
+                timeout=constants.TIMEOUT)
         test_env.ssh_client[1].get_file('/tmp/sqlserver_stats.zip', os.path.join(
                 localpath, 'sqlserver_stats{}_{}.zip'.format(str(time.time()), instancetype)))
 
@@ -874,8 +871,7 @@ def test_sql_server_inmemdb(provider, keyid, secret, token, imageid, subscriptio
         log.exception(e)
         raise
     finally:
-        if test_env.connector:
-            test_env.connector.teardown()
+        test_env.teardown()
     if results_path:
         upload_results(localpath=localpath, table_name='Perf_{}_SQLServer'.format(provider),
                        results_path=results_path, parser=SQLServerLogsReader,
@@ -919,9 +915,8 @@ def test_lamp_wordpress(provider, keyid, secret, token, imageid, subscription, t
     test_cmd = '/tmp/run_wordpress.sh {} {} {}'.format(test_env.vm_ips[2], user, software_bundle)
     current_path = os.getcwd()
     results_path = os.path.join(localpath, 'lamp_wordpress{}_{}_{}.zip'.format(str(time.time()), instancetype, sriov))    
-    test_env.ssh_client[2].put_file(os.path.join(current_path, 'tests', 'install_lamp_wordpress.sh'), '/tmp/install_lamp_wordpress.sh')
-    test_env.ssh_client[2].run('chmod +x /tmp/install_lamp_wordpress.sh')
-    test_env.ssh_client[2].run("sed -i 's/\r//' /tmp/install_lamp_wordpress.sh")
+    test_env.ssh_client[2].stage([(os.path.join(current_path, 'tests', 'install_lamp_wordpress.sh'),
+                                   '/tmp/install_lamp_wordpress.sh', 0755)])
     test_env.run_test(ssh_vm_conf=1, testname='wordpress', test_cmd=test_cmd,
                       results_path=results_path, timeout=constants.TIMEOUT * 5)
     upload_results(localpath=localpath, table_name='Perf_{}_LAMP_Wordpress'.format(provider),
@@ -965,9 +960,8 @@ def test_lemp_wordpress(provider, keyid, secret, token, imageid, subscription, t
     test_cmd = '/tmp/run_wordpress.sh {} {} {}'.format(test_env.vm_ips[2], user, software_bundle)
     current_path = os.getcwd()
     results_path = os.path.join(localpath, 'lemp_wordpress{}_{}_{}.zip'.format(str(time.time()), instancetype, sriov))    
-    test_env.ssh_client[2].put_file(os.path.join(current_path, 'tests', 'install_lemp_wordpress.sh'), '/tmp/install_lemp_wordpress.sh')
-    test_env.ssh_client[2].run('chmod +x /tmp/install_lemp_wordpress.sh')
-    test_env.ssh_client[2].run("sed -i 's/\r//' /tmp/install_lemp_wordpress.sh")
+    test_env.ssh_client[2].stage([(os.path.join(current_path, 'tests', 'install_lemp_wordpress.sh'),
+                                   '/tmp/install_lemp_wordpress.sh', 0755)])
     test_env.run_test(ssh_vm_conf=1, testname='wordpress', test_cmd=test_cmd,
                       results_path=results_path, timeout=constants.TIMEOUT * 5)
     upload_results(localpath=localpath, table_name='Perf_{}_LEMP_Wordpress'.format(provider),
@@ -1104,8 +1098,8 @@ def test_tensorflow_cpu(provider, keyid, secret, token, imageid, subscription, t
     test_cmd = '/tmp/run_tensorflow_cpu.sh'
     current_path = os.getcwd()
     results_path = os.path.join(localpath, 'tensorflow_cpu{}_{}_{}.zip'.format(str(time.time()),instancetype, sriov))
-    test_env.ssh_client[1].put_file(os.path.join(current_path, 'tests', 'install_tensorflow_cpu.sh'), '/tmp/install_tensorflow_cpu.sh')
-    test_env.ssh_client[1].run('chmod +x /tmp/install_tensorflow_cpu.sh')
+    test_env.ssh_client[1].stage([(os.path.join(current_path, 'tests', 'install_tensorflow_cpu.sh'),
+                                   '/tmp/install_tensorflow_cpu.sh', 0755)])
     test_env.run_test(ssh_vm_conf=1, testname='tensorflow_cpu', test_cmd=test_cmd,
                       results_path=results_path, timeout=constants.TIMEOUT * 10)
     upload_results(localpath=localpath, table_name='Perf_{}_Tensorflow'.format(provider),
@@ -1162,8 +1156,8 @@ def test_tensorflow_gpu(provider, keyid, secret, token, imageid, subscription, t
     test_cmd = '/tmp/run_tensorflow_gpu.sh {} {}'.format(test_env.device, user)
     current_path = os.getcwd()
     results_path = os.path.join(localpath, 'tensorflow_gpu{}_{}_{}.zip'.format(str(time.time()),instancetype, sriov))
-    test_env.ssh_client[1].put_file(os.path.join(current_path, 'tests', 'install_tensorflow_gpu.sh'), '/tmp/install_tensorflow_gpu.sh')
-    test_env.ssh_client[1].run('chmod +x /tmp/install_tensorflow_gpu.sh')
+    test_env.ssh_client[1].stage([(os.path.join(current_path, 'tests', 'install_tensorflow_gpu.sh'),
+                                   '/tmp/install_tensorflow_gpu.sh', 0755)])
     test_env.run_test(ssh_vm_conf=1, testname='tensorflow_gpu', test_cmd=test_cmd,
                       results_path=results_path, timeout=constants.TIMEOUT)
     upload_results(localpath=localpath, table_name='Perf_{}_Tensorflow'.format(provider),
@@ -1212,8 +1206,8 @@ def test_elasticsearch(provider, keyid, secret, token, imageid, subscription, te
                             zone=zone, sriov=sriov, kernel=kernel)
     current_path = os.getcwd()
     results_path = os.path.join(localpath, 'elasticsearch{}_{}_{}.zip'.format(str(time.time()), instancetype, sriov))
-    test_env.ssh_client[1].put_file(os.path.join(current_path, 'tests', 'install_elasticsearch.sh'), '/tmp/install_elasticsearch.sh')
-    test_env.ssh_client[1].run('chmod +x /tmp/install_elasticsearch.sh')
+    test_env.ssh_client[1].stage([(os.path.join(current_path, 'tests', 'install_elasticsearch.sh'),
+                                   '/tmp/install_elasticsearch.sh', 0755)])
     test_env.ssh_client[1].run('/tmp/install_elasticsearch.sh {} {}'.format(user, test_env.device))
     tracks = ["pmc", "geonames", "nested", "geopoint", "http_logs", "noaa", "nyc_taxis", "percolator"]
     for track in tracks:
@@ -0,0 +1,45 @@
+#!/bin/bash
+
+########################################################################
+#
+# Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+# Copyright (c) Microsoft Corporation
+#
+# All rights reserved.
+# Licensed under the Apache License, Version 2.0 (the ""License"");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# THIS CODE IS PROVIDED *AS IS* BASIS, WITHOUT WARRANTIES OR CONDITIONS
+# OF ANY KIND, EITHER EXPRESS OR IMPLIED, INCLUDING WITHOUT LIMITATION
+# ANY IMPLIED WARRANTIES OR CONDITIONS OF TITLE, FITNESS FOR A PARTICULAR
+# PURPOSE, MERCHANTABILITY OR NON-INFRINGEMENT.
+#
+# See the Apache Version 2.0 License for specific language governing
+# permissions and limitations under the License.
+#
+########################################################################
+
+# Reset a VM reused between tests: stop the benchmark services and processes left running,
+# release the RAID array and remove the previous test artifacts and logs from /tmp.
+services="apache2 nginx redis-server memcached mysql mariadb mongod postgresql zookeeper kafka
+          elasticsearch php7.0-fpm php7.2-fpm"
+for service in ${services}; do
+    sudo systemctl stop ${service} > /dev/null 2>&1
+done
+sudo pkill -f '/tmp/run_' > /dev/null 2>&1
+sudo pkill -f 'esrally|ntttcp|lagscope|fio|sysbench|memtier_benchmark|redis-benchmark|ab ' \
+    > /dev/null 2>&1
+
+if [ -e /dev/md0 ]; then
+    sudo umount /raid > /dev/null 2>&1
+    sudo mdadm --stop /dev/md0
+    for device in "$@"; do
+        sudo mdadm --zero-superblock ${device} > /dev/null 2>&1
+    done
+fi
+
+sudo find /tmp -mindepth 1 -maxdepth 1 ! -name 'systemd-private-*' -exec rm -rf {} +
+rm -f /home/${USER}/.ssh/id_rsa
+exit 0
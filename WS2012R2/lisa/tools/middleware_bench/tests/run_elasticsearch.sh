@@ -46,6 +46,12 @@ sudo mkdir /home/${USER}/.rally/logs/elasticsearch
 
 sudo mv /home/${USER}/.rally/logs/*.log /home/${USER}/.rally/logs/elasticsearch
 
+# keep the race json reports, containing the latency percentiles of each task
+for race in $(find /home/${USER}/.rally/benchmarks/races -name race.json)
+do
+    sudo cp ${race} /home/${USER}/.rally/logs/elasticsearch/race_$(basename $(dirname ${race})).json
+done
+
 cd /home/${USER}/.rally/logs/
 
 zip -r elasticsearch.zip . -i elasticsearch/* >> ${LOG_FILE}
@@ -89,7 +89,7 @@ function run_memcached ()
     iostat -x -d 1 2>&1 > /tmp/memcached/${thread}.iostat.netio.log &
     vmstat 1 2>&1 > /tmp/memcached/${thread}.vmstat.netio.log &
 
-    memtier_benchmark -s ${SERVER} -p 11211 -P memcache_text -x 3 -n ${total_request} -t ${num_threads} -c ${num_client_per_thread} -d 4000 --ratio 1:1 --key-pattern S:S > /tmp/memcached/${thread}.memtier_benchmark.run.log
+    memtier_benchmark -s ${SERVER} -p 11211 -P memcache_text -x 3 -n ${total_request} -t ${num_threads} -c ${num_client_per_thread} -d 4000 --ratio 1:1 --key-pattern S:S --hdr-file-prefix=/tmp/memcached/${thread}.memtier > /tmp/memcached/${thread}.memtier_benchmark.run.log
 
     ssh -T -o StrictHostKeyChecking=no ${USER}@${SERVER} "sudo pkill -f sar"
     ssh -T -o StrictHostKeyChecking=no ${USER}@${SERVER} "sudo pkill -f iostat"
@@ -0,0 +1,193 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import time
+import threading
+import unittest
+
+from utils.parallel import Barrier, FanOut, run_parallel
+
+
+class FakeStream(object):
+    """
+    CommandStream returning a scripted status and output.
+    """
+    def __init__(self, status, output, duration=0):
+        self.status = None
+        self.output = ''
+        self._result = (status, output)
+        self._duration = duration
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def wait(self):
+        time.sleep(self._duration)
+        self.status, self.output = self._result
+        return self.status
+
+
+class FakeSSHClient(object):
+    """
+    SSHClient running no command, its stream() replays the scripted (status, output).
+    """
+    def __init__(self, status=0, output='', duration=0, connect_error=None, connect_delay=0):
+        self.status = status
+        self.output = output
+        self.duration = duration
+        self.connect_error = connect_error
+        self.connect_delay = connect_delay
+        self.commands = []
+        self.connected = None
+        self.started = None
+
+    def connect(self):
+        time.sleep(self.connect_delay)
+        if self.connect_error:
+            raise self.connect_error
+        self.connected = time.time()
+
+    def stream(self, command, log_path=None, timeout=None):
+        self.started = time.time()
+        self.commands.append(command)
+        return FakeStream(self.status, self.output, self.duration)
+
+
+class TestFanOut(unittest.TestCase):
+    def run_with_timeout(self, func, timeout=10):
+        """
+        Run func in a thread, failing the test if it deadlocks.
+        :return: func result, or the exception it raised
+        """
+        outcome = {}
+
+        def target():
+            try:
+                outcome['result'] = func()
+            except Exception as e:
+                outcome['result'] = e
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        thread.join(timeout)
+        self.assertFalse(thread.is_alive(), 'deadlocked')
+        return outcome['result']
+
+    def test_results_per_node(self):
+        clients = {1: FakeSSHClient(0, 'server up\n'), 2: FakeSSHClient(0, 'client done\n'),
+                   3: FakeSSHClient(3, 'partial\n')}
+        results = FanOut(clients).run('run.sh', name='phase', check=False)
+        self.assertEqual(results, {1: (0, 'server up\n'), 2: (0, 'client done\n'),
+                                   3: (3, 'partial\n')})
+        self.assertEqual([client.commands for client in clients.values()], [['run.sh']] * 3)
+
+    def test_nodes_start_behind_barrier(self):
+        clients = {1: FakeSSHClient(connect_delay=0.3), 2: FakeSSHClient()}
+        FanOut(clients).run('run.sh')
+        last_connected = max(client.connected for client in clients.values())
+        self.assertTrue(all(client.started >= last_connected for client in clients.values()))
+
+    def test_nodes_subset(self):
+        clients = {1: FakeSSHClient(), 2: FakeSSHClient()}
+        results = FanOut(clients).run('run.sh', nodes=[2])
+        self.assertEqual(list(results), [2])
+        self.assertEqual(clients[1].commands, [])
+
+    def test_failure_before_barrier_aborts(self):
+        clients = {1: FakeSSHClient(connect_error=Exception('unreachable'), connect_delay=0.2),
+                   2: FakeSSHClient(), 3: FakeSSHClient()}
+        error = self.run_with_timeout(lambda: FanOut(clients).run('run.sh', name='phase'))
+        self.assertIsInstance(error, Exception)
+        self.assertIn('phase failed for 1, 2, 3', str(error))
+        self.assertIn('unreachable', str(error))
+        self.assertEqual([client.commands for client in clients.values()], [[]] * 3)
+
+    def test_callable_command_failure_aborts(self):
+        def command(key):
+            if key == 2:
+                raise Exception('no command for node 2')
+            return 'run.sh {}'.format(key)
+        clients = {1: FakeSSHClient(), 2: FakeSSHClient()}
+        error = self.run_with_timeout(lambda: FanOut(clients).run(command))
+        self.assertIn('no command for node 2', str(error))
+        self.assertEqual(clients[1].commands, [])
+
+    def test_check_aggregates_errors(self):
+        clients = {1: FakeSSHClient(0, 'ok\n'), 2: FakeSSHClient(1, 'line\nbind failed\n'),
+                   3: FakeSSHClient(None, ''), 4: FakeSSHClient(2, 'out of memory')}
+        with self.assertRaises(Exception) as context:
+            FanOut(clients).run('run.sh', name='servers')
+        self.assertEqual(str(context.exception),
+                         'servers failed on nodes 2, 3, 4: bind failed; exit status None; '
+                         'out of memory')
+
+    def test_callable_command(self):
+        clients = {1: FakeSSHClient(), 2: FakeSSHClient()}
+        FanOut(clients).run(lambda key: 'run.sh --node {}'.format(key))
+        self.assertEqual(clients[1].commands, ['run.sh --node 1'])
+        self.assertEqual(clients[2].commands, ['run.sh --node 2'])
+
+
+class TestBarrier(unittest.TestCase):
+    def test_timeout_breaks_barrier(self):
+        barrier = Barrier(2)
+        with self.assertRaises(Exception) as context:
+            barrier.wait(timeout=0.1)
+        self.assertIn('1 of 2 parties arrived', str(context.exception))
+
+
+class TestRunParallel(unittest.TestCase):
+    def test_results(self):
+        self.assertEqual(run_parallel(lambda key: key * 2, [1, 2, 3]), {1: 2, 2: 4, 3: 6})
+
+    def test_waits_for_every_call_before_raising(self):
+        done = []
+
+        def func(key):
+            if key == 1:
+                raise Exception('create failed')
+            time.sleep(0.3)
+            done.append(key)
+        with self.assertRaises(Exception) as context:
+            run_parallel(func, [1, 2, 3], name='create_vm')
+        self.assertEqual(sorted(done), [2, 3])
+        self.assertEqual(str(context.exception), 'create_vm failed for 1: create failed')
+
+    def test_max_workers(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def func(key):
+            with lock:
+                running.append(key)
+                peak.append(len(running))
+            time.sleep(0.1)
+            with lock:
+                running.remove(key)
+        run_parallel(func, range(6), max_workers=2)
+        self.assertEqual(max(peak), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
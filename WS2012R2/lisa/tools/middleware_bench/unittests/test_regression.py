@@ -0,0 +1,86 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import Date, DECIMAL, INT, NVARCHAR
+
+from report.regression import RegressionDetector
+from report.warehouse import ResultsWarehouse
+
+TABLE = 'Perf_Azure_Network_TCP'
+COLUMNS = [{'name': 'TestCaseName', 'type': NVARCHAR(50)},
+           {'name': 'TestDate', 'type': Date},
+           {'name': 'InstanceSize', 'type': NVARCHAR(20)},
+           {'name': 'KernelVersion', 'type': NVARCHAR(50)},
+           {'name': 'DataPath', 'type': NVARCHAR(10)},
+           {'name': 'NumberOfConnections', 'type': INT},
+           {'name': 'Throughput_Gbps', 'type': DECIMAL(5, 3)},
+           {'name': 'Latency_ms', 'type': DECIMAL(9, 3)},
+           {'name': 'PacketSize_KBytes', 'type': DECIMAL(5, 3)}]
+
+
+def tcp_row(day, throughput, packet_size, connections='64'):
+    """
+    Row as produced by TCPLogsReader, the connections coming from the log file name and the
+    average packet size being measured by ntttcp.
+    """
+    return {'TestCaseName': 'network_tcp', 'TestDate': '2018-{:02d}-{:02d}'.format(
+                    day // 28 + 1, day % 28 + 1),
+            'InstanceSize': 'Standard_D4s_v3', 'KernelVersion': '4.15.0-1023-azure',
+            'DataPath': 'SRIOV', 'NumberOfConnections': connections,
+            'Throughput_Gbps': throughput, 'Latency_ms': 0.05,
+            'PacketSize_KBytes': packet_size}
+
+
+class TestRegressionDetector(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.warehouse = ResultsWarehouse('{}/warehouse.db'.format(self.tmp_dir), COLUMNS)
+        # each run measures a slightly different average packet size
+        self.warehouse.store(TABLE, [tcp_row(day, 10 + day % 5 * 0.01, 60 + day * 0.013)
+                                     for day in range(60)])
+
+    def tearDown(self):
+        self.warehouse.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_measured_values_do_not_split_test_points(self):
+        groups = RegressionDetector.group_rows([tcp_row(1, 10, 61.2), tcp_row(2, 10, 63.7)])
+        self.assertEqual(list(groups.values())[0], [tcp_row(1, 10, 61.2), tcp_row(2, 10, 63.7)])
+        _, _, params = list(groups)[0]
+        self.assertEqual(dict(params), {'DataPath': 'SRIOV', 'NumberOfConnections': '64'})
+
+    def test_repeated_tcp_run_finds_baseline(self):
+        regressions = RegressionDetector(self.warehouse).detect(
+                TABLE, [tcp_row(60, 7.5, 64.321)])
+        self.assertEqual([(regression['Metric'], regression['BaselineRuns'])
+                          for regression in regressions], [('Throughput_Gbps', 60)])
+
+    def test_other_test_point_has_no_baseline(self):
+        regressions = RegressionDetector(self.warehouse).detect(
+                TABLE, [tcp_row(60, 7.5, 64.321, connections='128')])
+        self.assertEqual(regressions, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,26 +18,165 @@ limitations under the License.
 See the Apache Version 2.0 License for specific language governing
 permissions and limitations under the License.
 """
+import io
 import os
+import json
 import time
+import uuid
+import zlib
+import random
+import Queue
+import pipes
+import hashlib
+import tarfile
 import logging
+import collections
 import paramiko
 import socket
+import threading
+import contextlib
 
 from paramiko.ssh_exception import NoValidConnectionsError
 
-from winrm import protocol
+from utils import constants
+from utils.tracing import traced
+from utils.parallel import run_parallel
+
 
 logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
                     datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
 log = logging.getLogger(__name__)
 
+# staged artifacts content and SHA-256, by (path, size, mtime)
+_artifacts = {}
+# parsed private keys, by (path, size, mtime, password)
+_keys = {}
+# pooled SSH connections, by (server, user)
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def load_artifact(path):
+    """
+    Read a file to stage. Shell scripts get the CR of their CRLF line endings removed, as
+    sed -i 's/\r//' would do remotely.
+    :param path: local file path
+    :return: content, SHA-256 hex digest
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    if key not in _artifacts:
+        with open(path, 'rb') as f:
+            content = f.read()
+        if path.endswith('.sh'):
+            content = '\n'.join(line.replace('\r', '', 1) for line in content.split('\n'))
+        _artifacts[key] = (content, hashlib.sha256(content).hexdigest())
+    return _artifacts[key]
+
+
+def load_key(path, password=None):
+    """
+    Parse a RSA private key file, once per process.
+    :param path: private key file path
+    :param password: optional password unlocking the key
+    :return: <paramiko.RSAKey>
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime, password)
+    if key not in _keys:
+        _keys[key] = paramiko.RSAKey.from_private_key_file(path, password=password)
+    return _keys[key]
+
+
+def backoff(start=constants.SSH_PROBE_INTERVAL, cap=constants.SSH_PROBE_MAX_INTERVAL):
+    """
+    Jittered exponential backoff delays, doubled from start up to cap. Each delay is scaled by
+    a random factor in [0.5, 1], so that concurrent waiters do not retry in lockstep.
+    :param start: first delay in seconds
+    :param cap: maximum delay in seconds
+    :return: infinite generator of delays
+    """
+    delay = start
+    while True:
+        yield delay * random.uniform(0.5, 1)
+        delay = min(delay * 2, cap)
+
+
+@traced('ssh.wait_for_ssh')
+def wait_for_ssh(server, port=22, timeout=constants.SSH_BOOT_TIMEOUT):
+    """
+    Wait for the sshd of a host to accept connections and send its banner. The port is
+    probed directly, with jittered exponential backoff, and the probe holds no shared state
+    so that many hosts can be waited for concurrently.
+    :param server: A server hostname or ip.
+    :param port: sshd port
+    :param timeout: seconds to wait for
+    :return: the sshd banner e.g. 'SSH-2.0-OpenSSH_7.4'
+    """
+    start = time.time()
+    delays = backoff()
+    while True:
+        try:
+            sock = socket.create_connection((server, port), constants.SSH_PROBE_MAX_INTERVAL)
+            try:
+                data = ''
+                # servers may send other lines before the banner
+                while len(data) < 4096:
+                    received = sock.recv(256)
+                    if not received:
+                        break
+                    data += received
+                    banner = [line for line in data.split('\n')[:-1] if line.startswith('SSH-')]
+                    if banner:
+                        log.info('SSH ready on {} after {:.1f}s'.format(server,
+                                                                      time.time() - start))
+                        return banner[0].strip()
+            finally:
+                sock.close()
+        except socket.error:
+            pass
+        remaining = start + timeout - time.time()
+        if remaining <= 0:
+            raise Exception('Timeout waiting for SSH on {}.'.format(server))
+        time.sleep(min(next(delays), remaining))
+
+
+class _Connection(object):
+    """
+    SSH connection of a host, shared by all its SSHClient objects. Exec and SFTP channels
+    are multiplexed over its single transport, up to SSHClient.MAX_CHANNELS at once.
+    """
+    def __init__(self):
+        self.client = None
+        self.lock = threading.Lock()
+        self.channels = threading.BoundedSemaphore(SSHClient.MAX_CHANNELS)
+
+    def active(self):
+        transport = self.client.get_transport() if self.client else None
+        return transport is not None and transport.is_active()
+
+    def reset(self):
+        """
+        Drop the transport, the next SSHClient.connect() opens a new one.
+        """
+        if self.client:
+            self.client.close()
+
+
+def _connection(server, user):
+    with _connections_lock:
+        if (server, user) not in _connections:
+            _connections[(server, user)] = _Connection()
+        return _connections[(server, user)]
+
 
 class SSHClient(object):
     """
     This class creates a paramiko.SSHClient() object that represents
     a session with an SSH server. You can use the SSHClient object to send
     commands to the remote host and manipulate files on the remote host.
+    The session is pooled: the SSHClient objects of a host share one connection, which is
+    reconnected transparently once stale e.g. after the host rebooted.
     :param server: A server hostname or ip.
     :param host_key_file: The path to the user's .ssh key files.
     :param user: The username for the SSH connection. Default = 'root'.
@@ -46,40 +185,75 @@ class SSHClient(object):
                     unlocking the private key.
     :param ssh_key_file: SSH key pem data
     """
+    # seconds between the checks of a command completion, also the initial retry backoff
+    WAIT_POLL = 0.5
+    # maximum seconds covered by a single remote wait command
+    WAIT_CHUNK = 10 * 60
+    # download() concurrent SFTP sessions, chunk size in bytes and attempts
+    DOWNLOAD_WORKERS = 4
+    DOWNLOAD_CHUNK = 8 * 1024 * 1024
+    DOWNLOAD_RETRIES = 5
+    # channels open at once on a pooled connection, below the sshd MaxSessions default of 10;
+    # the channels handed out by run_pty are not counted
+    MAX_CHANNELS = 8
+    # seconds between keepalive messages, so that dead connections get detected
+    KEEPALIVE = 30
+    # bytes of streamed command output kept in memory
+    STREAM_BUFFER = 1024 * 1024
+
     def __init__(self, server, host_key_file='~/.ssh/known_hosts', user='root', timeout=None,
                  ssh_pwd=None, ssh_key_file=None):
         self.server = server
         self.host_key_file = host_key_file
         self.user = user
         self._timeout = timeout
-        self._pkey = paramiko.RSAKey.from_private_key_file(ssh_key_file, password=ssh_pwd)
-        self._ssh_client = paramiko.SSHClient()
-        self._ssh_client.load_system_host_keys()
-        self._ssh_client.load_host_keys(os.path.expanduser(host_key_file))
-        self._ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self._pkey = load_key(ssh_key_file, password=ssh_pwd)
+        self._conn = _connection(server, user)
         self.connect()
 
+    @property
+    def _ssh_client(self):
+        return self._conn.client
+
     def connect(self, num_retries=10):
         """
-        Connect to an SSH server and authenticate with it.
+        Connect to an SSH server and authenticate with it, unless the pooled connection of
+        the server is still active.
         :type num_retries: int
         :param num_retries: The maximum number of connection attempts.
         """
+        with self._conn.lock:
+            if self._conn.active():
+                return
+            self._connect(num_retries)
+
+    @traced('ssh.connect')
+    def _connect(self, num_retries):
+        delays = backoff(cap=2 * constants.SSH_PROBE_MAX_INTERVAL)
+        self._conn.reset()
+        # host keys are reloaded on reconnection, the host may have been recreated meanwhile
+        self._conn.client = paramiko.SSHClient()
+        self._ssh_client.load_system_host_keys()
+        self._ssh_client.load_host_keys(os.path.expanduser(self.host_key_file))
+        self._ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         retry = 0
         while retry < num_retries:
             try:
                 self._ssh_client.connect(self.server, username=self.user, pkey=self._pkey,
                                          timeout=self._timeout)
+                self._ssh_client.get_transport().set_keepalive(self.KEEPALIVE)
                 return
             except NoValidConnectionsError:
-                log.error('NoValidConnectionsError, will retry in 10 seconds')
-                time.sleep(10)
+                delay = next(delays)
+                log.error('NoValidConnectionsError, will retry in {:.1f} seconds'.format(delay))
+                time.sleep(delay)
                 retry += 1
             except socket.error as se:
                 (value, message) = se.args
                 if value in (51, 61, 111):
-                    log.error('SSH Connection refused, will retry in 10 seconds')
-                    time.sleep(10)
+                    delay = next(delays)
+                    log.error('SSH Connection refused, will retry in {:.1f} seconds'.format(delay))
+                    time.sleep(delay)
                     retry += 1
                 else:
                     raise
@@ -88,19 +262,56 @@ class SSHClient(object):
                         self.server))
                 retry += 1
             except EOFError:
-                log.error('Unexpected Error from SSH Connection, retry in 10 seconds')
-                time.sleep(10)
+                delay = next(delays)
+                log.error('Unexpected Error from SSH Connection, retry in {:.1f} seconds'.format(
+                        delay))
+                time.sleep(delay)
                 retry += 1
         log.error('Could not establish SSH connection')
 
+    def _open(self, opener):
+        """
+        Open a channel, reconnecting once if the pooled connection turns out to be stale.
+        Failures on a still active connection e.g. a refused channel are raised as is, the
+        connection is shared and resetting it would kill the channels of the other clients.
+        :param opener: function opening the channel on self._ssh_client
+        :return: opener result
+        """
+        self.connect()
+        try:
+            return opener()
+        except (paramiko.SSHException, socket.error, EOFError) as e:
+            with self._conn.lock:
+                if self._conn.active():
+                    raise
+                log.info('Stale SSH connection to {}: {}, reconnecting'.format(self.server, e))
+                self._conn.reset()
+            self.connect()
+            return opener()
+
+    def _exec(self, command, timeout=None):
+        return self._open(lambda: self._ssh_client.exec_command(command, timeout=timeout))
+
+    @contextlib.contextmanager
+    def _channel(self):
+        """
+        Hold one of the MAX_CHANNELS channel slots of the pooled connection.
+        """
+        self._conn.channels.acquire()
+        try:
+            yield
+        finally:
+            self._conn.channels.release()
+
     def open_sftp(self):
         """
-        Open an SFTP session on the SSH server.
+        Open an SFTP session on the SSH server. The caller must close it.
         :rtype: :class:`paramiko.sftp_client.SFTPClient`
         :return: An SFTP client object.
         """
-        return self._ssh_client.open_sftp()
+        return self._open(lambda: self._ssh_client.open_sftp())
 
+    @traced('ssh.get_file')
     def get_file(self, src, dst):
         """
         Open an SFTP session on the remote host, and copy a file from
@@ -110,9 +321,161 @@ class SSHClient(object):
         :type dst: string
         :param dst: The path on your local host where you want to store the file.
         """
-        sftp_client = self.open_sftp()
-        sftp_client.get(src, dst)
+        with self._channel():
+            sftp_client = self.open_sftp()
+            try:
+                sftp_client.get(src, dst)
+            finally:
+                sftp_client.close()
+
+    @traced('ssh.download')
+    def download(self, src, dst, workers=None, compress=False):
+        """
+        Download a file with concurrent, pipelined SFTP reads of DOWNLOAD_CHUNK bytes chunks,
+        and verify it against the remote SHA-256. Transfers interrupted by connection errors
+        are resumed, also across runs: the completed chunks are tracked in <dst>.part.json,
+        next to the partial <dst>.part file.
+        :param src: The path to the target file on the remote host.
+        :param dst: The path on your local host where you want to store the file.
+        :param workers: number of concurrent SFTP sessions, DOWNLOAD_WORKERS by default
+        :param compress: stream the file gzip compressed instead, for compressible files on
+                         slow links; such transfers restart from scratch after an error
+        """
+        _, stdout, _ = self.run('stat -c %s {0} && sha256sum {0}'.format(src))
+        details = stdout.split()
+        if len(details) < 2:
+            raise Exception('Remote file {} not found.'.format(src))
+        state = {'src': src, 'size': int(details[0]), 'sha256': details[1],
+                 'chunk': self.DOWNLOAD_CHUNK, 'done': []}
+        part = dst + '.part'
+        state_path = part + '.json'
+        if os.path.isfile(part) and os.path.isfile(state_path):
+            with open(state_path) as f:
+                previous = json.load(f)
+            if all(previous.get(k) == state[k] for k in ['src', 'size', 'sha256', 'chunk']):
+                log.info('Resuming download of {}'.format(src))
+                state = previous
+        if not state['done']:
+            with open(part, 'wb') as f:
+                f.truncate(state['size'])
+        backoff = self.WAIT_POLL
+        for attempt in xrange(1, self.DOWNLOAD_RETRIES + 1):
+            try:
+                if compress:
+                    self._download_compressed(src, part)
+                else:
+                    self._download_chunks(src, part, state, state_path,
+                                          workers or self.DOWNLOAD_WORKERS)
+                break
+            except Exception as e:
+                if attempt == self.DOWNLOAD_RETRIES:
+                    raise
+                log.info('Download of {} interrupted: {}, resuming in {}s'.format(
+                        src, e, backoff))
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                self.connect()
+        sha256 = hashlib.sha256()
+        with open(part, 'rb') as f:
+            for data in iter(lambda: f.read(1024 * 1024), ''):
+                sha256.update(data)
+        if os.path.isfile(state_path):
+            os.remove(state_path)
+        if sha256.hexdigest() != state['sha256']:
+            os.remove(part)
+            raise Exception('SHA-256 mismatch for downloaded file {}.'.format(src))
+        if os.path.isfile(dst):
+            os.remove(dst)
+        os.rename(part, dst)
+
+    def _download_chunks(self, src, part, state, state_path, workers):
+        chunks = Queue.Queue()
+        done = set(state['done'])
+        for index in xrange(0, state['size'], state['chunk']):
+            if index // state['chunk'] not in done:
+                chunks.put(index // state['chunk'])
+        lock = threading.Lock()
+
+        def worker(_):
+            with self._channel():
+                sftp_client = self.open_sftp()
+                try:
+                    remote = sftp_client.open(src, 'rb')
+                    with open(part, 'r+b') as local:
+                        while True:
+                            try:
+                                index = chunks.get_nowait()
+                            except Queue.Empty:
+                                return
+                            offset = index * state['chunk']
+                            length = min(state['chunk'], state['size'] - offset)
+                            # readv pipelines the SFTP read requests of the chunk
+                            for data in remote.readv([(offset, length)]):
+                                local.seek(offset)
+                                local.write(data)
+                            local.flush()
+                            with lock:
+                                state['done'].append(index)
+                                with open(state_path + '.tmp', 'w') as f:
+                                    json.dump(state, f)
+                                os.rename(state_path + '.tmp', state_path)
+                finally:
+                    sftp_client.close()
+
+        run_parallel(worker, xrange(1, min(workers, chunks.qsize()) + 1), name='download')
+
+    def _download_compressed(self, src, part):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        with self._channel():
+            _, stdout, _ = self._exec('gzip -1 -c {}'.format(src))
+            with open(part, 'wb') as f:
+                for data in iter(lambda: stdout.read(1024 * 1024), ''):
+                    f.write(decompressor.decompress(data))
+                f.write(decompressor.flush())
+
+    @traced('ssh.stage')
+    def stage(self, artifacts):
+        """
+        Push a set of files to the remote host as a single tar stream, with their permissions.
+        Files already present remotely with the same content and mode are skipped. This takes
+        two round trips, whatever the number of files.
+        :param artifacts: list of (local path, remote path, mode) tuples e.g.
+                          [('tests/run_redis.sh', '/tmp/run_redis.sh', 0755)]
+        :return: remote paths pushed
+        """
+        if not artifacts:
+            return []
+        paths = ' '.join(dst for _, dst, _ in artifacts)
+        _, stdout, _ = self.run('for f in {}; do [ -f $f ] && echo $(stat -c %a $f) '
+                                '$(sha256sum < $f | cut -d" " -f1) $f; done; true'.format(paths))
+        present = {}
+        for line in stdout.splitlines():
+            mode, digest, dst = line.split(' ', 2)
+            present[dst] = (int(mode, 8), digest)
+        pushed = [(src, dst, mode) for src, dst, mode in artifacts
+                  if present.get(dst) != (mode, load_artifact(src)[1])]
+        if not pushed:
+            log.info('Artifacts already staged on {}'.format(self.server))
+            return []
+        log.info('Staging {} on {}'.format(', '.join(dst for _, dst, _ in pushed), self.server))
+        with self._channel():
+            stdin, stdout, stderr = self._exec('tar -x -p -C / -f -')
+            tar = tarfile.open(fileobj=stdin, mode='w|')
+            for src, dst, mode in pushed:
+                content, _ = load_artifact(src)
+                info = tarfile.TarInfo(dst.lstrip('/'))
+                info.size = len(content)
+                info.mode = mode
+                info.mtime = time.time()
+                tar.addfile(info, io.BytesIO(content))
+            tar.close()
+            stdin.channel.shutdown_write()
+            if stdout.channel.recv_exit_status():
+                raise Exception('Failed to stage artifacts on {}: {}'.format(
+                        self.server, stderr.read()))
+        return [dst for _, dst, _ in pushed]
 
+    @traced('ssh.put_file')
     def put_file(self, src, dst):
         """
         Open an SFTP session on the remote host, and copy a file from
@@ -122,9 +485,14 @@ class SSHClient(object):
         :type dst: string
         :param dst: The path on the remote host where you want to store the file.
         """
-        sftp_client = self.open_sftp()
-        sftp_client.put(src, dst)
+        with self._channel():
+            sftp_client = self.open_sftp()
+            try:
+                sftp_client.put(src, dst)
+            finally:
+                sftp_client.close()
 
+    @traced('ssh.run')
     def run(self, command, timeout=None):
         """
         Run a command on the remote host.
@@ -137,17 +505,116 @@ class SSHClient(object):
         """
         status = 0
         t = []
-        try:
-            t = self._ssh_client.exec_command(command, timeout=timeout)
-        except paramiko.SSHException:
-            status = 1
-        std_out = t[1].read()
-        std_err = t[2].read()
-        t[0].close()
-        t[1].close()
-        t[2].close()
+        with self._channel():
+            try:
+                t = self._exec(command, timeout=timeout)
+            except paramiko.SSHException:
+                status = 1
+            std_out = t[1].read()
+            std_err = t[2].read()
+            t[0].close()
+            t[1].close()
+            t[2].close()
         return status, std_out, std_err
 
+    @traced('ssh.run_batch')
+    def run_batch(self, commands, stop_on_error=False, timeout=None):
+        """
+        Run several commands in a single round trip. The commands run in order in one remote
+        shell, each in its own subshell, and their exit codes and outputs are framed so that
+        the results stay individually addressable.
+        :param commands: list of commands, or dict of commands by name
+        :param stop_on_error: do not run the commands following a failed one, their result
+                              is None
+        :param timeout: pass timeout along the line.
+        :return: list, or dict by name, of (status, stdout, stderr) tuples like run returns
+        """
+        names, commands = self._commands(commands)
+        boundary = uuid.uuid4().hex
+        script = ['d=$(mktemp -d)', "trap 'rm -rf $d' EXIT"]
+        for index, command in enumerate(commands):
+            script.append('(eval {}) > $d/o 2> $d/e < /dev/null; rc=$?'.format(
+                    pipes.quote(command)))
+            script.append('echo "{} {} $rc $(wc -c < $d/o) $(wc -c < $d/e)"; '
+                          'cat $d/o $d/e'.format(boundary, index))
+            if stop_on_error:
+                script.append('[ $rc -eq 0 ] || exit 0')
+        _, stdout, _ = self.run('bash -c {}'.format(pipes.quote('\n'.join(script))),
+                                timeout=timeout)
+        results = [None] * len(commands)
+        position = 0
+        while True:
+            start = stdout.find(boundary + ' ', position)
+            if start < 0:
+                break
+            end = stdout.index('\n', start)
+            index, status, out_size, err_size = [int(v) for v in stdout[start:end].split()[1:]]
+            out_end = end + 1 + out_size
+            results[index] = (status, stdout[end + 1:out_end],
+                              stdout[out_end:out_end + err_size])
+            position = out_end + err_size
+        return self._results(names, results)
+
+    @traced('ssh.run_concurrent')
+    def run_concurrent(self, commands, timeout=None):
+        """
+        Run independent commands concurrently, on up to MAX_CHANNELS channels open at once on
+        the same connection, so that their round trips overlap.
+        :param commands: list of commands, or dict of commands by name
+        :param timeout: pass timeout along the line.
+        :return: list, or dict by name, of (status, stdout, stderr) tuples like run returns
+        """
+        names, commands = self._commands(commands)
+        results = [None] * len(commands)
+        pending = []
+
+        def collect():
+            index, (stdin, stdout, stderr) = pending.pop(0)
+            try:
+                results[index] = (stdout.channel.recv_exit_status(), stdout.read(),
+                                  stderr.read())
+                stdin.close()
+            finally:
+                self._conn.channels.release()
+
+        try:
+            for index, command in enumerate(commands):
+                # collect first rather than block while holding slots, other threads may
+                # be waiting for them as well
+                acquired = False
+                while pending and not acquired:
+                    acquired = (len(pending) < self.MAX_CHANNELS and
+                                self._conn.channels.acquire(False))
+                    if not acquired:
+                        collect()
+                if not acquired:
+                    self._conn.channels.acquire()
+                try:
+                    pending.append((index, self._exec(command, timeout=timeout)))
+                except Exception:
+                    self._conn.channels.release()
+                    raise
+            while pending:
+                collect()
+        finally:
+            for _ in pending:
+                self._conn.channels.release()
+        return self._results(names, results)
+
+    @staticmethod
+    def _commands(commands):
+        if isinstance(commands, dict):
+            names = list(commands)
+            return names, [commands[name] for name in names]
+        return None, list(commands)
+
+    @staticmethod
+    def _results(names, results):
+        if names is None:
+            return results
+        return dict(zip(names, results))
+
+    @traced('ssh.run_pty')
     def run_pty(self, command):
         """
         Request a pseudo-terminal from a server, and execute a command on that server.
@@ -156,17 +623,245 @@ class SSHClient(object):
         :rtype: :class:`paramiko.channel.Channel`
         :return: An open channel object.
         """
-        channel = self._ssh_client.get_transport().open_session()
+        channel = self._open(lambda: self._ssh_client.get_transport().open_session())
         channel.get_pty()
         channel.exec_command(command)
         return channel
 
+    @traced('ssh.stream')
+    def stream(self, command, log_path=None, max_buffer=None, idle_timeout=None, timeout=None,
+               pty=False):
+        """
+        Run a command on the remote host and stream its output, stderr included, as it
+        arrives. The command holds one of the MAX_CHANNELS channel slots until the stream
+        is closed, so use it as a context manager:
+            with ssh_client.stream(cmd, log_path='/tmp/cmd.log') as command:
+                for line in command:
+                    ...
+            status = command.status
+        :param command: The command that you want to run on the remote host.
+        :param log_path: optional local file the output is written to as it arrives
+        :param max_buffer: bytes of output kept in memory, STREAM_BUFFER by default
+        :param idle_timeout: seconds without any output after which the command is
+                             considered hung, None to wait indefinitely
+        :param timeout: seconds to wait for the command to end, None to wait indefinitely
+        :param pty: request a pseudo-terminal, so that the command ends with the channel
+        :return: <CommandStream>
+        """
+        self._conn.channels.acquire()
+        try:
+            channel = self._open(lambda: self._ssh_client.get_transport().open_session())
+            if pty:
+                channel.get_pty()
+            channel.set_combine_stderr(True)
+            channel.exec_command(command)
+        except Exception:
+            self._conn.channels.release()
+            raise
+        return CommandStream(channel, release=self._conn.channels.release, log_path=log_path,
+                             max_buffer=max_buffer or self.STREAM_BUFFER,
+                             idle_timeout=idle_timeout, timeout=timeout)
+
+    def wait(self, channel, timeout=None):
+        """
+        Wait for the command of a channel, e.g. opened by run_pty, to exit. The command
+        output is drained meanwhile, so that the command never blocks on a full channel.
+        :param channel: <paramiko.channel.Channel> running the command
+        :param timeout: seconds to wait for, None to wait indefinitely
+        :return: the command exit status, None if the channel closed without one e.g. when
+                 the connection was lost
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        channel.settimeout(self.WAIT_POLL)
+        while not channel.exit_status_ready():
+            if deadline is not None and time.time() > deadline:
+                raise Exception('Timeout waiting for process to end.')
+            try:
+                if not channel.recv(32768):
+                    # output closed, the exit status may still be on its way
+                    if channel.closed:
+                        break
+                    time.sleep(self.WAIT_POLL)
+            except socket.timeout:
+                pass
+        if channel.exit_status_ready():
+            return channel.recv_exit_status()
+        return None
+
+    def wait_for_process(self, name, timeout=None):
+        """
+        Wait for the remote processes matching name to end. The processes are checked every
+        second by a loop running on the remote host, so a single round trip covers up to
+        WAIT_CHUNK seconds. Connection errors are retried with an exponential backoff.
+        :param name: pattern matched against the processes command line e.g. a script name
+        :param timeout: seconds to wait for, None to wait indefinitely
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        # the bracket keeps the pattern from matching the waiting shell itself
+        pattern = '[{}]{}'.format(name[0], name[1:])
+        backoff = self.WAIT_POLL
+        while True:
+            chunk = self.WAIT_CHUNK
+            if deadline is not None:
+                chunk = int(min(chunk, max(deadline - time.time(), 1)))
+            try:
+                with self._channel():
+                    _, stdout, _ = self._exec(
+                            "timeout {} bash -c 'while pgrep -f \"{}\" > /dev/null; do sleep 1; "
+                            "done'; echo $?".format(chunk, pattern))
+                    done = stdout.read().strip() == '0'
+                if done:
+                    return
+                backoff = self.WAIT_POLL
+            except (paramiko.SSHException, socket.error, EOFError) as e:
+                log.info('Lost connection while waiting for {}: {}, retrying in {}s'.format(
+                        name, e, backoff))
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                self.connect()
+            if deadline is not None and time.time() > deadline:
+                raise Exception('Timeout waiting for process to end.')
+
+    def boot_id(self):
+        """
+        Identifier of the current boot of the remote host, changed by each reboot.
+        :return: boot id, empty if it could not be read
+        """
+        return self.run('cat /proc/sys/kernel/random/boot_id')[1].strip()
+
+    def wait_for_reboot(self, boot_id, timeout=constants.SSH_BOOT_TIMEOUT):
+        """
+        Wait for the remote host to be back from a reboot, as some reboot APIs return before
+        the host actually went down.
+        :param boot_id: boot id read before the reboot
+        :param timeout: seconds to wait for
+        """
+        deadline = time.time() + timeout
+        delays = backoff()
+        while True:
+            try:
+                if self.boot_id() not in ('', boot_id):
+                    return
+            except Exception as e:
+                log.info('Waiting for {} to reboot: {}'.format(self.server, e))
+                wait_for_ssh(self.server, timeout=max(deadline - time.time(), 0))
+            if time.time() > deadline:
+                raise Exception('Timeout waiting for {} to reboot.'.format(self.server))
+            time.sleep(next(delays))
+
+    def close(self):
+        """
+        Close an SSH session and any open channels that are tied to it. This closes the
+        pooled connection of the host, for all its SSHClient objects.
+        """
+        with self._conn.lock:
+            self._conn.reset()
+
+
+class CommandStream(object):
+    """
+    Output of a remote command, streamed by SSHClient.stream(). Iterating yields the output
+    lines as they arrive, and only the last max_buffer bytes are kept in memory.
+    :param channel: <paramiko.channel.Channel> running the command
+    :param release: optional function called once the channel is closed
+    :param log_path: optional local file the output is written to as it arrives
+    :param max_buffer: bytes of output kept in memory
+    :param idle_timeout: seconds without any output after which the command is considered
+                         hung, None to wait indefinitely
+    :param timeout: seconds to wait for the command to end, None to wait indefinitely
+    """
+    def __init__(self, channel, release=None, log_path=None, max_buffer=SSHClient.STREAM_BUFFER,
+                 idle_timeout=None, timeout=None):
+        self.channel = channel
+        self.max_buffer = max_buffer
+        self.idle_timeout = idle_timeout
+        self.deadline = time.time() + timeout if timeout is not None else None
+        # exit status, None until the command ends or if the connection was lost
+        self.status = None
+        # whether older output was dropped from memory
+        self.truncated = False
+        self._release = release
+        self._log = open(log_path, 'ab') if log_path else None
+        self._tail = collections.deque()
+        self._tail_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        partial = ''
+        last_output = time.time()
+        self.channel.settimeout(SSHClient.WAIT_POLL)
+        while True:
+            if self.deadline is not None and time.time() > self.deadline:
+                raise Exception('Timeout waiting for process to end.')
+            try:
+                data = self.channel.recv(32768)
+            except socket.timeout:
+                if (self.idle_timeout is not None and
+                        time.time() - last_output > self.idle_timeout):
+                    raise Exception('No output from the process for {}s.'.format(
+                            self.idle_timeout))
+                continue
+            if not data:
+                break
+            last_output = time.time()
+            if self._log:
+                self._log.write(data)
+                self._log.flush()
+            lines = (partial + data).split('\n')
+            partial = lines.pop()
+            # a line longer than the buffer, e.g. a progress bar, is yielded in pieces
+            if len(partial) > self.max_buffer:
+                lines.append(partial)
+                partial = ''
+            for line in lines:
+                self._keep(line + '\n')
+                yield line
+        if partial:
+            self._keep(partial)
+            yield partial
+        # the exit status is -1 when the channel closed without one
+        status = self.channel.recv_exit_status()
+        self.status = status if status != -1 else None
+
+    def _keep(self, line):
+        self._tail.append(line)
+        self._tail_size += len(line)
+        while self._tail_size > self.max_buffer and len(self._tail) > 1:
+            self._tail_size -= len(self._tail.popleft())
+            self.truncated = True
+
+    @property
+    def output(self):
+        """
+        Last max_buffer bytes of output.
+        """
+        return ''.join(self._tail)
+
+    def wait(self):
+        """
+        Consume the remaining output and wait for the command to end.
+        :return: the command exit status, None if the connection was lost
+        """
+        for _ in self:
+            pass
+        return self.status
+
     def close(self):
         """
-        Close an SSH session and any open channels that are tied to it.
+        Close the channel, the command ends with it if it runs on a pseudo-terminal.
         """
-        transport = self._ssh_client.get_transport()
-        transport.close()
+        self.channel.close()
+        if self._log:
+            self._log.close()
+            self._log = None
+        if self._release:
+            self._release()
+            self._release = None
 
 
 class WinRMClient(object):
@@ -200,6 +895,8 @@ class WinRMClient(object):
             cmd = 'powershell -NoProfile -NonInteractive ' + cmd
 
         secure_host = '{}://{}:{}/wsman'.format(self.proto, self.host, self.port)
+        # pywinrm is only needed for the Windows tests
+        from winrm import protocol
         protocol.Protocol.DEFAULT_TIMEOUT = "PT7200S"
         try:
             p = protocol.Protocol(endpoint=secure_host, transport=transport,
@@ -63,14 +63,28 @@ CLI_KERNEL_OPT = '--kernel'
 CLI_KERNEL_OPT_SH = '-kr'
 CLI_SUITE_OPT = '--suite'
 CLI_SUITE_OPT_SH = '-su'
+CLI_CONCURRENCY_OPT = '--concurrency'
+CLI_CONCURRENCY_OPT_SH = '-cc'
+CLI_QUOTA_CORES_OPT = '--quotacores'
+CLI_QUOTA_CORES_OPT_SH = '-qc'
+CLI_QUOTA_IPS_OPT = '--quotaips'
+CLI_QUOTA_IPS_OPT_SH = '-qi'
+CLI_INST_CORES_OPT = '--instancecores'
+CLI_INST_CORES_OPT_SH = '-ic'
+CLI_REUSE_ENV_OPT = '--reuseenv'
+CLI_REUSE_ENV_OPT_SH = '-re'
+CLI_RESUME_OPT = '--resume'
+CLI_RESUME_OPT_SH = '-rs'
 
 AWS = 'aws'
 AZURE = 'azure'
 GCE = 'gce'
+LOCAL = 'local'
 
 HVM = 'hvm'
 MSAZURE = 'MS Azure'
 KVM = 'kvm'
+LOCALHOST = 'localhost'
 
 SYNTHETIC_TESTS = ['test_orion', 'test_orion_raid', 'test_sysbench', 'test_sysbench_raid',
                    'test_scheduler', 'test_storage', 'test_tensorflow_gpu', 'test_tensorflow_cpu', 'test_nodejs', 'test_elasticsearch']
@@ -100,6 +114,16 @@ SYNTHETIC = 'Synthetic'
 # timeout in seconds; default 3h
 TIMEOUT = 3 * 60 * 60
 
+# maximum number of VMs tuned concurrently
+PERF_TUNING_WORKERS = 8
+# port the first VM shares the kernel package on, with the other VMs of the environment
+KERNEL_SHARE_PORT = 8099
+
+# SSH readiness probe: first and maximum backoff delays, and boot timeout in seconds
+SSH_PROBE_INTERVAL = 0.25
+SSH_PROBE_MAX_INTERVAL = 10
+SSH_BOOT_TIMEOUT = 10 * 60
+
 # SQL Server constants
 MSSQL_USER = 'sa'
 PS_PATH = 'C:\\\\inmemdb\\\\Data_Generator\\\\PS_scripts\\\\'
@@ -0,0 +1,166 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import time
+import logging
+import threading
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+class EnvironmentPool(object):
+    """
+    Pool of provisioned test environments, reused by the tests requiring the same environment
+    shape e.g. (provider, instancetype, imageid, vm_count, disk layout, sriov, kernel).
+    Environments are reset between leases, and torn down when idle for longer than
+    idle_timeout, when failing to reset or when the pool is closed. An idle environment keeps
+    the quota reservation of its last test until torn down, see evict().
+    """
+    def __init__(self, reset, teardown, idle_timeout=30 * 60):
+        """
+        :param reset: function(environment) cleaning up an environment for its next lease
+        :param teardown: function(environment) releasing the environment resources
+        :param idle_timeout: seconds after which an idle environment is torn down
+        """
+        self.reset = reset
+        self.teardown = teardown
+        self.idle_timeout = idle_timeout
+        self.idle = {}
+        self.leased = {}
+        self.closed = False
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.reaper = threading.Thread(target=self._reap, name='EnvironmentPoolReaper')
+        self.reaper.daemon = True
+        self.reaper.start()
+
+    def lease(self, key):
+        """
+        Lease an idle environment.
+        :param key: environment shape
+        :return: environment, None if no idle environment matches the key
+        """
+        with self.lock:
+            if self.closed or not self.idle.get(key, None):
+                return None
+            environment, _, reservation = self.idle[key].pop()
+            self.leased[id(environment)] = (key, environment)
+        # the leasing test holds its own reservation
+        if reservation:
+            reservation.release()
+        log.info('Reusing test environment {}.'.format(key))
+        return environment
+
+    def add(self, key, environment):
+        """
+        Track a newly provisioned environment, as leased.
+        """
+        with self.lock:
+            self.leased[id(environment)] = (key, environment)
+
+    def release(self, environment, healthy=True, reservation=None):
+        """
+        Return a leased environment to the pool, after resetting it.
+        :param environment: leased environment
+        :param healthy: False to tear it down instead e.g. if the test failed
+        :param reservation: <scheduler.Reservation> of the releasing test, transferred to the
+                            environment while idle
+        """
+        with self.lock:
+            key, _ = self.leased.pop(id(environment), (None, None))
+            closed = self.closed
+        if key is None:
+            raise Exception('Environment not leased from this pool.')
+        if healthy and not closed:
+            try:
+                self.reset(environment)
+            except Exception as e:
+                log.exception(e)
+                healthy = False
+        with self.lock:
+            if healthy and not self.closed:
+                self.idle.setdefault(key, []).append(
+                        (environment, time.time(), reservation.transfer() if reservation else None))
+                return
+        self._teardown(environment)
+
+    def discard(self, environment):
+        """
+        Stop tracking an environment torn down by its user.
+        """
+        with self.lock:
+            self.leased.pop(id(environment), None)
+
+    def evict(self):
+        """
+        Tear down the least recently released idle environment, e.g. to free quota for a test
+        requiring another environment shape.
+        :return: False if there was no idle environment
+        """
+        with self.lock:
+            entries = [(released, key, environment, reservation)
+                       for key, environments in self.idle.items()
+                       for environment, released, reservation in environments]
+            if not entries:
+                return False
+            released, key, environment, reservation = min(entries, key=lambda e: e[0])
+            self.idle[key].remove((environment, released, reservation))
+        log.info('Evicting idle test environment {}.'.format(key))
+        self._teardown(environment, reservation)
+        return True
+
+    def _teardown(self, environment, reservation=None):
+        try:
+            self.teardown(environment)
+        except Exception as e:
+            log.exception(e)
+        finally:
+            if reservation:
+                reservation.release()
+
+    def _reap(self):
+        while not self.stopped.wait(min(60, self.idle_timeout)):
+            expired = []
+            with self.lock:
+                for key, environments in self.idle.items():
+                    for entry in list(environments):
+                        if time.time() - entry[1] > self.idle_timeout:
+                            environments.remove(entry)
+                            expired.append(entry)
+            for environment, _, reservation in expired:
+                log.info('Tearing down test environment idle for {}s.'.format(self.idle_timeout))
+                self._teardown(environment, reservation)
+
+    def close(self):
+        """
+        Tear down all the environments, the idle and the still leased ones.
+        """
+        self.stopped.set()
+        with self.lock:
+            self.closed = True
+            environments = [(environment, reservation) for environments in self.idle.values()
+                            for environment, _, reservation in environments]
+            environments.extend((environment, None) for _, environment in self.leased.values())
+            self.idle = {}
+            self.leased = {}
+        for environment, reservation in environments:
+            self._teardown(environment, reservation)
@@ -0,0 +1,131 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import os
+import json
+import time
+import logging
+import threading
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+PENDING = 'pending'
+PROVISIONING = 'provisioning'
+RUNNING = 'running'
+DOWNLOADED = 'downloaded'
+UPLOADED = 'uploaded'
+
+# journal of the current run and test executed by the current thread, see record()
+_journal = None
+_current = threading.local()
+
+
+class RunJournal(object):
+    """
+    Run journal checkpointing the state of each test and its results to a JSON file, so that
+    an interrupted suite run can be resumed.
+    """
+    def __init__(self, path, resume=False):
+        """
+        :param path: journal file path
+        :param resume: load the previous run journal from path, else start a new one
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.tests = {}
+        if resume and os.path.isfile(path):
+            with open(path, 'r') as f:
+                self.tests = json.load(f)
+            log.info('Resuming run from journal {}.'.format(path))
+
+    def get(self, test):
+        """
+        :param test: test name
+        :return: <dict> test entry e.g. {'state': 'downloaded', 'results_path': ...}
+        """
+        with self.lock:
+            return dict(self.tests.get(test, {'state': PENDING}))
+
+    def update(self, test, state=None, **details):
+        """
+        Update and checkpoint a test entry.
+        :param test: test name
+        :param state: new test state, e.g. RUNNING
+        :param details: other entry details e.g. results_path
+        """
+        with self.lock:
+            entry = self.tests.setdefault(test, {'state': PENDING})
+            if state:
+                entry['state'] = state
+            entry.update(details)
+            entry['updated'] = time.time()
+            self._save()
+
+    def _save(self):
+        # replace the journal atomically, it must stay readable if the run dies meanwhile
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.tests, f, indent=2, sort_keys=True)
+        os.rename(temp_path, self.path)
+
+    def reupload(self, test):
+        """
+        Upload again the results downloaded by a test, using the upload_results arguments
+        it recorded.
+        :param test: test name
+        """
+        from report import results_parser
+        from report.db_utils import upload_results
+        upload = dict(self.get(test)['upload'])
+        upload['parser'] = getattr(results_parser, upload['parser'])
+        set_test(test)
+        try:
+            upload_results(**upload)
+        finally:
+            set_test(None)
+
+
+def activate(journal):
+    """
+    Set the journal updated by record() for the current run.
+    :param journal: <RunJournal>, None to disable journaling
+    """
+    global _journal
+    _journal = journal
+
+
+def set_test(test):
+    """
+    Set the test executed by the current thread.
+    """
+    _current.test = test
+
+
+def record(state=None, **details):
+    """
+    Record the state of the test executed by the current thread, if journaling is active.
+    :param state: new test state, e.g. RUNNING
+    :param details: other entry details e.g. results_path
+    """
+    test = getattr(_current, 'test', None)
+    if _journal and test:
+        _journal.update(test, state=state, **details)
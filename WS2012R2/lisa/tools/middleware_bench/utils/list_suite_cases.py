@@ -1,10 +1,9 @@
 import sys
 import copy
 import argparse
-import importlib
 
 sys.path.append('../')
-import suites
+from utils.manifest import discover_tests
 
 def Run(option):
     parser = argparse.ArgumentParser(description="Get all cases name in the specified suite")
@@ -14,9 +13,9 @@ def Run(option):
     args = parser.parse_args(option)
     test_args = copy.deepcopy(vars(args))
     suite = test_args['suite']
-    test_names = [test
-                  for test in dir(importlib.import_module('suites.{}'.format(suite)))
-                  if 'test_' in test]
+    test_names = discover_tests().get(suite, None)
+    if test_names is None:
+        raise Exception('Suite {} not defined.'.format(suite))
     print ','.join(test_names)
 
 Run(sys.argv[1:])
@@ -0,0 +1,56 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import os
+import ast
+import logging
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+SUITES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'suites')
+
+
+def scan_suite(suite_file):
+    """
+    Statically list the tests defined in a suite module, without importing it and the
+    provider SDKs it depends on.
+    :param suite_file: suite module path
+    :return: sorted list of test function names
+    """
+    with open(suite_file, 'r') as f:
+        tree = ast.parse(f.read(), suite_file)
+    return sorted(node.name for node in tree.body
+                  if isinstance(node, ast.FunctionDef) and 'test_' in node.name)
+
+
+def discover_tests(suites_path=SUITES_PATH):
+    """
+    Lookup suites and tests.
+    :param suites_path: suites package path
+    :return: <dict> {suite name: [test names]}
+    """
+    test_names = {}
+    for suite_file in sorted(os.listdir(suites_path)):
+        suite, ext = os.path.splitext(suite_file)
+        if ext == '.py' and not suite.startswith('_'):
+            test_names[suite] = scan_suite(os.path.join(suites_path, suite_file))
+    return test_names
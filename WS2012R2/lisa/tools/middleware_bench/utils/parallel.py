@@ -0,0 +1,178 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import os
+import time
+import logging
+import threading
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+def run_parallel(func, keys, name=None, max_workers=None):
+    """
+    Call func(key) concurrently for each key, e.g. for each VM of a test environment.
+    The worker threads are named after the calling thread, so their logs end up in the test
+    log. All the calls are waited for, even when some fail, so that no provider operation is
+    still running when the caller tears down the environment.
+    :param func: function(key) to call
+    :param keys: keys to call func with e.g. VM tags
+    :param name: operation name used in the thread names and errors e.g. 'create_vm'
+    :param max_workers: maximum number of concurrent calls, unbounded by default
+    :return: <dict> {key: func(key) result}
+    """
+    name = name or func.__name__
+    prefix = threading.current_thread().name
+    results = {}
+    errors = {}
+    workers = threading.BoundedSemaphore(max_workers) if max_workers else None
+
+    def call(key):
+        if workers:
+            workers.acquire()
+        try:
+            results[key] = func(key)
+        except Exception as e:
+            log.exception(e)
+            errors[key] = e
+        finally:
+            if workers:
+                workers.release()
+
+    threads = []
+    for key in keys:
+        thread = threading.Thread(target=call, name='{}-{}{}'.format(prefix, name, key),
+                                  args=(key,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise Exception('{} failed for {}: {}'.format(
+                name, ', '.join(str(key) for key in sorted(errors)),
+                '; '.join(str(errors[key]) or type(errors[key]).__name__
+                          for key in sorted(errors))))
+    return results
+
+
+class Barrier(object):
+    """
+    Single use synchronization point of a fixed number of threads, as threading.Barrier is
+    python 3 only. A party failing before it reaches the barrier aborts it, so that the other
+    parties do not wait forever.
+    :param parties: number of threads to wait for
+    """
+    def __init__(self, parties):
+        self.parties = parties
+        self.count = 0
+        self.broken = False
+        self.condition = threading.Condition()
+
+    def wait(self, timeout=None):
+        """
+        Wait for all the parties to reach the barrier.
+        :param timeout: seconds to wait for, None to wait indefinitely
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.condition:
+            self.count += 1
+            self.condition.notify_all()
+            while self.count < self.parties and not self.broken:
+                if deadline is not None and time.time() > deadline:
+                    self.broken = True
+                    self.condition.notify_all()
+                    break
+                self.condition.wait(deadline - time.time() if deadline is not None else None)
+            if self.count < self.parties:
+                raise Exception('Barrier broken, {} of {} parties arrived.'.format(
+                        self.count, self.parties))
+
+    def abort(self):
+        """
+        Break the barrier, the parties waiting on it raise.
+        """
+        with self.condition:
+            self.broken = True
+            self.condition.notify_all()
+
+
+class FanOut(object):
+    """
+    Run a command across the nodes of a test environment concurrently, e.g. start all the
+    servers of a cluster test, then all its clients. Each run is a synchronized phase: the
+    nodes are connected first, then all start the command at once behind a barrier, and the
+    run returns when every node is done. The output of each node is streamed to its own log.
+    :param ssh_clients: <dict> SSHClient by node key e.g. SetupTestEnv.ssh_client
+    :param log_dir: optional local directory the node outputs are written to as they arrive,
+                    in <phase name>_<node key>.log files
+    """
+    def __init__(self, ssh_clients, log_dir=None):
+        self.ssh_clients = ssh_clients
+        self.log_dir = log_dir
+
+    def run(self, command, nodes=None, name='run', timeout=None, check=True):
+        """
+        Run a phase.
+        :param command: command to run on every node, or function(key) returning the command
+                        of a node
+        :param nodes: keys of the nodes to run the command on, all the nodes by default
+        :param name: phase name, used in the thread names, logs and errors
+        :param timeout: seconds each node command may run for, None to wait indefinitely
+        :param check: raise if a node command does not exit with status 0
+        :return: <dict> {key: (status, output)}, the output being the stream tail kept in
+                 memory and the status None if the connection was lost
+        """
+        nodes = sorted(self.ssh_clients) if nodes is None else list(nodes)
+        barrier = Barrier(len(nodes))
+
+        def node(key):
+            client = self.ssh_clients[key]
+            try:
+                node_command = command(key) if callable(command) else command
+                client.connect()
+            except Exception:
+                barrier.abort()
+                raise
+            barrier.wait()
+            log_path = None
+            if self.log_dir:
+                log_path = os.path.join(self.log_dir, '{}_{}.log'.format(name, key))
+            start = time.time()
+            with client.stream(node_command, log_path=log_path, timeout=timeout) as stream:
+                stream.wait()
+            log.info('{} on node {} exited with status {} after {:.1f}s'.format(
+                    name, key, stream.status, time.time() - start))
+            return stream.status, stream.output
+
+        log.info('Running {} on nodes {}'.format(name, ', '.join(str(key) for key in nodes)))
+        results = run_parallel(node, nodes, name=name)
+        failed = sorted(key for key, (status, _) in results.items() if status != 0)
+        if check and failed:
+            errors = []
+            for key in failed:
+                status, output = results[key]
+                lines = output.strip().splitlines()
+                errors.append(lines[-1] if lines else 'exit status {}'.format(status))
+            raise Exception('{} failed on nodes {}: {}'.format(
+                    name, ', '.join(str(key) for key in failed), '; '.join(errors)))
+        return results
@@ -0,0 +1,281 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import os
+import ast
+import time
+import inspect
+import logging
+import textwrap
+import threading
+
+from junit_xml import TestCase
+
+from utils import constants
+from utils import journal
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+# quota reservation of the test executed by the current thread, see current_reservation()
+_current = threading.local()
+
+
+def get_vm_count(test_func, default=1):
+    """
+    Look up the number of VMs a test provisions, from the SetupTestEnv call in its source.
+    :param test_func: test_* function
+    :param default: VM count used when it can't be statically determined
+    :return: <int> VM count
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(test_func)))
+    except (IOError, TypeError, SyntaxError):
+        return default
+    assigned = {}
+    counts = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Num):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    assigned[target.id] = node.value.n
+        elif isinstance(node, ast.Call) and getattr(node.func, 'id', None) == 'SetupTestEnv':
+            for keyword in node.keywords:
+                if keyword.arg == 'vm_count':
+                    counts.append(keyword.value)
+    values = []
+    for value in counts:
+        if isinstance(value, ast.Num):
+            values.append(value.n)
+        elif isinstance(value, ast.Name) and value.id in assigned:
+            values.append(assigned[value.id])
+    return max(values) if values else default
+
+
+def current_reservation():
+    """
+    Quota reservation of the test executed by the current thread.
+    :return: <Reservation>, None if not run by a TestScheduler
+    """
+    return getattr(_current, 'reservation', None)
+
+
+class QuotaPool(object):
+    """
+    Per provider quotas e.g. {'azure': {'cores': 100, 'public_ips': 20}}, shared by the tests
+    running concurrently. Resources not listed are not limited.
+    """
+    def __init__(self, quotas, reclaim=None):
+        """
+        :param quotas: per provider quotas
+        :param reclaim: optional function() freeing idle reserved resources e.g. evicting a
+                        pooled environment, returning False once there are none left
+        """
+        self.available = dict((provider, dict(limits)) for provider, limits in quotas.items())
+        self.limits = quotas
+        self.reclaim = reclaim
+        self.condition = threading.Condition()
+
+    def check(self, provider, demand):
+        limits = self.limits.get(provider, {})
+        for resource, amount in demand.items():
+            if resource in limits and amount > limits[resource]:
+                raise Exception('Test needs {} {}, over the {} quota of {}.'.format(
+                        amount, resource, provider, limits[resource]))
+
+    def _fits(self, provider, demand):
+        available = self.available.get(provider, {})
+        return all(amount <= available[resource] for resource, amount in demand.items()
+                   if resource in available)
+
+    def acquire(self, provider, demand):
+        """
+        Wait until the demand fits in the provider quotas, then reserve it.
+        :param provider: service provider e.g. azure
+        :param demand: <dict> e.g. {'cores': 16, 'public_ips': 2}
+        """
+        self.check(provider, demand)
+        with self.condition:
+            while not self._fits(provider, demand):
+                if self.reclaim:
+                    # reclaiming tears down resources, which releases them to this pool
+                    self.condition.release()
+                    try:
+                        reclaimed = self.reclaim()
+                    finally:
+                        self.condition.acquire()
+                    if reclaimed:
+                        continue
+                self.condition.wait()
+            available = self.available.get(provider, {})
+            for resource, amount in demand.items():
+                if resource in available:
+                    available[resource] -= amount
+
+    def release(self, provider, demand):
+        with self.condition:
+            available = self.available.get(provider, {})
+            for resource, amount in demand.items():
+                if resource in available:
+                    available[resource] += amount
+            self.condition.notify_all()
+
+    def notify(self):
+        """
+        Wake up the waiting acquire() calls e.g. once resources became reclaimable.
+        """
+        with self.condition:
+            self.condition.notify_all()
+
+
+class Reservation(object):
+    """
+    Demand reserved in a QuotaPool, released once. A test reservation is transferred to its
+    environment when the environment is kept in the EnvironmentPool, so that idle pooled
+    environments still count against the quotas until they are torn down.
+    """
+    def __init__(self, quotas, provider, demand):
+        self.quotas = quotas
+        self.provider = provider
+        self.demand = demand
+        self.released = False
+        self.lock = threading.Lock()
+
+    def release(self):
+        with self.lock:
+            if self.released:
+                return
+            self.released = True
+        self.quotas.release(self.provider, self.demand)
+
+    def transfer(self):
+        """
+        Hand the demand over to a new reservation, this one releases nothing anymore.
+        :return: <Reservation>, None if already released
+        """
+        with self.lock:
+            if self.released:
+                return None
+            self.released = True
+        self.quotas.notify()
+        return Reservation(self.quotas, self.provider, self.demand)
+
+
+class ThreadLogFilter(logging.Filter):
+    """
+    Pass only the log records emitted by a test thread, or by the threads it names after it.
+    """
+    def __init__(self, thread_name):
+        super(ThreadLogFilter, self).__init__()
+        self.thread_name = thread_name
+
+    def filter(self, record):
+        return record.threadName == self.thread_name or \
+            record.threadName.startswith(self.thread_name + '-')
+
+
+class TestScheduler(object):
+    """
+    Run independent tests concurrently, each one provisioning its own test environment.
+    Tests start in the given order, as soon as a concurrency slot is free and their VMs fit
+    in the provider quotas. Each test logs to its own <log_dir>/<test>.log file.
+    """
+    def __init__(self, concurrency=1, quotas=None, log_dir=None, reclaim=None):
+        """
+        :param concurrency: max number of tests running at the same time
+        :param quotas: per provider quotas, see QuotaPool
+        :param log_dir: folder for the per test log files, no per test logs if not set
+        :param reclaim: function() freeing idle resources when the quotas run short, e.g.
+                        EnvironmentPool.evict
+        """
+        self.concurrency = max(1, concurrency)
+        self.quotas = QuotaPool(quotas or {}, reclaim=reclaim)
+        self.log_dir = log_dir
+        self.slots = threading.BoundedSemaphore(self.concurrency)
+        if log_dir and not os.path.isdir(log_dir):
+            os.makedirs(log_dir)
+
+    def _run_test(self, test_name, test_func, test_args, reservation, results):
+        handler = None
+        if self.log_dir:
+            handler = logging.FileHandler(os.path.join(self.log_dir, '{}.log'.format(test_name)))
+            handler.setFormatter(logging.Formatter(constants.LOG_FORMAT,
+                                                   datefmt=constants.LOG_DATE_FORMAT))
+            handler.addFilter(ThreadLogFilter(test_name))
+            logging.getLogger().addHandler(handler)
+        start = time.time()
+        junit_testcase = TestCase(test_name)
+        try:
+            log.info('Running test: {}'.format(test_name))
+            journal.set_test(test_name)
+            _current.reservation = reservation
+            test_func(**test_args)
+        except Exception as e:
+            log.exception(e)
+            # the state is kept, so that resuming the run picks up from where the test failed
+            journal.record(error=str(e))
+            junit_testcase.add_failure_info(e)
+        finally:
+            journal.set_test(None)
+            _current.reservation = None
+            junit_testcase.elapsed_sec = time.time() - start
+            results[test_name] = junit_testcase
+            if handler:
+                logging.getLogger().removeHandler(handler)
+                handler.close()
+            # no-op if transferred to a pooled environment
+            reservation.release()
+            self.slots.release()
+
+    def run(self, tests, test_args, instance_cores=0):
+        """
+        Run the tests.
+        :param tests: ordered list of (test name, test function) pairs
+        :param test_args: <dict> arguments passed to every test
+        :param instance_cores: cores of the test instance type, for the cores quota
+        :return: list of junit TestCase, in the tests order
+        """
+        provider = test_args.get('provider', None)
+        results = {}
+        threads = []
+        for test_name, test_func in tests:
+            vm_count = get_vm_count(test_func)
+            demand = {'public_ips': vm_count}
+            if instance_cores:
+                demand['cores'] = vm_count * instance_cores
+            try:
+                self.quotas.check(provider, demand)
+            except Exception as e:
+                log.error('Skipping test {}: {}'.format(test_name, e))
+                results[test_name] = TestCase(test_name)
+                results[test_name].add_skipped_info(str(e))
+                continue
+            self.slots.acquire()
+            self.quotas.acquire(provider, demand)
+            reservation = Reservation(self.quotas, provider, demand)
+            thread = threading.Thread(target=self._run_test, name=test_name,
+                                      args=(test_name, test_func, dict(test_args), reservation,
+                                            results))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return [results[test_name] for test_name, _ in tests]
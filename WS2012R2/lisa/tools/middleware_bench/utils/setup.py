@@ -25,13 +25,11 @@ import time
 import logging
 
 from utils import constants
-from utils.cmdshell import SSHClient
-from report.db_utils import upload_results
-from paramiko.ssh_exception import NoValidConnectionsError
-
-from providers.amazon_service import AWSConnector
-from providers.azure_service import AzureConnector
-from providers.gcp_service import GCPConnector
+from utils import journal
+from utils.tracing import span, trace_methods
+from utils.parallel import run_parallel, FanOut
+from utils.scheduler import current_reservation
+from utils.cmdshell import SSHClient, wait_for_ssh
 
 logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
                     datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
@@ -42,6 +40,9 @@ class SetupTestEnv:
     """
     Setup test environment.
     """
+    # <EnvironmentPool> shared by the tests to reuse environments, see runner --reuseenv
+    pool = None
+
     def __init__(self, provider=None, vm_count=None, test_type=None, disk_size=None, raid=None,
                  keyid=None, secret=None, token=None, subscriptionid=None, tenantid=None,
                  projectid=None, imageid=None, instancetype=None, user=None, localpath=None,
@@ -100,43 +101,128 @@ class SetupTestEnv:
         self.zone = zone
         self.sriov = sriov
         self.kernel = kernel
+        self.connector = None
+        self.pool_key = (provider, instancetype, imageid, vm_count, test_type, disk_size, raid,
+                         sriov, kernel, region, zone)
 
+        journal.record(journal.PROVISIONING)
+        self.environment = self.pool.lease(self.pool_key) if self.pool else None
+        if self.environment:
+            self.use_environment(self.environment)
+            return
         # create and generate setup details
         try:
-            self.connector = self.create_connector()
-            self.vms = self.create_instances()
-            self.device = self.get_disk_devices()
-            self.ssh_client, self.vm_ips = self.get_instance_details()
-            self.perf_tuning()
-            self.reconnect_sshclient()
+            with span('provision', provider=provider, vm_count=vm_count):
+                with span('create_connector'):
+                    self.connector = self.create_connector()
+                with span('create_instances'):
+                    self.vms = self.create_instances()
+                with span('attach_disks'):
+                    self.device = self.get_disk_devices()
+                with span('instance_details'):
+                    self.ssh_client, self.vm_ips = self.get_instance_details()
+                with span('perf_tuning'):
+                    self.perf_tuning()
+                self.reconnect_sshclient()
         except Exception as e:
             log.exception(e)
             if self.connector:
                 self.connector.teardown()
             raise
+        self.environment = {'provider': self.provider, 'connector': self.connector,
+                            'vms': self.vms, 'device': self.device,
+                            'ssh_client': self.ssh_client, 'vm_ips': self.vm_ips}
+        if self.pool:
+            self.pool.add(self.pool_key, self.environment)
+
+    def use_environment(self, environment):
+        """
+        Use a provisioned environment leased from the pool.
+        :param environment: <dict> provider, connector, vms, device, ssh_client and vm_ips
+        """
+        for name, value in environment.items():
+            setattr(self, name, value)
+        run_parallel(lambda i: self.ssh_client[i].connect(), xrange(1, self.vm_count + 1),
+                     name='connect')
+
+    @staticmethod
+    def reset_environment(environment):
+        """
+        Pool reset hook, cleaning up the VMs for the next test. The local provider hosts are
+        not reset, they are not disposable: the reset script wipes /tmp and the user SSH key.
+        """
+        if environment['provider'] == constants.LOCAL:
+            log.info('Skipping environment reset on the local provider hosts')
+            return
+        current_path = os.path.dirname(sys.modules['__main__'].__file__)
+        devices = environment['device'] if type(environment['device']) is list else []
+        clients = environment['ssh_client']
+        reset_script = (os.path.join(current_path, 'tests', 'reset_env.sh'), '/tmp/reset_env.sh',
+                        0755)
+        run_parallel(lambda i: clients[i].stage([reset_script]), clients.keys(), name='stage')
+        FanOut(clients).run('/tmp/reset_env.sh {}'.format(' '.join(devices)), name='reset_env')
+
+    @staticmethod
+    def teardown_environment(environment):
+        """
+        Pool teardown hook.
+        """
+        if environment['connector']:
+            environment['connector'].teardown()
+
+    def release(self, healthy=True):
+        """
+        Release the test environment: returned to the pool if reusing environments, else
+        torn down.
+        :param healthy: False if the environment may be unusable e.g. after a test failure
+        """
+        if self.pool and self.environment:
+            self.pool.release(self.environment, healthy=healthy,
+                              reservation=current_reservation())
+        elif self.connector:
+            self.connector.teardown()
+
+    def teardown(self):
+        """
+        Tear down the test environment, even when reusing environments.
+        """
+        if self.pool and self.environment:
+            self.pool.discard(self.environment)
+        if self.connector:
+            self.connector.teardown()
 
     def create_connector(self):
         """
         Create connector by provider.
         :return: connector
         """
+        # provider SDKs are imported only for the provider used
         connector = None
         if self.provider == constants.AWS:
+            from providers.amazon_service import AWSConnector
             connector = AWSConnector(keyid=self.keyid, secret=self.secret, imageid=self.imageid,
                                      instancetype=self.instancetype, user=self.user,
                                      localpath=self.localpath, region=self.region, zone=self.zone)
         elif self.provider == constants.AZURE:
+            from providers.azure_service import AzureConnector
             connector = AzureConnector(clientid=self.keyid, secret=self.secret,
                                        subscriptionid=self.subscriptionid, tenantid=self.tenantid,
                                        imageid=self.imageid, instancetype=self.instancetype,
                                        user=self.user, localpath=self.localpath,
                                        location=self.region, sriov=self.sriov)
         elif self.provider == constants.GCE:
+            from providers.gcp_service import GCPConnector
             connector = GCPConnector(clientid=self.keyid, secret=self.secret, token=self.token,
                                      projectid=self.projectid, imageid=self.imageid,
                                      instancetype=self.instancetype, user=self.user,
                                      localpath=self.localpath, zone=self.zone)
+        elif self.provider == constants.LOCAL:
+            from providers.local_service import LocalConnector
+            connector = LocalConnector(hosts=self.region, user=self.user,
+                                       localpath=self.localpath)
         if connector:
+            trace_methods(connector, ['connect', 'create_vm', 'attach_disk', 'attach_disks',
+                                      'wait_for_ping', 'restart_vm', 'teardown'], self.provider)
             connector.connect()
             return connector
         else:
@@ -144,63 +230,87 @@ class SetupTestEnv:
 
     def create_instances(self):
         """
-        Create instances.
+        Create the instances concurrently.
         :return: VM instances
         """
         open(self.connector.host_key_file, 'w').close()
-        vms = {}
-        for i in xrange(1, self.vm_count + 1):
-            vms[i] = self.connector.create_vm()
-        return vms
+        return run_parallel(lambda i: self.connector.create_vm(), xrange(1, self.vm_count + 1),
+                            name='create_vm')
 
     def reconnect_sshclient(self):
         if self.provider == constants.AWS:
             log.info('The provider is AWS, reconnect sshclient')
-            for i in xrange(1, self.vm_count + 1):
-                self.ssh_client[i].connect()
+            run_parallel(lambda i: self.ssh_client[i].connect(), xrange(1, self.vm_count + 1),
+                         name='connect')
 
     def get_instance_details(self):
         """
-        Create ssh client and get vm IPs
+        Create ssh client and get vm IPs, waiting for all the VMs concurrently.
         :return: ssh_client, vm_ips
         """
-        ssh_client = {}
-        vm_ips = {}
-        for i in xrange(1, self.vm_count + 1):
-            if self.provider == constants.AWS:
-                ssh_client[i] = self.connector.wait_for_ping(self.vms[i])
-                # SRIOV is enabled by default on AWS for the tested platforms
-                # if sriov == constants.ENABLED:
-                #     ssh_client[i] = connector.enable_sr_iov(vms[i], ssh_client[i])
-                self.vms[i].update()
-                vm_ips[i] = self.vms[i].private_ip_address
-            elif self.provider == constants.AZURE:
-                ssh_client[i] = SSHClient(server=self.vms[i].name + self.connector.dns_suffix,
-                                          host_key_file=self.connector.host_key_file,
-                                          user=self.connector.user,
-                                          ssh_key_file=os.path.join(
-                                                  self.connector.localpath,
-                                                  self.connector.key_name + '.pem'))
-                ip = ssh_client[i].run(
-                        'ifconfig eth0 | grep "inet\ addr" | cut -d: -f2 | cut -d" " -f1')
-                vm_ips[i] = ip[1].strip()
-            elif self.provider == constants.GCE:
-                ssh_client[i] = self.connector.wait_for_ping(self.vms[i])
-                vm_ips[i] = self.vms[i]['networkInterfaces'][0]['networkIP']
+        details = run_parallel(self.get_vm_details, xrange(1, self.vm_count + 1), name='vm')
+        ssh_client = dict((i, client) for i, (client, _) in details.items())
+        vm_ips = dict((i, ip) for i, (_, ip) in details.items())
         return ssh_client, vm_ips
 
+    def get_vm_details(self, i):
+        """
+        Wait for a VM SSH service and get its private IP.
+        :param i: VM tag
+        :return: ssh_client, vm_ip
+        """
+        ssh_client = None
+        vm_ip = None
+        if self.provider == constants.AWS:
+            ssh_client = self.connector.wait_for_ping(self.vms[i])
+            # SRIOV is enabled by default on AWS for the tested platforms
+            # if sriov == constants.ENABLED:
+            #     ssh_client = connector.enable_sr_iov(vms[i], ssh_client)
+            self.vms[i].update()
+            vm_ip = self.vms[i].private_ip_address
+        elif self.provider == constants.AZURE:
+            wait_for_ssh(self.vms[i].name + self.connector.dns_suffix)
+            ssh_client = SSHClient(server=self.vms[i].name + self.connector.dns_suffix,
+                                   host_key_file=self.connector.host_key_file,
+                                   user=self.connector.user,
+                                   ssh_key_file=os.path.join(self.connector.localpath,
+                                                             self.connector.key_name + '.pem'))
+            ip = ssh_client.run('ifconfig eth0 | grep "inet\ addr" | cut -d: -f2 | cut -d" " -f1')
+            vm_ip = ip[1].strip()
+        elif self.provider == constants.GCE:
+            ssh_client = self.connector.wait_for_ping(self.vms[i])
+            vm_ip = self.vms[i]['networkInterfaces'][0]['networkIP']
+        elif self.provider == constants.LOCAL:
+            ssh_client = self.connector.wait_for_ping(self.vms[i])
+            vm_ip = self.vms[i]['ip']
+        return ssh_client, vm_ip
+
     def attach_raid_disks(self, vm_tag, disk_args):
+        """
+        Attach the RAID disks to a VM with a single batched connector call.
+        :param vm_tag: VM tag
+        :param disk_args: provider specific attach_disk arguments
+        :return: RAID device paths
+        """
         device = []
+        devices = []
+        disk_args = dict((k, v) for k, v in disk_args.items() if k != 'device')
         for i in xrange(self.raid):
             if self.provider == constants.AWS:
-                disk_args['device'] = '/dev/sd{}'.format(chr(120 - i))
-                device.append(disk_args['device'].replace('sd', 'xvd'))
+                devices.append('/dev/sd{}'.format(chr(120 - i)))
+                device.append(devices[-1].replace('sd', 'xvd'))
             elif self.provider == constants.AZURE:
-                disk_args['device'] = i
+                devices.append(i)
                 device.append('/dev/sd{}'.format(chr(99 + i)))
             elif self.provider == constants.GCE:
+                devices.append(None)
                 device.append('/dev/sd{}'.format(chr(98 + i)))
-            self.connector.attach_disk(self.vms[vm_tag], disk_size=self.disk_size, **disk_args)
+            else:
+                devices.append(None)
+        disks = self.connector.attach_disks(self.vms[vm_tag], disk_size=self.disk_size,
+                                            devices=devices, **disk_args)
+        if self.provider == constants.LOCAL:
+            device = disks
         return device
 
     def get_disk_devices(self):
@@ -221,10 +331,15 @@ class SetupTestEnv:
             device = constants.TEMP_DEVICE_GCE
 
         if self.test_type == constants.CLUSTER_DISK:
-            self.connector.attach_disk(self.vms[1], disk_size=self.disk_size + 200, **disk_args)
-            for i in xrange(2, self.vm_count + 1):
-                self.connector.attach_disk(self.vms[i], disk_size=self.disk_size, **disk_args)
-                time.sleep(3)
+            # the first VM gets a larger disk
+            disks = run_parallel(
+                    lambda i: self.connector.attach_disk(
+                            self.vms[i], disk_size=self.disk_size + (200 if i == 1 else 0),
+                            **disk_args),
+                    xrange(1, self.vm_count + 1), name='attach_disk')
+            if self.provider == constants.LOCAL:
+                # local loop devices are allocated by the host, not predictable
+                device = disks[1]
             return device
 
         vm_tag = None
@@ -236,132 +351,213 @@ class SetupTestEnv:
         if self.raid and type(self.raid) is int:
             return self.attach_raid_disks(vm_tag, disk_args)
         else:
-            self.connector.attach_disk(self.vms[vm_tag], disk_size=self.disk_size, **disk_args)
+            disk = self.connector.attach_disk(self.vms[vm_tag], disk_size=self.disk_size,
+                                              **disk_args)
+            if self.provider == constants.LOCAL:
+                device = disk
 
         return device
 
     def perf_tuning(self):
-        current_path = os.path.dirname(sys.modules['__main__'].__file__)
-        for i in range(1, self.vm_count + 1):
-            log.info('Running perf tuning on {}'.format(self.vm_ips[i]))
+        """
+        Run perf tuning, and the optional kernel install, on all the VMs concurrently.
+        Each VM status is logged once all are done.
+        """
+        if self.provider == constants.LOCAL:
+            log.info('Skipping perf tuning and kernel install on the local provider hosts')
+            return
+        kernel = None
+        if '.deb' in self.kernel:
+            kernel = self.share_kernel()
+        status = {}
+
+        def tune(i):
+            start = time.time()
+            status[i] = 'failed'
+            with span('perf_tuning.vm', vm=i):
+                self.tune_vm(i, kernel)
+            status[i] = 'tuned in {:.0f}s'.format(time.time() - start)
+
+        try:
+            run_parallel(tune, xrange(1, self.vm_count + 1), name='perf_tuning',
+                         max_workers=constants.PERF_TUNING_WORKERS)
+        finally:
+            log.info('Perf tuning status: {}'.format(', '.join(
+                    '{} {}'.format(self.vm_ips[i], status.get(i, 'not started'))
+                    for i in sorted(self.vm_ips))))
+
+    def share_kernel(self):
+        """
+        Upload the kernel package once, to the first VM, and copy it from there to the other
+        VMs over the private network. VMs failing to fetch it get it uploaded directly.
+        :return: kernel package path on the VMs
+        """
+        kernel = '/tmp/{}'.format(self.kernel)
+        log.info('Uploading kernel {} on {}'.format(self.kernel, self.vm_ips[1]))
+        self.ssh_client[1].connect()
+        self.ssh_client[1].put_file(os.path.join(self.localpath, self.kernel), kernel)
+        if self.vm_count == 1:
+            return kernel
+        share_dir = '/tmp/kernel_share'
+        _, pid, _ = self.ssh_client[1].run(
+                'mkdir -p {dir} && ln -sf {kernel} {dir}/ && cd {dir} || exit 1; '
+                '(python3 -m http.server {port} || python -m SimpleHTTPServer {port}) '
+                '> /dev/null 2>&1 < /dev/null & echo $!'.format(
+                        dir=share_dir, kernel=kernel, port=constants.KERNEL_SHARE_PORT))
+
+        def fetch(i):
             self.ssh_client[i].connect()
-            self.ssh_client[i].put_file(os.path.join(current_path, 'tests', 'perf_tuning.sh'),
-                                        '/tmp/perf_tuning.sh')
-            self.ssh_client[i].run('chmod +x /tmp/perf_tuning.sh')
-            self.ssh_client[i].run("sed -i 's/\r//' /tmp/perf_tuning.sh")
-            params = [self.provider]
-            if '.deb' in self.kernel:
+            with self.ssh_client[i].stream(
+                    'for i in $(seq 10); do wget -q -O {kernel} http://{ip}:{port}/{name} && '
+                    'exit 0; sleep 1; done; rm -f {kernel}; exit 1'.format(
+                            kernel=kernel, ip=self.vm_ips[1], port=constants.KERNEL_SHARE_PORT,
+                            name=self.kernel)) as command:
+                exit_code = command.wait()
+            if exit_code != 0:
                 log.info('Uploading kernel {} on {}'.format(self.kernel, self.vm_ips[i]))
-                self.ssh_client[i].put_file(os.path.join(self.localpath, self.kernel),
-                                            '/tmp/{}'.format(self.kernel))
-                params.append('/tmp/{}'.format(self.kernel))
-            self.ssh_client[i].run('/tmp/perf_tuning.sh {}'.format(' '.join(params)))
-            if self.provider in [constants.AWS, constants.GCE]:
-                self.ssh_client[i] = self.connector.restart_vm(self.vms[i])
-            elif self.provider == constants.AZURE:
-                self.vms[i] = self.connector.restart_vm(self.vms[i].name)
-                # TODO add custom kernel support for all providers - only azure support
-                self.ssh_client[i] = SSHClient(server=self.vms[i].name + self.connector.dns_suffix,
-                                               host_key_file=self.connector.host_key_file,
-                                               user=self.connector.user,
-                                               ssh_key_file=os.path.join(
-                                                       self.connector.localpath,
-                                                       self.connector.key_name + '.pem'))
-                ip = self.ssh_client[i].run(
-                        'ifconfig eth0 | grep "inet\ addr" | cut -d: -f2 | cut -d" " -f1')
-                self.vm_ips[i] = ip[1].strip()
+                self.ssh_client[i].run('rm -f {}'.format(kernel))
+                self.ssh_client[i].put_file(os.path.join(self.localpath, self.kernel), kernel)
+
+        try:
+            run_parallel(fetch, xrange(2, self.vm_count + 1), name='share_kernel',
+                         max_workers=constants.PERF_TUNING_WORKERS)
+        finally:
+            self.ssh_client[1].run('pkill -P {pid}; kill {pid}; rm -rf {dir}'.format(
+                    pid=pid.strip(), dir=share_dir))
+        return kernel
+
+    def tune_vm(self, i, kernel=None):
+        """
+        Run perf tuning on a VM, install the kernel package if any and restart it.
+        :param i: VM tag
+        :param kernel: kernel package path on the VM
+        """
+        current_path = os.path.dirname(sys.modules['__main__'].__file__)
+        log.info('Running perf tuning on {}'.format(self.vm_ips[i]))
+        self.ssh_client[i].connect()
+        self.ssh_client[i].stage([(os.path.join(current_path, 'tests', 'perf_tuning.sh'),
+                                   '/tmp/perf_tuning.sh', 0755)])
+        params = [self.provider]
+        if kernel:
+            params.append(kernel)
+        self.ssh_client[i].run('/tmp/perf_tuning.sh {}'.format(' '.join(params)))
+        # the restart may return before the VM went down, the boot id tells the boots apart
+        boot_id = self.ssh_client[i].boot_id()
+        if self.provider in [constants.AWS, constants.GCE]:
+            self.ssh_client[i] = self.connector.restart_vm(self.vms[i])
+            self.ssh_client[i].wait_for_reboot(boot_id)
+        elif self.provider == constants.AZURE:
+            self.vms[i] = self.connector.restart_vm(self.vms[i].name)
+            # TODO add custom kernel support for all providers - only azure support
+            self.ssh_client[i] = SSHClient(server=self.vms[i].name + self.connector.dns_suffix,
+                                           host_key_file=self.connector.host_key_file,
+                                           user=self.connector.user,
+                                           ssh_key_file=os.path.join(
+                                                   self.connector.localpath,
+                                                   self.connector.key_name + '.pem'))
+            self.ssh_client[i].wait_for_reboot(boot_id)
+            ip = self.ssh_client[i].run(
+                    'ifconfig eth0 | grep "inet\ addr" | cut -d: -f2 | cut -d" " -f1')
+            self.vm_ips[i] = ip[1].strip()
+
+    def key_artifact(self):
+        """
+        SSH key staged on the VMs to enable key auth between them.
+        :return: (local path, remote path, mode)
+        """
+        return (os.path.join(self.localpath, self.connector.key_name + '.pem'),
+                '/home/{}/.ssh/id_rsa'.format(self.user), 0600)
 
     def run_test(self, ssh_vm_conf=0, testname=None, test_cmd=None, results_path=None, raid=False,
-                 ssh_raid=1, timeout=constants.TIMEOUT):
+                 ssh_raid=1, timeout=constants.TIMEOUT, artifacts=None, idle_timeout=None):
+        """
+        Stage the test artifacts, run the test script on the first VM and download its results.
+        The test output is written as it arrives next to the results, to <results>.console.log.
+        :param artifacts: other (local path, remote path, mode) files the test needs on the
+                          first VM, staged along with the test script
+        :param idle_timeout: seconds without test output after which the test is failed, None
+                             to wait for timeout
+        """
         try:
             if all(client is not None for client in self.ssh_client.values()):
+                journal.record(journal.RUNNING)
                 current_path = os.path.dirname(sys.modules['__main__'].__file__)
+                if self.provider == constants.LOCAL:
+                    # the local hosts keep their own user keys
+                    ssh_vm_conf = 0
+                bash_testname = 'run_{}.sh'.format(testname)
+                staged = {1: [(os.path.join(current_path, 'tests', bash_testname),
+                               '/tmp/{}'.format(bash_testname), 0755)] + (artifacts or [])}
                 # enable key auth between instances
                 for i in xrange(1, ssh_vm_conf + 1):
-                    self.ssh_client[i].put_file(os.path.join(self.localpath,
-                                                             self.connector.key_name + '.pem'),
-                                                '/home/{}/.ssh/id_rsa'.format(self.user))
-                    self.ssh_client[i].run('chmod 0600 /home/{0}/.ssh/id_rsa'.format(self.user))
+                    staged.setdefault(i, []).append(self.key_artifact())
+                if raid:
+                    staged.setdefault(ssh_raid, []).append(
+                            (os.path.join(current_path, 'tests', 'raid.sh'), '/tmp/raid.sh', 0755))
+                run_parallel(lambda i: self.ssh_client[i].stage(staged[i]), staged.keys(),
+                             name='stage')
                 if raid:
-                    self.ssh_client[ssh_raid].put_file(os.path.join(
-                            current_path, 'tests', 'raid.sh'), '/tmp/raid.sh')
-                    self.ssh_client[ssh_raid].run('chmod +x /tmp/raid.sh')
-                    self.ssh_client[ssh_raid].run("sed -i 's/\r//' /tmp/raid.sh")
                     self.ssh_client[ssh_raid].run('/tmp/raid.sh 0 {} {}'.format(raid, ' '.join(
                             self.device)))
-                bash_testname = 'run_{}.sh'.format(testname)
-                self.ssh_client[1].put_file(os.path.join(current_path, 'tests', bash_testname),
-                                            '/tmp/{}'.format(bash_testname))
-                self.ssh_client[1].run('chmod +x /tmp/{}'.format(bash_testname))
-                self.ssh_client[1].run("sed -i 's/\r//' /tmp/{}".format(bash_testname))
                 log.info('Starting background command {}'.format(test_cmd))
-                channel = self.ssh_client[1].run_pty(test_cmd)
-                _, pid, _ = self.ssh_client[1].run(
-                        "ps aux | grep -v grep | grep {} | awk '{{print $2}}'".format(
-                                bash_testname))
-                self._wait_for_pid(self.ssh_client[1], bash_testname, pid, timeout=timeout)
-                channel.close()
-                self.ssh_client[1].get_file('/tmp/{}.zip'.format(testname), results_path)
+                with span('benchmark', testname=testname):
+                    self._wait_for_test(
+                            self.ssh_client[1], test_cmd, bash_testname, timeout=timeout,
+                            log_path=results_path and '{}.console.log'.format(
+                                    os.path.splitext(results_path)[0]),
+                            idle_timeout=idle_timeout)
+                with span('download', results_path=results_path):
+                    self.ssh_client[1].download('/tmp/{}.zip'.format(testname), results_path)
+                journal.record(journal.DOWNLOADED, results_path=results_path)
         except Exception as e:
             log.exception(e)
+            healthy = False
             raise
+        else:
+            healthy = True
         finally:
-            if self.connector:
-                self.connector.teardown()
+            with span('release'):
+                self.release(healthy=healthy)
 
     @staticmethod
-    def _wait_for_pid(ssh_client, bash_testname, pid, timeout=constants.TIMEOUT):
-        t = 0
-        while t < timeout:
-            try:
-                _, new_pid, _ = ssh_client.run(
-                        "ps aux | grep -v grep | grep {} | awk '{{print $2}}'".format(
-                                bash_testname))
-                if new_pid != pid:
-                    return
-            except NoValidConnectionsError:
-                log.debug('NoValidConnectionsError, will retry in 60 seconds')
-                time.sleep(60)
-                t += 60
-            time.sleep(60)
-            t += 60
-        else:
-            raise Exception('Timeout waiting for process to end.'.format(timeout))
+    def _wait_for_test(ssh_client, test_cmd, bash_testname, timeout=constants.TIMEOUT,
+                       log_path=None, idle_timeout=None):
+        """
+        Run the test command and wait for it to exit, from the SSH channel exit status.
+        If the connection is lost meanwhile, wait for the test script process instead.
+        :param log_path: optional local file the test output is written to as it arrives
+        :param idle_timeout: seconds without test output after which the test is failed
+        """
+        start = time.time()
+        if log_path:
+            log.info('Writing the test output to {}'.format(log_path))
+        with ssh_client.stream(test_cmd, log_path=log_path, idle_timeout=idle_timeout,
+                               timeout=timeout, pty=True) as command:
+            exit_status = command.wait()
+        if exit_status is None:
+            log.info('Lost the test command channel, waiting for {}'.format(bash_testname))
+            ssh_client.connect()
+            ssh_client.wait_for_process(bash_testname,
+                                        timeout=max(timeout - (time.time() - start), 0))
+        elif exit_status:
+            log.info('Test command exited with status {}, last output:\n{}'.format(
+                    exit_status, '\n'.join(command.output.splitlines()[-20:])))
 
     def run_test_nohup(self, ssh_vm_conf=0, test_cmd=None, timeout=constants.TIMEOUT, track=None):
         try:
             if all(client is not None for client in self.ssh_client.values()):
                 current_path = os.path.dirname(sys.modules['__main__'].__file__)
+                if self.provider == constants.LOCAL:
+                    # the local hosts keep their own user keys
+                    ssh_vm_conf = 0
                 # enable key auth between instances
-                for i in xrange(1, ssh_vm_conf + 1):
-                    self.ssh_client[i].put_file(os.path.join(self.localpath,
-                                                             self.connector.key_name + '.pem'),
-                                                '/home/{}/.ssh/id_rsa'.format(self.user))
-                    self.ssh_client[i].run('chmod 0600 /home/{0}/.ssh/id_rsa'.format(self.user))
+                run_parallel(lambda i: self.ssh_client[i].stage([self.key_artifact()]),
+                             xrange(1, ssh_vm_conf + 1), name='stage')
                 log.info('Starting run nohup command {}'.format(test_cmd))
                 self.ssh_client[1].run(test_cmd)
-                self._wait_for_command(self.ssh_client[1], track, timeout=timeout)
+                self.ssh_client[1].wait_for_process(track, timeout=timeout)
         except Exception as e:
             log.exception(e)
             raise
         finally:
             log.info('Finish to run nohup command {}'.format(test_cmd))
-
-    @staticmethod
-    def _wait_for_command(ssh_client, track, timeout=constants.TIMEOUT):
-        t = 0
-        while t < timeout:
-            try:
-                _, p_count, _  = ssh_client.run(
-                        "ps aux | grep -v grep | grep {} | awk '{{print $2}}' | wc -l".format(
-                                track))
-                if int(p_count) == 0 :
-                    return
-            except NoValidConnectionsError:
-                log.debug('NoValidConnectionsError, will retry in 60 seconds')
-                time.sleep(60)
-                t += 60
-            time.sleep(60)
-            t += 60
-        else:
-            raise Exception('Timeout waiting for process to end.'.format(timeout))
\ No newline at end of file
@@ -39,6 +39,8 @@ def host_type(provider):
         return constants.MSAZURE
     elif provider == constants.GCE:
         return constants.KVM
+    elif provider == constants.LOCAL:
+        return constants.LOCALHOST
 
 
 def data_path(sriov):
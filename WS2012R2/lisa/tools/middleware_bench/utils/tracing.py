@@ -0,0 +1,132 @@
+"""
+Linux on Hyper-V and Azure Test Code, ver. 1.0.0
+Copyright (c) Microsoft Corporation
+
+All rights reserved
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+See the Apache Version 2.0 License for specific language governing
+permissions and limitations under the License.
+"""
+import os
+import json
+import time
+import logging
+import functools
+import threading
+
+from contextlib import contextmanager
+
+logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
+                    datefmt='%y/%m/%d %H:%M:%S', level=logging.INFO)
+log = logging.getLogger(__name__)
+
+
+class Tracer(object):
+    """
+    Collects the timing spans of a run. Spans are attributed to the thread they run on, the
+    scheduler naming each test thread after its test.
+    """
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.time()
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Time a block of code, nested in the enclosing span of the same thread.
+        :param name: span name e.g. 'create_instances'
+        :param args: span details shown in the trace e.g. vm=1
+        """
+        stack = self.local.__dict__.setdefault('stack', [])
+        stack.append(name)
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            stack.pop()
+            thread = threading.current_thread()
+            with self.lock:
+                self.spans.append({'name': name, 'start': start, 'duration': end - start,
+                                   'depth': len(stack), 'thread': thread.name,
+                                   'tid': thread.ident, 'args': args})
+
+    def summary(self, thread_name):
+        """
+        Total time per span name of a test thread.
+        :param thread_name: test thread name, i.e. the test name
+        :return: <dict> {span name: seconds}
+        """
+        totals = {}
+        with self.lock:
+            for span in self.spans:
+                if span['thread'] == thread_name:
+                    totals[span['name']] = totals.get(span['name'], 0) + span['duration']
+        return totals
+
+    def export(self, trace_path):
+        """
+        Export the spans as a Chrome trace event JSON, viewable in chrome://tracing.
+        :param trace_path: JSON file path
+        """
+        events = []
+        threads = {}
+        with self.lock:
+            for span in self.spans:
+                threads[span['tid']] = span['thread']
+                events.append({'name': span['name'], 'cat': span['name'].split('.')[0],
+                               'ph': 'X', 'pid': os.getpid(), 'tid': span['tid'],
+                               'ts': int((span['start'] - self.origin) * 1e6),
+                               'dur': int(span['duration'] * 1e6),
+                               'args': dict((k, str(v)) for k, v in span['args'].items())})
+        for tid, name in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                           'args': {'name': name}})
+        with open(trace_path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        log.info('Exported {} spans to {}'.format(len(events) - len(threads), trace_path))
+
+
+tracer = Tracer()
+span = tracer.span
+
+
+def traced(name):
+    """
+    Decorator timing each call of a function in a span.
+    :param name: span name
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_methods(obj, methods, prefix):
+    """
+    Time the calls of an object methods, e.g. of a provider connector.
+    :param obj: instance to instrument
+    :param methods: method names, the ones not defined by obj are skipped
+    :param prefix: span names prefix e.g. 'azure'
+    :return: obj
+    """
+    for method in methods:
+        if hasattr(obj, method):
+            setattr(obj, method, traced('{}.{}'.format(prefix, method))(getattr(obj, method)))
+    return obj